@@ -1,7 +1,7 @@
 from django.contrib import admin
 from import_export.admin import ImportExportModelAdmin
 
-from .models import ActionLog
+from .models import ActionLog, ExportJob
 from .resources import ActionLogResource
 
 
@@ -39,3 +39,20 @@ class ActionLogAdmin(ImportExportModelAdmin):
     def has_change_permission(self, request, obj=None):
         """Запретить изменение логов через админку"""
         return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """Админка для фоновых задач экспорта"""
+    
+    list_display = ('id', 'user', 'export_format', 'status', 'processed_rows', 'total_rows', 'created_at')
+    list_filter = ('status', 'export_format')
+    ordering = ('-created_at',)
+    readonly_fields = (
+        'id', 'user', 'export_format', 'filters', 'status', 'total_rows', 'processed_rows',
+        'file', 'error', 'created_at', 'started_at', 'completed_at'
+    )
+    
+    def has_add_permission(self, request):
+        """Задачи экспорта создаются только через интерфейс экспорта"""
+        return False
@@ -0,0 +1,450 @@
+"""
+Холодный архив журнала действий
+
+Логи старше заданного срока выгружаются из action_logs в сжатые сегменты
+на локальном диске (JSONL.gz, либо Parquet при установленном pyarrow)
+и удаляются из базы пачками. Сегменты раскладываются по месяцу и действию:
+
+    <ACTION_LOG_ARCHIVE_ROOT>/<ГГГГ>/<ММ>/<action>/<uuid>.jsonl.gz
+
+Список сегментов с количеством записей и диапазоном дат хранится
+в manifest.json в корне архива. Строки из базы удаляются только после того,
+как сегмент записан и внесен в манифест с отметкой pending; отметка
+снимается после удаления. Если процесс упал до снятия отметки, следующий
+запуск archive_logs сначала удаляет из базы строки pending-сегментов по id
+(reconcile_pending), поэтому они не архивируются повторно. Записи пишутся
+в сегмент потоково, в памяти держатся только их id. Архивные логи читаются напрямую
+из сегментов (iter_archived_logs), без восстановления в PostgreSQL, -
+так их подмешивает экспорт логов с параметром archive=1.
+
+Суточная сводка (ActionLogDailyStat) архивом не затрагивается, поэтому
+статистика продолжает учитывать архивные логи.
+"""
+import gzip
+import heapq
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ActionLog
+from .partitions import add_months, month_bounds, month_start
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = ('jsonl', 'parquet')
+
+ARCHIVE_ROOT = getattr(settings, 'ACTION_LOG_ARCHIVE_ROOT', os.path.join(settings.BASE_DIR, 'archive', 'action_logs'))
+ARCHIVE_FORMAT = getattr(settings, 'ACTION_LOG_ARCHIVE_FORMAT', 'jsonl')
+# Максимальное количество записей в одном сегменте
+SEGMENT_ROWS = getattr(settings, 'ACTION_LOG_ARCHIVE_SEGMENT_ROWS', 100000)
+# Размер порции чтения и удаления логов
+BATCH_SIZE = getattr(settings, 'ACTION_LOG_ARCHIVE_BATCH_SIZE', 5000)
+
+MANIFEST_NAME = 'manifest.json'
+EXTENSIONS = {'jsonl': '.jsonl.gz', 'parquet': '.parquet'}
+
+
+def log_record(log):
+    """
+    Запись архива для лога
+
+    Данные пользователя сохраняются вместе с логом, чтобы архив
+    оставался читаемым после удаления пользователя.
+    """
+    return {
+        'id': str(log.pk),
+        'created_at': log.created_at.isoformat(),
+        'user_id': str(log.user_id),
+        'user_name': log.user.get_full_name(),
+        'user_email': log.user.email or '',
+        'user_role': log.user.role,
+        'kingdom_id': str(log.kingdom_id) if log.kingdom_id else None,
+        'action': log.action,
+        'description': log.description,
+        'metadata': log.metadata,
+        'ip_address': log.ip_address,
+        'user_agent': log.user_agent,
+    }
+
+
+def _check_format(archive_format):
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f'Неподдерживаемый формат архива: {archive_format}')
+    if archive_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError('Для формата parquet требуется пакет pyarrow')
+
+
+def load_manifest(root=None):
+    """Манифест архива: {'segments': [...]}"""
+    path = os.path.join(root or ARCHIVE_ROOT, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'segments': []}
+    with open(path, encoding='utf-8') as manifest:
+        return json.load(manifest)
+
+
+def _save_manifest(root, manifest):
+    """Запись манифеста через временный файл"""
+    path = os.path.join(root, MANIFEST_NAME)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as output:
+        json.dump(manifest, output, ensure_ascii=False, indent=2)
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(tmp_path, path)
+
+
+def _add_to_manifest(root, segment):
+    """Добавление сегмента в манифест"""
+    manifest = load_manifest(root)
+    manifest['segments'].append(segment)
+    _save_manifest(root, manifest)
+
+
+def _complete_segment(root, relative):
+    """Снятие отметки pending с сегмента после удаления его строк из базы"""
+    manifest = load_manifest(root)
+    for segment in manifest['segments']:
+        if segment['path'] == relative:
+            segment.pop('pending', None)
+    _save_manifest(root, manifest)
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([(name, pa.string()) for name in (
+        'id', 'created_at', 'user_id', 'user_name', 'user_email', 'user_role',
+        'kingdom_id', 'action', 'description', 'metadata', 'ip_address', 'user_agent',
+    )])
+
+
+class _JsonlSegment:
+    """Потоковая запись сегмента JSONL.gz через временный файл"""
+
+    def __init__(self, path, batch_size):
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+        self.output = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+
+    def write(self, record):
+        self.output.write(json.dumps(record, ensure_ascii=False))
+        self.output.write('\n')
+
+    def close(self):
+        self.output.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class _ParquetSegment:
+    """Потоковая запись сегмента Parquet группами строк по batch_size"""
+
+    def __init__(self, path, batch_size):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+        self.batch_size = batch_size
+        self.schema = _parquet_schema()
+        self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression='zstd')
+        self.batch = []
+
+    def write(self, record):
+        self.batch.append({**record, 'metadata': json.dumps(record['metadata'], ensure_ascii=False)})
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+
+        if self.batch:
+            self.writer.write_table(pa.Table.from_pylist(self.batch, schema=self.schema))
+            self.batch = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+SEGMENT_CLASSES = {'jsonl': _JsonlSegment, 'parquet': _ParquetSegment}
+
+
+def _read_segment(path, archive_format):
+    """Записи сегмента в порядке записи (от новых к старым)"""
+    if archive_format == 'parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=BATCH_SIZE):
+            for record in batch.to_pylist():
+                record['metadata'] = json.loads(record['metadata']) if record['metadata'] else {}
+                yield record
+    else:
+        with gzip.open(path, 'rt', encoding='utf-8') as segment:
+            for line in segment:
+                yield json.loads(line)
+
+
+def _delete_archived(ids, batch_size):
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            ActionLog.objects.filter(id__in=ids[start:start + batch_size]).delete()
+
+
+class _SegmentWriter:
+    """Запись логов одного месяца и действия в сегменты по SEGMENT_ROWS записей"""
+
+    def __init__(self, root, month, action, archive_format, segment_rows, batch_size):
+        self.root = root
+        self.month = month
+        self.action = action
+        self.archive_format = archive_format
+        self.segment_rows = segment_rows
+        self.batch_size = batch_size
+        self.segment = None
+        self.relative = None
+        self.ids = []
+        self.first_created_at = None
+        self.last_created_at = None
+        self.segments = 0
+        self.rows = 0
+
+    def _open(self):
+        self.relative = os.path.join(
+            f'{self.month:%Y}', f'{self.month:%m}', self.action,
+            f'{uuid.uuid4().hex}{EXTENSIONS[self.archive_format]}'
+        )
+        path = os.path.join(self.root, self.relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.segment = SEGMENT_CLASSES[self.archive_format](path, self.batch_size)
+
+    def add(self, log):
+        record = log_record(log)
+        if self.segment is None:
+            self._open()
+            # Записи в сегменте идут от новых к старым
+            self.last_created_at = record['created_at']
+        self.segment.write(record)
+        self.first_created_at = record['created_at']
+        self.ids.append(log.pk)
+        if len(self.ids) >= self.segment_rows:
+            self.close()
+
+    def close(self):
+        """Завершение сегмента, внесение в манифест и удаление строк из базы"""
+        if self.segment is None:
+            return
+        self.segment.close()
+
+        _add_to_manifest(self.root, {
+            'path': self.relative,
+            'format': self.archive_format,
+            'month': f'{self.month:%Y-%m}',
+            'action': self.action,
+            'rows': len(self.ids),
+            'first_created_at': self.first_created_at,
+            'last_created_at': self.last_created_at,
+            'archived_at': timezone.now().isoformat(),
+            'pending': True,
+        })
+        _delete_archived(self.ids, self.batch_size)
+        _complete_segment(self.root, self.relative)
+
+        self.segments += 1
+        self.rows += len(self.ids)
+        self.segment = None
+        self.ids = []
+
+
+def reconcile_pending(root=None, batch_size=None):
+    """
+    Завершение сегментов, внесенных в манифест, но не удаленных из базы
+
+    Строки pending-сегмента уже лежат в архиве, поэтому они удаляются
+    из базы по id сегмента, а не архивируются повторно.
+
+    Returns:
+        Количество завершенных сегментов
+    """
+    root = root or ARCHIVE_ROOT
+    pending = [segment for segment in load_manifest(root)['segments'] if segment.get('pending')]
+    for segment in pending:
+        ids = [
+            record['id']
+            for record in _read_segment(os.path.join(root, segment['path']), segment['format'])
+        ]
+        _delete_archived(ids, batch_size or BATCH_SIZE)
+        _complete_segment(root, segment['path'])
+        logger.warning(f'Архив логов: завершен прерванный сегмент {segment["path"]} ({len(ids)} записей)')
+    return len(pending)
+
+
+def _archive_group(logs, writer, batch_size):
+    """Потоковое чтение логов от новых к старым порциями по (created_at, id)"""
+    logs = logs.select_related('user').order_by('-created_at', '-id')
+    last = None
+    while True:
+        chunk = logs
+        if last is not None:
+            chunk = chunk.filter(created_at__lte=last.created_at).filter(
+                Q(created_at__lt=last.created_at) | Q(created_at=last.created_at, id__lt=last.pk)
+            )
+        chunk = list(chunk[:batch_size])
+        if not chunk:
+            break
+        for log in chunk:
+            writer.add(log)
+        last = chunk[-1]
+    writer.close()
+
+
+def archive_logs(older_than_days, archive_format=None, segment_rows=None, batch_size=None, root=None):
+    """
+    Перенос логов старше older_than_days дней в архив
+
+    Args:
+        older_than_days: Возраст логов в днях
+        archive_format: 'jsonl' или 'parquet'
+        segment_rows: Максимальное количество записей в сегменте
+        batch_size: Размер порции чтения и удаления
+        root: Каталог архива
+
+    Returns:
+        Словарь segments, rows
+
+    Raises:
+        ValueError: Если формат не поддерживается
+    """
+    archive_format = archive_format or ARCHIVE_FORMAT
+    _check_format(archive_format)
+    root = root or ARCHIVE_ROOT
+    batch_size = batch_size or BATCH_SIZE
+
+    reconcile_pending(root, batch_size)
+
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    logs = ActionLog.objects.filter(created_at__lt=cutoff)
+    first = logs.aggregate(first=Min('created_at'))['first']
+    result = {'segments': 0, 'rows': 0}
+
+    # Месяцы в UTC, как и секции таблицы логов; месяцы без логов пропускаются
+    while first is not None:
+        month = month_start(first.astimezone(dt_timezone.utc))
+        start, end = month_bounds(month)
+        month_logs = logs.filter(created_at__gte=start, created_at__lt=end)
+        actions = month_logs.order_by().values_list('action', flat=True).distinct()
+        for action in sorted(actions):
+            writer = _SegmentWriter(
+                root, month, action, archive_format, segment_rows or SEGMENT_ROWS, batch_size
+            )
+            _archive_group(month_logs.filter(action=action), writer, batch_size)
+            result['segments'] += writer.segments
+            result['rows'] += writer.rows
+        logger.info(f'Архив логов за {month:%m.%Y}: всего записей {result["rows"]}')
+        first = logs.filter(created_at__gte=end).aggregate(first=Min('created_at'))['first']
+    return result
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def archived_segments(params, root=None):
+    """
+    Сегменты архива, которые могут содержать логи по фильтрам
+
+    Args:
+        params: Словарь фильтров (action, date_from, date_to), см. export.filter_logs
+
+    Returns:
+        Список записей манифеста
+    """
+    action = params.get('action', '')
+    date_from = _parse_date(params.get('date_from', ''))
+    date_to = _parse_date(params.get('date_to', ''))
+    segments = []
+    for segment in load_manifest(root)['segments']:
+        if action and segment['action'] != action:
+            continue
+        month = datetime.strptime(segment['month'], '%Y-%m').date()
+        # Месяц сегмента в UTC, границы фильтра - в локальном времени, берем с запасом в сутки
+        if date_from and add_months(month, 1) < date_from - timedelta(days=1):
+            continue
+        if date_to and month > date_to + timedelta(days=1):
+            continue
+        segments.append(segment)
+    return segments
+
+
+def _matches(record, user_filter, date_from, date_to):
+    if user_filter:
+        haystack = f'{record["user_name"]} {record["user_email"]}'.lower()
+        if user_filter not in haystack:
+            return False
+    if date_from or date_to:
+        day = timezone.localdate(record['created_at'])
+        if date_from and day < date_from:
+            return False
+        if date_to and day > date_to:
+            return False
+    return True
+
+
+def iter_archived_logs(params, root=None):
+    """
+    Архивные логи по фильтрам экспорта, от новых к старым
+
+    Сегменты читаются с диска потоково; внутри месяца сегменты
+    сливаются по created_at.
+
+    Args:
+        params: Словарь фильтров (action, user, date_from, date_to)
+        root: Каталог архива
+
+    Yields:
+        Записи архива (см. log_record) с created_at типа datetime
+    """
+    root = root or ARCHIVE_ROOT
+    user_filter = params.get('user', '').lower()
+    date_from = _parse_date(params.get('date_from', ''))
+    date_to = _parse_date(params.get('date_to', ''))
+
+    by_month = {}
+    for segment in archived_segments(params, root):
+        by_month.setdefault(segment['month'], []).append(segment)
+
+    def read(segment):
+        for record in _read_segment(os.path.join(root, segment['path']), segment['format']):
+            record['created_at'] = parse_datetime(record['created_at'])
+            yield record
+
+    for month in sorted(by_month, reverse=True):
+        merged = heapq.merge(
+            *(read(segment) for segment in by_month[month]),
+            key=lambda record: record['created_at'],
+            reverse=True
+        )
+        for record in merged:
+            if _matches(record, user_filter, date_from, date_to):
+                yield record
+
+
+def archived_count(params, root=None):
+    """Верхняя оценка количества архивных логов по фильтрам (по манифесту)"""
+    return sum(segment['rows'] for segment in archived_segments(params, root))
@@ -0,0 +1,402 @@
+"""
+Потоковый экспорт журнала действий в CSV и XLSX
+
+Логи читаются из базы порциями (QuerySet.iterator) и сразу записываются
+в ответ, поэтому расход памяти не зависит от количества строк. CSV отдается
+через StreamingHttpResponse, XLSX собирается workbook'ом в режиме write-only
+во временном буфере (SpooledTemporaryFile), без файлов в рабочем каталоге.
+С параметром archive=1 после логов из базы выгружаются подходящие
+под фильтры логи из холодного архива (action_logs.archive).
+"""
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .search import filter_by_user
+
+EXPORT_FORMATS = ('xlsx', 'csv')
+
+# Параметры запроса, которые сохраняются в фоновой задаче экспорта
+FILTER_PARAMS = ('action', 'user', 'date_from', 'date_to', 'archive')
+
+CHUNK_SIZE = getattr(settings, 'ACTION_LOG_EXPORT_CHUNK_SIZE', 2000)
+
+# Экспорт большего количества записей выполняется фоновой задачей
+BACKGROUND_THRESHOLD = getattr(settings, 'ACTION_LOG_EXPORT_BACKGROUND_THRESHOLD', 100000)
+
+# Предельное время фонового экспорта в секундах; задача, которая выполняется
+# дольше, считается прерванной
+EXPORT_TIMEOUT = getattr(settings, 'ACTION_LOG_EXPORT_TIMEOUT', 60 * 60)
+
+# XLSX до этого размера собирается в памяти, больший - во временном файле
+SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+SHEET_TITLE = 'Логи действий'
+
+# Заголовок колонки и ее ширина в XLSX
+EXPORT_COLUMNS = (
+    ('Дата', 20),
+    ('Пользователь', 30),
+    ('Email', 30),
+    ('Роль', 15),
+    ('Действие', 25),
+    ('Описание', 50),
+    ('IP адрес', 16),
+    ('User Agent', 50),
+    ('Метаданные', 50),
+)
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _day_start(day):
+    """Начало суток в текущем часовом поясе"""
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def filter_logs(logs, params):
+    """
+    Применение фильтров панели логов к queryset
+
+    Args:
+        logs: QuerySet логов
+        params: Словарь параметров (action, user, date_from, date_to)
+
+    Returns:
+        Отфильтрованный QuerySet
+    """
+    action_filter = params.get('action', '')
+    user_filter = params.get('user', '')
+    date_from = params.get('date_from', '')
+    date_to = params.get('date_to', '')
+
+    if action_filter:
+        logs = logs.filter(action=action_filter)
+
+    if user_filter:
+        logs = filter_by_user(logs, user_filter)
+
+    # Фильтр по границам суток, а не по created_at__date: сравнение самого
+    # created_at позволяет PostgreSQL отсечь лишние секции журнала
+    if date_from:
+        try:
+            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
+            logs = logs.filter(created_at__gte=_day_start(date_from_obj))
+        except ValueError:
+            pass
+
+    if date_to:
+        try:
+            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
+            logs = logs.filter(created_at__lt=_day_start(date_to_obj + timedelta(days=1)))
+        except (ValueError, OverflowError):
+            pass
+
+    return logs
+
+
+def export_filename(export_format):
+    """Имя файла экспорта с отметкой времени"""
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    return f'action_logs_{timestamp}.{export_format}'
+
+
+def log_row(log):
+    """Строка экспорта для записи журнала"""
+    return [
+        log.created_at.strftime('%d.%m.%Y %H:%M:%S'),
+        log.user.get_full_name(),
+        log.user.email,
+        log.user.get_role_display(),
+        log.get_action_display(),
+        log.description,
+        log.ip_address or '',
+        log.user_agent or '',
+        json.dumps(log.metadata, ensure_ascii=False) if log.metadata else '',
+    ]
+
+
+def archived_log_row(record):
+    """Строка экспорта для записи холодного архива"""
+    from django.contrib.auth import get_user_model
+
+    from .models import ActionLog
+
+    roles = dict(get_user_model()._meta.get_field('role').choices)
+    actions = dict(ActionLog.ACTION_CHOICES)
+    return [
+        record['created_at'].strftime('%d.%m.%Y %H:%M:%S'),
+        record['user_name'],
+        record['user_email'],
+        roles.get(record['user_role'], record['user_role']),
+        actions.get(record['action'], record['action']),
+        record['description'],
+        record['ip_address'] or '',
+        record['user_agent'] or '',
+        json.dumps(record['metadata'], ensure_ascii=False) if record['metadata'] else '',
+    ]
+
+
+def archive_params(params):
+    """Фильтры для чтения холодного архива, если экспорт запрошен с archive=1"""
+    if str(params.get('archive', '')).lower() in ('1', 'true', 'yes'):
+        return params
+    return None
+
+
+def iter_log_rows(logs, chunk_size=None, archive=None):
+    """
+    Строки экспорта, читаемые из базы порциями по chunk_size
+
+    Если переданы фильтры archive, после логов из базы идут логи из архива.
+    """
+    for log in logs.select_related('user').iterator(chunk_size=chunk_size or CHUNK_SIZE):
+        yield log_row(log)
+    if archive is not None:
+        from .archive import iter_archived_logs
+
+        for record in iter_archived_logs(archive):
+            yield archived_log_row(record)
+
+
+class _Echo:
+    """Псевдофайл для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(logs, chunk_size=None, archive=None):
+    """Строки CSV файла (с BOM, чтобы Excel распознал UTF-8)"""
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow([title for title, _ in EXPORT_COLUMNS])
+    for row in iter_log_rows(logs, chunk_size, archive):
+        yield writer.writerow(row)
+
+
+def write_xlsx(logs, output, chunk_size=None, progress=None, archive=None):
+    """
+    Запись логов в XLSX файл в режиме write-only
+
+    Args:
+        logs: QuerySet логов
+        output: Файловый объект, открытый на запись в бинарном режиме
+        chunk_size: Размер порции чтения из базы
+        progress: Функция progress(rows_written), вызываемая после каждой порции
+        archive: Фильтры логов из холодного архива (см. archive_params)
+
+    Returns:
+        Количество записанных строк
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    from openpyxl.utils import get_column_letter
+
+    chunk_size = chunk_size or CHUNK_SIZE
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(SHEET_TITLE)
+    # В режиме write-only ширину колонок нужно задать до записи строк
+    for index, (_, width) in enumerate(EXPORT_COLUMNS, start=1):
+        worksheet.column_dimensions[get_column_letter(index)].width = width
+
+    worksheet.append([title for title, _ in EXPORT_COLUMNS])
+    rows = 0
+    for row in iter_log_rows(logs, chunk_size, archive):
+        worksheet.append([
+            ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+            for value in row
+        ])
+        rows += 1
+        if progress and rows % chunk_size == 0:
+            progress(rows)
+
+    workbook.save(output)
+    if progress:
+        progress(rows)
+    return rows
+
+
+def write_csv(logs, output, chunk_size=None, progress=None, archive=None):
+    """
+    Запись логов в CSV файл (UTF-8 с BOM)
+
+    Args:
+        logs: QuerySet логов
+        output: Файловый объект, открытый на запись в бинарном режиме
+        chunk_size: Размер порции чтения из базы
+        progress: Функция progress(rows_written), вызываемая после каждой порции
+        archive: Фильтры логов из холодного архива (см. archive_params)
+
+    Returns:
+        Количество записанных строк
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow([title for title, _ in EXPORT_COLUMNS])
+    rows = 0
+    for row in iter_log_rows(logs, chunk_size, archive):
+        writer.writerow(row)
+        rows += 1
+        if progress and rows % chunk_size == 0:
+            progress(rows)
+
+    text.flush()
+    # Отсоединяем обертку, чтобы она не закрыла output
+    text.detach()
+    if progress:
+        progress(rows)
+    return rows
+
+
+def write_export(logs, export_format, output, chunk_size=None, progress=None, archive=None):
+    """Запись логов в файл указанного формата"""
+    if export_format == 'csv':
+        return write_csv(logs, output, chunk_size, progress, archive)
+    return write_xlsx(logs, output, chunk_size, progress, archive)
+
+
+def csv_response(logs, filename, archive=None):
+    """Потоковый CSV ответ"""
+    response = StreamingHttpResponse(iter_csv(logs, archive=archive), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def xlsx_response(logs, filename, archive=None):
+    """XLSX ответ, собранный во временном буфере"""
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    write_xlsx(logs, output, archive=archive)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+def export_response(logs, export_format='xlsx', archive=None):
+    """
+    Ответ с экспортом логов
+
+    Args:
+        logs: QuerySet логов (без ограничения количества)
+        export_format: 'xlsx' или 'csv'
+        archive: Фильтры логов из холодного архива (см. archive_params)
+
+    Raises:
+        ValueError: Если формат не поддерживается
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Неподдерживаемый формат экспорта: {export_format}')
+    filename = export_filename(export_format)
+    if export_format == 'csv':
+        return csv_response(logs, filename, archive)
+    return xlsx_response(logs, filename, archive)
+
+
+def export_filters(params):
+    """Фильтры экспорта из параметров запроса"""
+    return {key: params[key] for key in FILTER_PARAMS if params.get(key)}
+
+
+def start_export_job(user, export_format, filters):
+    """
+    Создание фоновой задачи экспорта
+
+    Задача Celery ставится в очередь после фиксации транзакции,
+    чтобы воркер гарантированно увидел созданную запись.
+
+    Args:
+        user: Пользователь, запросивший экспорт
+        export_format: 'xlsx' или 'csv'
+        filters: Словарь фильтров (см. filter_logs)
+
+    Returns:
+        ExportJob
+
+    Raises:
+        ValueError: Если формат не поддерживается
+    """
+    from .models import ExportJob
+    from .tasks import run_export_job
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Неподдерживаемый формат экспорта: {export_format}')
+
+    job = ExportJob.objects.create(
+        user=user,
+        export_format=export_format,
+        filters=export_filters(filters)
+    )
+    transaction.on_commit(lambda: run_export_job.delay(str(job.pk)))
+    return job
+
+
+def should_run_in_background(logs, params):
+    """
+    Нужно ли выполнять экспорт фоновой задачей
+
+    Записи считаются только до порога (COUNT по LIMIT BACKGROUND_THRESHOLD + 1),
+    а не полным сканированием выборки.
+    """
+    if params.get('background', '').lower() in ('1', 'true', 'yes'):
+        return True
+    limit = BACKGROUND_THRESHOLD
+    if archive_params(params) is not None:
+        from .archive import archived_count
+
+        limit -= archived_count(params)
+        if limit < 0:
+            return True
+    return bounded_count(logs, limit) > limit
+
+
+def bounded_count(logs, limit):
+    """
+    Количество записей выборки, но не больше limit + 1
+
+    COUNT выполняется по подзапросу с LIMIT, поэтому большая выборка
+    не сканируется целиком.
+    """
+    return logs.order_by()[:limit + 1].count()
+
+
+def estimate_export_rows(logs):
+    """
+    Ожидаемое количество строк экспорта для индикатора прогресса
+
+    До порога BACKGROUND_THRESHOLD записи считаются точно (bounded_count),
+    для больших выборок берется оценка планировщика (approximate_count).
+    """
+    from .pagination import approximate_count
+
+    total = bounded_count(logs, BACKGROUND_THRESHOLD)
+    if total > BACKGROUND_THRESHOLD:
+        total = max(total, approximate_count(logs))
+    return total
+
+
+def fail_stale_export_jobs(timeout=None):
+    """
+    Перевод в failed задач экспорта, которые выполняются дольше EXPORT_TIMEOUT
+
+    Такие задачи остаются в статусе running, если воркер был остановлен
+    во время экспорта и не успел записать результат.
+
+    Returns:
+        int: Количество помеченных задач
+    """
+    from .models import ExportJob
+
+    timeout = EXPORT_TIMEOUT if timeout is None else timeout
+    now = timezone.now()
+    return ExportJob.objects.filter(
+        status='running',
+        started_at__lt=now - timedelta(seconds=timeout)
+    ).update(status='failed', error='Экспорт прерван: превышено время выполнения', completed_at=now)
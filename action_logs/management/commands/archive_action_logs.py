@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from action_logs import archive
+
+
+class Command(BaseCommand):
+    help = 'Перенос старых логов действий в холодный архив (сжатые сегменты по месяцам и действиям)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            required=True,
+            help='Архивировать логи старше указанного количества дней'
+        )
+        parser.add_argument(
+            '--format',
+            dest='archive_format',
+            choices=archive.ARCHIVE_FORMATS,
+            default=archive.ARCHIVE_FORMAT,
+            help='Формат сегментов: jsonl (JSONL.gz) или parquet (требуется pyarrow)'
+        )
+        parser.add_argument(
+            '--segment-rows',
+            type=int,
+            default=archive.SEGMENT_ROWS,
+            help='Максимальное количество записей в сегменте'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=archive.BATCH_SIZE,
+            help='Размер порции чтения и удаления логов'
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 1:
+            raise CommandError('Срок должен быть не меньше одного дня')
+        if options['segment_rows'] < 1 or options['batch_size'] < 1:
+            raise CommandError('Размер сегмента и порции должен быть положительным')
+
+        try:
+            result = archive.archive_logs(
+                options['older_than_days'],
+                archive_format=options['archive_format'],
+                segment_rows=options['segment_rows'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Архивировано записей: {result["rows"]}, сегментов: {result["segments"]}'
+        ))
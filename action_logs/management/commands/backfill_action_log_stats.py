@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from action_logs.models import ActionLog
+from action_logs.rollup import rollup_day
+
+
+class Command(BaseCommand):
+    help = 'Заполнение суточной сводки логов действий за период'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            help='Первый день периода (ГГГГ-ММ-ДД), по умолчанию - день самого раннего лога'
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            help='Последний день периода (ГГГГ-ММ-ДД), по умолчанию - сегодня'
+        )
+
+    def handle(self, *args, **options):
+        first_log = ActionLog.objects.aggregate(first=Min('created_at'))['first']
+        if first_log is None and not options['date_from']:
+            self.stdout.write('Логи отсутствуют')
+            return
+
+        first_day = self._parse(options['date_from']) or timezone.localdate(first_log)
+        last_day = self._parse(options['date_to']) or timezone.localdate()
+        if first_day > last_day:
+            raise CommandError('Начало периода позже его окончания')
+
+        days = rows = 0
+        day = first_day
+        while day <= last_day:
+            rows += rollup_day(day)
+            days += 1
+            if days % 30 == 0:
+                self.stdout.write(f'Обработано дней: {days}, последний: {day:%d.%m.%Y}')
+            day += timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Сводка пересчитана: дней {days}, записей {rows}'))
+
+    def _parse(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Неверный формат даты: {value}')
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from action_logs import partitions
+
+
+class Command(BaseCommand):
+    help = 'Создание помесячных секций журнала действий и удаление секций старше срока хранения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=partitions.MONTHS_AHEAD,
+            help='На сколько месяцев вперед создавать секции'
+        )
+        parser.add_argument(
+            '--retention-months',
+            type=int,
+            default=partitions.RETENTION_MONTHS,
+            help='Срок хранения логов в месяцах (0 - хранить бессрочно)'
+        )
+        parser.add_argument(
+            '--action',
+            choices=('detach', 'drop'),
+            default=partitions.RETENTION_ACTION,
+            help='Отсоединить или удалить секции старше срока хранения'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать секции старше срока хранения'
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            raise CommandError('Таблица журнала действий не секционирована')
+        if options['months_ahead'] < 0 or options['retention_months'] < 0:
+            raise CommandError('Количество месяцев не может быть отрицательным')
+
+        if options['dry_run']:
+            expired = partitions.expired_partitions(options['retention_months'])
+            for month in expired:
+                self.stdout.write(f'Секция старше срока хранения: {partitions.partition_name(month)}')
+            for month in partitions.expired_default_months(options['retention_months']):
+                self.stdout.write(f'Логи старше срока хранения в {partitions.DEFAULT_PARTITION}: {month:%Y-%m}')
+            self.stdout.write(f'Секций старше срока хранения: {len(expired)}')
+            return
+
+        for month in partitions.ensure_partitions(options['months_ahead']):
+            self.stdout.write(f'Создана секция {partitions.partition_name(month)}')
+
+        removed = partitions.apply_retention(options['retention_months'], options['action'])
+        verb = 'Удалена' if options['action'] == 'drop' else 'Отсоединена'
+        for month in removed:
+            self.stdout.write(f'{verb} секция {partitions.partition_name(month)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Секций: {len(partitions.list_partitions())}, обработано устаревших: {len(removed)}'
+        ))
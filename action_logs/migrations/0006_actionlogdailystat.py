@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:00
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('action_logs', '0005_exportjob'),
+        ('kingdom', '0004_king_citizens_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActionLogDailyStat',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField(verbose_name='День')),
+                ('action', models.CharField(choices=[('login', 'Вход в систему'), ('logout', 'Выход из системы'), ('register', 'Регистрация'), ('test_start', 'Начало тестирования'), ('test_complete', 'Завершение тестирования'), ('enrollment', 'Зачисление подданного'), ('test_pass', 'Прохождение теста'), ('test_fail', 'Неудачное прохождение теста')], max_length=20, verbose_name='Действие')),
+                ('role', models.CharField(blank=True, max_length=10, verbose_name='Роль')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('kingdom', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='action_log_stats', to='kingdom.kingdom', verbose_name='Королевство')),
+            ],
+            options={
+                'verbose_name': 'Сводка логов за день',
+                'verbose_name_plural': 'Сводки логов по дням',
+                'db_table': 'action_log_daily_stats',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='actionlogdailystat',
+            constraint=models.UniqueConstraint(fields=('day', 'action', 'role', 'kingdom'), name='action_log_daily_stats_unique_key', nulls_distinct=False),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+from action_logs.operations import AddIndexConcurrentlyIfPostgres, RemoveIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся без блокировки записи в растущую таблицу логов (PostgreSQL)
+    atomic = False
+
+    dependencies = [
+        ('action_logs', '0006_actionlogdailystat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name='actionlog',
+            index=models.Index(fields=['created_at', 'id'], name='action_logs_created_id_idx'),
+        ),
+        RemoveIndexConcurrentlyIfPostgres(
+            model_name='actionlog',
+            name='action_logs_created_66dc10_idx',
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from action_logs.operations import AddIndexConcurrentlyIfPostgres
+
+BATCH_SIZE = 5000
+
+
+def fill_kingdom(apps, schema_editor):
+    """Заполняем королевство существующих логов пачками по BATCH_SIZE"""
+    ActionLog = apps.get_model('action_logs', 'ActionLog')
+    Citizen = apps.get_model('kingdom', 'Citizen')
+    King = apps.get_model('kingdom', 'King')
+
+    citizen_kingdom = Citizen.objects.filter(user_id=OuterRef('user_id')).values('kingdom_id')[:1]
+    king_kingdom = King.objects.filter(user_id=OuterRef('user_id')).values('kingdom_id')[:1]
+
+    last = None
+    while True:
+        logs = ActionLog.objects.order_by('created_at', 'id')
+        if last is not None:
+            logs = logs.filter(Q(created_at__gt=last[0]) | Q(created_at=last[0], id__gt=last[1]))
+        batch = list(logs.values_list('created_at', 'id')[:BATCH_SIZE])
+        if not batch:
+            break
+
+        # Каждая пачка фиксируется отдельно (миграция не атомарна)
+        ActionLog.objects.filter(id__in=[pk for _, pk in batch], kingdom__isnull=True).update(
+            kingdom_id=Coalesce(Subquery(citizen_kingdom), Subquery(king_kingdom))
+        )
+        last = batch[-1]
+
+
+class Migration(migrations.Migration):
+    # Заполнение идет пачками, индекс строится без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ('action_logs', '0007_actionlog_created_id_index'),
+        ('kingdom', '0004_king_citizens_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actionlog',
+            name='kingdom',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='action_logs', to='kingdom.kingdom', verbose_name='Королевство'),
+        ),
+        migrations.RunPython(fill_kingdom, migrations.RunPython.noop),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='actionlog',
+            index=models.Index(fields=['kingdom', 'created_at', 'id'], name='action_logs_kingdom_idx'),
+        ),
+    ]
@@ -0,0 +1,172 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.db import migrations, transaction
+
+# Сколько месяцев вперед создаются секции при переходе на секционирование
+MONTHS_AHEAD = 3
+
+# Размер пачки переноса логов в секционированную таблицу
+BATCH_SIZE = 5000
+
+# Логи, записанные во время переноса с created_at раньше уже перенесенных
+# (буферизованная запись), дописываются при замене таблиц; проверяются
+# логи не старше начала переноса минус CATCH_UP_MARGIN
+CATCH_UP_MARGIN = timedelta(hours=1)
+
+NEW_TABLE = 'action_logs_new'
+
+# Индексы и внешние ключи таблицы, пересоздаваемые под прежними именами
+INDEXES = (
+    ('action_logs_user_id_44e0dd_idx', '(user_id, action)'),
+    ('action_logs_action_a2704e_idx', '(action)'),
+    ('action_logs_user_id_e6449eac', '(user_id)'),
+    ('action_logs_created_id_idx', '(created_at, id)'),
+    ('action_logs_kingdom_idx', '(kingdom_id, created_at, id)'),
+)
+FOREIGN_KEYS = (
+    'ADD CONSTRAINT action_logs_user_id_e6449eac_fk_users_id '
+    'FOREIGN KEY (user_id) REFERENCES users (id) DEFERRABLE INITIALLY DEFERRED',
+    'ADD CONSTRAINT action_logs_kingdom_id_a9f4899d_fk_kingdoms_id '
+    'FOREIGN KEY (kingdom_id) REFERENCES kingdoms (id) DEFERRABLE INITIALLY DEFERRED',
+)
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _copy_batch(cursor, last):
+    """Перенос следующей пачки логов после ключа last (created_at, id)"""
+    where, params = '', []
+    if last is not None:
+        where, params = 'WHERE (created_at, id) > (%s, %s)', list(last)
+    cursor.execute(
+        f'''
+        WITH batch AS (
+            SELECT * FROM action_logs {where} ORDER BY created_at, id LIMIT %s
+        )
+        INSERT INTO {NEW_TABLE} SELECT * FROM batch RETURNING created_at, id
+        ''',
+        params + [BATCH_SIZE]
+    )
+    keys = cursor.fetchall()
+    return max(keys) if keys else None
+
+
+def partition(apps, schema_editor):
+    """
+    Секционирование action_logs по месяцам created_at (только PostgreSQL)
+
+    Логи переносятся в новую секционированную таблицу пачками по BATCH_SIZE,
+    каждая пачка фиксируется отдельно, запись в action_logs при этом не
+    блокируется. Индексы строятся после переноса под временными именами.
+    Под блокировкой таблица блокируется только на замену: дописываются логи,
+    записанные во время переноса, старая таблица удаляется, новая и ее
+    индексы переименовываются.
+
+    Первичный ключ секционированной таблицы обязан включать ключ
+    секционирования, поэтому он становится (id, created_at): уникальность
+    одного id больше не проверяется базой (id - случайный UUID).
+
+    Удаления из action_logs во время переноса не переносятся: задачи
+    архивирования логов на время миграции нужно остановить.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute("SELECT date_trunc('month', min(created_at) AT TIME ZONE 'UTC'), now() FROM action_logs")
+        first, started = cursor.fetchone()
+        today = date.today()
+        current = date(today.year, today.month, 1)
+        month = min(first.date(), current) if first else current
+
+        cursor.execute(
+            f'CREATE TABLE {NEW_TABLE} (LIKE action_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'ALTER TABLE {NEW_TABLE} ADD CONSTRAINT {NEW_TABLE}_pkey PRIMARY KEY (id, created_at)')
+        # Внешние ключи на пустой таблице: без проверки всех строк под блокировкой users
+        for sql in FOREIGN_KEYS:
+            cursor.execute(f'ALTER TABLE {NEW_TABLE} {sql}')
+        cursor.execute(f'CREATE TABLE action_logs_default PARTITION OF {NEW_TABLE} DEFAULT')
+        last = _add_months(current, MONTHS_AHEAD)
+        while month <= last:
+            cursor.execute(
+                f'CREATE TABLE action_logs_p{month:%Y%m} PARTITION OF {NEW_TABLE} '
+                'FOR VALUES FROM (%s) TO (%s)',
+                [_bound(month), _bound(_add_months(month, 1))]
+            )
+            month = _add_months(month, 1)
+
+    last = None
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            key = _copy_batch(cursor, last)
+        if key is None:
+            break
+        last = key
+
+    with connection.cursor() as cursor:
+        for name, columns in INDEXES:
+            cursor.execute(f'CREATE INDEX {name}_new ON {NEW_TABLE} {columns}')
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('LOCK TABLE action_logs IN ACCESS EXCLUSIVE MODE')
+        while True:
+            key = _copy_batch(cursor, last)
+            if key is None:
+                break
+            last = key
+        cursor.execute(
+            f'''
+            INSERT INTO {NEW_TABLE}
+            SELECT * FROM action_logs old
+            WHERE old.created_at >= %s AND NOT EXISTS (
+                SELECT 1 FROM {NEW_TABLE} new WHERE new.id = old.id AND new.created_at = old.created_at
+            )
+            ''',
+            [started - CATCH_UP_MARGIN]
+        )
+        cursor.execute('DROP TABLE action_logs')
+        cursor.execute(f'ALTER TABLE {NEW_TABLE} RENAME TO action_logs')
+        cursor.execute(f'ALTER TABLE action_logs RENAME CONSTRAINT {NEW_TABLE}_pkey TO action_logs_pkey')
+        for name, _ in INDEXES:
+            cursor.execute(f'ALTER INDEX {name}_new RENAME TO {name}')
+
+
+def unpartition(apps, schema_editor):
+    """Возврат к обычной таблице action_logs с первичным ключом id"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with transaction.atomic(using=schema_editor.connection.alias), schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {NEW_TABLE} (LIKE action_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(f'INSERT INTO {NEW_TABLE} SELECT * FROM action_logs')
+        cursor.execute('DROP TABLE action_logs')
+        cursor.execute(f'ALTER TABLE {NEW_TABLE} RENAME TO action_logs')
+        cursor.execute('ALTER TABLE action_logs ADD CONSTRAINT action_logs_pkey PRIMARY KEY (id)')
+        for sql in FOREIGN_KEYS:
+            cursor.execute(f'ALTER TABLE action_logs {sql}')
+        for name, columns in INDEXES:
+            cursor.execute(f'CREATE INDEX {name} ON action_logs {columns}')
+
+
+class Migration(migrations.Migration):
+    # Перенос идет пачками, каждая фиксируется отдельно
+    atomic = False
+
+    dependencies = [
+        ('action_logs', '0008_actionlog_kingdom'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
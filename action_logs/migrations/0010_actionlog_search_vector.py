@@ -0,0 +1,78 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+# Конфигурация полнотекстового поиска (action_logs.search.SEARCH_CONFIG)
+SEARCH_CONFIG = 'pg_catalog.russian'
+
+TRIGGER = 'action_logs_search_vector_trigger'
+INDEX = 'action_logs_search_vector_idx'
+
+
+def create_search_vector(apps, schema_editor):
+    """
+    Триггер заполнения search_vector, заполнение существующих логов
+    пачками по BATCH_SIZE и GIN-индекс (только PostgreSQL)
+
+    Триггер на секционированной таблице копируется во все секции,
+    в том числе создаваемые позже.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TRIGGER {TRIGGER} BEFORE INSERT OR UPDATE OF description, search_vector ON action_logs '
+            f"FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, '{SEARCH_CONFIG}', description)"
+        )
+
+        last = None
+        while True:
+            if last is None:
+                cursor.execute(
+                    'SELECT created_at, id FROM action_logs ORDER BY created_at, id LIMIT %s', [BATCH_SIZE]
+                )
+            else:
+                cursor.execute(
+                    'SELECT created_at, id FROM action_logs WHERE (created_at, id) > (%s, %s) '
+                    'ORDER BY created_at, id LIMIT %s',
+                    [last[0], last[1], BATCH_SIZE]
+                )
+            batch = cursor.fetchall()
+            if not batch:
+                break
+            # Каждая пачка фиксируется отдельно (миграция не атомарна)
+            cursor.execute(
+                'UPDATE action_logs SET search_vector = to_tsvector(%s::regconfig, description) '
+                'WHERE id = ANY(%s) AND search_vector IS NULL',
+                [SEARCH_CONFIG, [pk for _, pk in batch]]
+            )
+            last = batch[-1]
+
+        cursor.execute(f'CREATE INDEX {INDEX} ON action_logs USING gin (search_vector)')
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP INDEX IF EXISTS {INDEX}')
+        cursor.execute(f'DROP TRIGGER IF EXISTS {TRIGGER} ON action_logs')
+
+
+class Migration(migrations.Migration):
+    # Заполнение идет пачками
+    atomic = False
+
+    dependencies = [
+        ('action_logs', '0009_partition_action_logs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actionlog',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
@@ -1,6 +1,8 @@
 import uuid
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class ActionLog(models.Model):
@@ -24,6 +26,17 @@ class ActionLog(models.Model):
         verbose_name='Пользователь',
         related_name='action_logs'
     )
+    # Королевство пользователя на момент действия (для выборок логов по королевству)
+    kingdom = models.ForeignKey(
+        'kingdom.Kingdom',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        # Отдельный индекс не нужен: kingdom - префикс составного индекса
+        db_index=False,
+        verbose_name='Королевство',
+        related_name='action_logs'
+    )
     action = models.CharField(
         max_length=20,
         choices=ACTION_CHOICES,
@@ -33,7 +46,11 @@ class ActionLog(models.Model):
     metadata = models.JSONField(default=dict, blank=True, verbose_name='Метаданные')
     ip_address = models.GenericIPAddressField(blank=True, null=True, verbose_name='IP адрес')
     user_agent = models.TextField(blank=True, null=True, verbose_name='User Agent')
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    # Время события задается при его возникновении, а не при записи пачки в базу
+    created_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Дата создания')
+    # Полнотекстовый вектор описания для поиска (action_logs.search). В PostgreSQL
+    # заполняется триггером при записи, GIN-индекс создан миграцией 0010
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name='Поисковый вектор')
     
     class Meta:
         verbose_name = 'Лог действия'
@@ -42,9 +59,111 @@ class ActionLog(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'action']),
-            models.Index(fields=['created_at']),
+            # Keyset-пагинация по (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='action_logs_created_id_idx'),
+            models.Index(fields=['kingdom', 'created_at', 'id'], name='action_logs_kingdom_idx'),
             models.Index(fields=['action']),
         ]
     
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.get_action_display()} ({self.created_at.strftime('%d.%m.%Y %H:%M')})"
+
+
+class ExportJob(models.Model):
+    """Модель фоновой задачи экспорта логов"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('completed', 'Завершен'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel (XLSX)'),
+        ('csv', 'CSV'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='export_jobs'
+    )
+    export_format = models.CharField(
+        max_length=10,
+        choices=FORMAT_CHOICES,
+        default='xlsx',
+        verbose_name='Формат'
+    )
+    filters = models.JSONField(default=dict, blank=True, verbose_name='Фильтры')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name='Статус'
+    )
+    total_rows = models.PositiveIntegerField(default=0, verbose_name='Всего записей')
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name='Обработано записей')
+    file = models.FileField(upload_to='exports/%Y/%m/%d/', blank=True, verbose_name='Файл')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name='Начато')
+    completed_at = models.DateTimeField(blank=True, null=True, verbose_name='Завершено')
+    
+    class Meta:
+        verbose_name = 'Экспорт логов'
+        verbose_name_plural = 'Экспорты логов'
+        db_table = 'action_log_export_jobs'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Экспорт {self.get_export_format_display()} ({self.get_status_display()})"
+    
+    @property
+    def progress(self):
+        """Процент выполнения"""
+        if self.status == 'completed':
+            return 100
+        if self.total_rows == 0:
+            return 0
+        return min(100, round((self.processed_rows / self.total_rows) * 100, 1))
+
+
+class ActionLogDailyStat(models.Model):
+    """Суточная сводка логов действий (по дню, действию, роли и королевству)"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    day = models.DateField(verbose_name='День')
+    action = models.CharField(
+        max_length=20,
+        choices=ActionLog.ACTION_CHOICES,
+        verbose_name='Действие'
+    )
+    role = models.CharField(max_length=10, blank=True, verbose_name='Роль')
+    kingdom = models.ForeignKey(
+        'kingdom.Kingdom',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        verbose_name='Королевство',
+        related_name='action_log_stats'
+    )
+    count = models.PositiveIntegerField(default=0, verbose_name='Количество')
+    
+    class Meta:
+        verbose_name = 'Сводка логов за день'
+        verbose_name_plural = 'Сводки логов по дням'
+        db_table = 'action_log_daily_stats'
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'action', 'role', 'kingdom'],
+                name='action_log_daily_stats_unique_key',
+                nulls_distinct=False
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.day:%d.%m.%Y} - {self.get_action_display()}: {self.count}"
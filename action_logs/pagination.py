@@ -0,0 +1,169 @@
+"""
+Keyset-пагинация журнала действий
+
+Страницы выбираются по позиции (created_at, id) последней показанной записи,
+а не через OFFSET, поэтому стоимость любой страницы одинакова и не растет
+с глубиной. Порядок поддерживается составным индексом (created_at, id).
+Общее количество записей не считается через COUNT(*): при необходимости
+возвращается оценка планировщика PostgreSQL.
+"""
+import base64
+import json
+import uuid
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Направление курсора: следующая или предыдущая страница
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, log):
+    """Курсор на позицию записи журнала"""
+    value = f'{direction}|{log.created_at.isoformat()}|{log.pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Разбор курсора
+
+    Returns:
+        Кортеж (direction, created_at, id)
+
+    Raises:
+        ValueError: Если курсор поврежден
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        created_at = parse_datetime(created_at)
+        pk = uuid.UUID(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Неверный курсор')
+    if direction not in (NEXT, PREVIOUS) or created_at is None:
+        raise ValueError('Неверный курсор')
+    return direction, created_at, pk
+
+
+class KeysetPage:
+    """Страница журнала, выбранная по курсору"""
+
+    def __init__(self, object_list, per_page, next_cursor=None, previous_cursor=None, approximate_count=None):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_count = approximate_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def _beyond(logs, created_at, pk, before):
+    """Записи строго до (before=True) или строго после позиции (created_at, id)"""
+    if before:
+        return logs.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+    return logs.filter(created_at__gte=created_at).filter(
+        Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+    )
+
+
+def keyset_paginate(logs, cursor=None, per_page=50, descending=True, with_count=False):
+    """
+    Страница журнала по курсору
+
+    Args:
+        logs: QuerySet логов (порядок задается пагинацией)
+        cursor: Курсор из next_cursor/previous_cursor предыдущей страницы
+        per_page: Количество записей на странице
+        descending: Сначала новые записи
+        with_count: Добавить оценку общего количества записей
+
+    Returns:
+        KeysetPage
+
+    Raises:
+        ValueError: Если курсор поврежден
+    """
+    forward = ('-created_at', '-id') if descending else ('created_at', 'id')
+    backward = ('created_at', 'id') if descending else ('-created_at', '-id')
+    direction = NEXT
+
+    if cursor:
+        direction, created_at, pk = decode_cursor(cursor)
+        if direction == NEXT:
+            page_logs = _beyond(logs, created_at, pk, before=descending).order_by(*forward)
+        else:
+            page_logs = _beyond(logs, created_at, pk, before=not descending).order_by(*backward)
+    else:
+        page_logs = logs.order_by(*forward)
+
+    rows = list(page_logs[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == PREVIOUS:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, bool(cursor)
+
+    return KeysetPage(
+        rows,
+        per_page,
+        next_cursor=encode_cursor(NEXT, rows[-1]) if has_next and rows else None,
+        previous_cursor=encode_cursor(PREVIOUS, rows[0]) if has_previous and rows else None,
+        approximate_count=approximate_count(logs) if with_count else None,
+    )
+
+
+def approximate_count(logs):
+    """
+    Оценка количества записей без COUNT(*)
+
+    Для всей таблицы используется pg_class.reltuples (для секционированной
+    таблицы - сумма по секциям), для отфильтрованного queryset - оценка строк
+    из плана запроса. Для других СУБД и для таблиц, по которым еще не собрана
+    статистика, выполняется точный подсчет.
+    """
+    if connection.vendor != 'postgresql':
+        return logs.count()
+
+    if not logs.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                SELECT sum(greatest(rel.reltuples, 0))::bigint, max(rel.reltuples)
+                FROM pg_class rel
+                WHERE rel.oid = %s::regclass AND rel.relkind = 'r'
+                   OR rel.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)
+                ''',
+                [logs.model._meta.db_table] * 2
+            )
+            row = cursor.fetchone()
+        if row and row[1] is not None and row[1] >= 0:
+            return row[0]
+        return logs.count()
+
+    plan = json.loads(logs.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
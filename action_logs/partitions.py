@@ -0,0 +1,253 @@
+"""
+Помесячные секции таблицы action_logs
+
+Таблица action_logs секционирована по created_at (PARTITION BY RANGE):
+секция action_logs_pГГГГММ хранит логи одного месяца (границы в UTC),
+секция action_logs_default - логи, для месяца которых секция еще не создана.
+Секции на будущие месяцы создаются заранее, секции старше срока хранения
+отсоединяются или удаляются целиком - без DELETE по всей таблице. Устаревшие
+логи из секции по умолчанию перед этим переносятся в секции своих месяцев.
+Управление секциями - команда manage_action_log_partitions и периодическая
+задача maintain_action_log_partitions.
+"""
+import logging
+import re
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import ActionLog
+
+TABLE = ActionLog._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+
+MONTHS_AHEAD = getattr(settings, 'ACTION_LOG_PARTITION_MONTHS_AHEAD', 3)
+# Срок хранения в месяцах (0 - хранить бессрочно)
+RETENTION_MONTHS = getattr(settings, 'ACTION_LOG_RETENTION_MONTHS', 0)
+# Что делать с секциями старше срока хранения: detach или drop
+RETENTION_ACTION = getattr(settings, 'ACTION_LOG_RETENTION_ACTION', 'detach')
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value):
+    """Первое число месяца"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    """Сдвиг месяца на указанное количество месяцев"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Имя секции месяца"""
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def month_bounds(month):
+    """Границы секции месяца (UTC)"""
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    end = datetime.combine(add_months(month, 1), datetime.min.time(), tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def is_partitioned():
+    """Секционирована ли таблица логов"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions():
+    """
+    Помесячные секции таблицы логов
+
+    Returns:
+        Отсортированный список первых чисел месяцев, для которых есть секции
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            ''',
+            [TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    months = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(month):
+    """
+    Создание секции месяца
+
+    Если логи этого месяца уже попали в секцию по умолчанию, они переносятся
+    в новую секцию в той же транзакции.
+
+    Returns:
+        True, если секция создана, False - если уже существовала
+    """
+    month = month_start(month)
+    if month in list_partitions():
+        return False
+
+    name = connection.ops.quote_name(partition_name(month))
+    table = connection.ops.quote_name(TABLE)
+    default = connection.ops.quote_name(DEFAULT_PARTITION)
+    start, end = month_bounds(month)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= %s AND created_at < %s)',
+            [start, end]
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                [start, end]
+            )
+            return True
+
+        # Секция по умолчанию не должна содержать строк из диапазона новой секции
+        cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'''
+            WITH moved AS (
+                DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            ''',
+            [start, end]
+        )
+        cursor.execute(
+            f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+            [start, end]
+        )
+    return True
+
+
+def ensure_partitions(months_ahead=None, today=None):
+    """
+    Создание секций с текущего месяца на months_ahead месяцев вперед
+
+    Returns:
+        Список месяцев созданных секций
+    """
+    months_ahead = MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(today or date.today())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month):
+            created.append(month)
+    return created
+
+
+def oldest_kept_month(retention_months=None, today=None):
+    """Первый месяц, логи которого хранятся (None - хранить бессрочно)"""
+    retention_months = RETENTION_MONTHS if retention_months is None else retention_months
+    if not retention_months:
+        return None
+    return add_months(month_start(today or date.today()), -retention_months)
+
+
+def expired_partitions(retention_months=None, today=None):
+    """Секции, все логи которых старше срока хранения"""
+    oldest_kept = oldest_kept_month(retention_months, today)
+    if oldest_kept is None:
+        return []
+    return [month for month in list_partitions() if month < oldest_kept]
+
+
+def default_partition_months(before=None):
+    """
+    Месяцы логов, находящихся в секции по умолчанию
+
+    Args:
+        before: Учитывать только месяцы раньше этого (первое число месяца)
+
+    Returns:
+        Отсортированный список первых чисел месяцев
+    """
+    default = connection.ops.quote_name(DEFAULT_PARTITION)
+    query = f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date FROM {default}"
+    params = []
+    if before is not None:
+        query += ' WHERE created_at < %s'
+        params.append(month_bounds(before)[0])
+    with connection.cursor() as cursor:
+        cursor.execute(query + ' ORDER BY 1', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def expired_default_months(retention_months=None, today=None):
+    """Месяцы логов старше срока хранения, оставшихся в секции по умолчанию"""
+    oldest_kept = oldest_kept_month(retention_months, today)
+    if oldest_kept is None:
+        return []
+    return default_partition_months(before=oldest_kept)
+
+
+def remove_partition(month, action=None):
+    """
+    Отсоединение (detach) или удаление (drop) секции месяца
+
+    Отсоединенная секция остается отдельной таблицей с тем же именем,
+    например для архивирования.
+    """
+    action = action or RETENTION_ACTION
+    if action not in ('detach', 'drop'):
+        raise ValueError(f'Неизвестное действие с секцией: {action}')
+
+    name = connection.ops.quote_name(partition_name(month))
+    table = connection.ops.quote_name(TABLE)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+        if action == 'drop':
+            # Отложенные проверки внешних ключей не дают удалить таблицу
+            # в транзакции, которая писала в нее
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute(f'DROP TABLE {name}')
+
+
+def apply_retention(retention_months=None, action=None, today=None):
+    """
+    Отсоединение или удаление секций старше срока хранения
+
+    Устаревшие логи из секции по умолчанию сначала переносятся в секции
+    своих месяцев (create_partition) и обрабатываются вместе с ними.
+    Если в секции по умолчанию остаются логи, в журнал пишется предупреждение:
+    для их месяцев нужно создать секции (ensure_partitions).
+
+    Returns:
+        Список месяцев обработанных секций
+    """
+    for month in expired_default_months(retention_months, today):
+        create_partition(month)
+
+    expired = expired_partitions(retention_months, today)
+    for month in expired:
+        remove_partition(month, action)
+
+    remaining = default_partition_months()
+    if remaining:
+        logger.warning(
+            f'В секции {DEFAULT_PARTITION} остаются логи за месяцы без секций: '
+            f'{", ".join(f"{month:%Y-%m}" for month in remaining)}'
+        )
+    return expired
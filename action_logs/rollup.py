@@ -0,0 +1,198 @@
+"""
+Суточные сводки журнала действий
+
+Статистика логов читается из таблицы ActionLogDailyStat (количество записей
+по дню, действию, роли и королевству пользователя), а не группировкой всей
+таблицы action_logs. Сводка за прошедшие дни пересчитывается периодической
+задачей rollup_action_logs и командой backfill_action_log_stats; текущий день
+считается по логам напрямую, поэтому статистика не отстает от журнала,
+а время ее расчета ограничено объемом одного дня.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ActionLog, ActionLogDailyStat
+
+# Сколько последних дней пересчитывает периодическая задача
+RECENT_DAYS = getattr(settings, 'ACTION_LOG_ROLLUP_RECENT_DAYS', 2)
+
+
+def day_bounds(day):
+    """Начало и конец суток в текущем часовом поясе"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def _aggregate(logs):
+    """Количество логов по ключу сводки (action, role, kingdom)"""
+    return logs.order_by().annotate(
+        stat_role=Coalesce(F('user__role'), Value('')),
+        stat_kingdom=F('kingdom'),
+    ).values('action', 'stat_role', 'stat_kingdom').annotate(count=Count('id'))
+
+
+def rollup_day(day):
+    """
+    Пересчет сводки за день
+
+    Args:
+        day: Дата (в текущем часовом поясе)
+
+    Returns:
+        Количество записей сводки за день
+    """
+    start, end = day_bounds(day)
+    rows = _aggregate(ActionLog.objects.filter(created_at__gte=start, created_at__lt=end))
+
+    with transaction.atomic():
+        ActionLogDailyStat.objects.filter(day=day).delete()
+        stats = ActionLogDailyStat.objects.bulk_create([
+            ActionLogDailyStat(
+                day=day,
+                action=row['action'],
+                role=row['stat_role'],
+                kingdom_id=row['stat_kingdom'],
+                count=row['count']
+            )
+            for row in rows
+        ])
+    return len(stats)
+
+
+def rollup_days(first_day, last_day):
+    """
+    Пересчет сводки за период (включительно)
+
+    Returns:
+        Количество пересчитанных дней
+    """
+    days = 0
+    day = first_day
+    while day <= last_day:
+        rollup_day(day)
+        day += timedelta(days=1)
+        days += 1
+    return days
+
+
+def rollup_recent(days=None):
+    """Пересчет сводки за последние дни, включая текущий"""
+    today = timezone.localdate()
+    return rollup_days(today - timedelta(days=(days or RECENT_DAYS) - 1), today)
+
+
+class _Statistics:
+    """Сводка за прошедшие дни вместе с живыми данными текущего дня"""
+
+    def __init__(self):
+        self.today = timezone.localdate()
+        self.closed = ActionLogDailyStat.objects.filter(day__lt=self.today)
+        self.live = list(_aggregate(
+            ActionLog.objects.filter(created_at__gte=day_bounds(self.today)[0])
+        ))
+        self.today_count = sum(row['count'] for row in self.live)
+
+    def total(self):
+        closed = self.closed.aggregate(total=Sum('count'))['total'] or 0
+        return closed + self.today_count
+
+    def since(self, first_day):
+        """Количество логов начиная с указанного дня"""
+        closed = self.closed.filter(day__gte=first_day).aggregate(total=Sum('count'))['total'] or 0
+        return closed + self.today_count
+
+    def daily(self, first_day):
+        days = list(
+            self.closed.filter(day__gte=first_day).values('day').annotate(
+                count=Sum('count')
+            ).order_by('day')
+        )
+        if self.today_count:
+            days.append({'day': self.today, 'count': self.today_count})
+        return days
+
+    def by(self, field, live_field):
+        """Количество логов по полю сводки, по убыванию"""
+        counts = Counter({
+            row[field]: row['count']
+            for row in self.closed.values(field).annotate(count=Sum('count')).order_by()
+        })
+        for row in self.live:
+            counts[row[live_field]] += row['count']
+        return counts.most_common()
+
+    def by_kingdom(self):
+        """Количество логов подданных по королевствам"""
+        stats = self.closed.filter(role='citizen', kingdom__isnull=False)
+        counts = Counter({
+            row['kingdom__name']: row['count']
+            for row in stats.values('kingdom__name').annotate(count=Sum('count')).order_by()
+        })
+        live_kingdoms = [
+            row for row in self.live
+            if row['stat_role'] == 'citizen' and row['stat_kingdom'] is not None
+        ]
+        if live_kingdoms:
+            from kingdom.models import Kingdom
+            names = dict(Kingdom.objects.filter(
+                id__in={row['stat_kingdom'] for row in live_kingdoms}
+            ).values_list('id', 'name'))
+            for row in live_kingdoms:
+                counts[names.get(row['stat_kingdom'])] += row['count']
+        return counts.most_common()
+
+
+def get_statistics(days=30):
+    """
+    Статистика логов для панели статистики и API
+
+    Args:
+        days: Глубина посуточной статистики
+
+    Returns:
+        Словарь total_logs, daily_stats, action_stats, role_stats, kingdom_stats
+    """
+    stats = _Statistics()
+    return {
+        'total_logs': stats.total(),
+        'daily_stats': stats.daily(stats.today - timedelta(days=days)),
+        'action_stats': [
+            {'action': action, 'count': count}
+            for action, count in stats.by('action', 'action')
+        ],
+        'role_stats': [
+            {'user__role': role, 'count': count}
+            for role, count in stats.by('role', 'stat_role')
+        ],
+        'kingdom_stats': [
+            {'user__citizen_profile__kingdom__name': name, 'count': count}
+            for name, count in stats.by_kingdom()
+        ],
+    }
+
+
+def get_dashboard_summary(top=5):
+    """
+    Краткая статистика для панели управления логами
+
+    Returns:
+        Словарь total_logs, today_logs, week_logs, top_actions
+    """
+    stats = _Statistics()
+    return {
+        'total_logs': stats.total(),
+        'today_logs': stats.today_count,
+        'week_logs': stats.since(stats.today - timedelta(days=7)),
+        'top_actions': [
+            {'action': action, 'count': count}
+            for action, count in stats.by('action', 'action')[:top]
+        ],
+    }
@@ -0,0 +1,84 @@
+"""
+Поиск по журналу действий
+
+Описание события ищется полнотекстово: колонка search_vector (tsvector)
+заполняется триггером при каждой записи и изменении лога и покрыта
+GIN-индексом (миграция 0010). Имя, фамилия и email пользователя ищутся
+по подстроке в таблице users; в PostgreSQL с расширением pg_trgm эти
+условия используют триграммные индексы (миграция users 0003), а логи
+отбираются по найденным пользователям через индекс user_id.
+
+Для других СУБД описание ищется по подстроке. В SQLite LIKE и UPPER не
+учитывают регистр только для ASCII, поэтому подстрока ищется через REGEXP
+(функция на Python), который сравнивает без учета регистра и кириллицу.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.db.models import Q
+
+# Конфигурация полнотекстового поиска, должна совпадать с триггером миграции 0010
+SEARCH_CONFIG = 'russian'
+
+
+def full_text_enabled():
+    """Доступен ли полнотекстовый поиск (только PostgreSQL)"""
+    return connection.vendor == 'postgresql'
+
+
+def contains(field, text):
+    """Условие: поле содержит text без учета регистра"""
+    if connection.vendor == 'sqlite':
+        return Q(**{f'{field}__iregex': re.escape(text)})
+    return Q(**{f'{field}__icontains': text})
+
+
+def matching_users(text):
+    """Подзапрос id пользователей, у которых имя, фамилия или email содержат text"""
+    return get_user_model().objects.filter(
+        contains('first_name', text) |
+        contains('last_name', text) |
+        contains('email', text)
+    ).values('pk')
+
+
+def filter_by_user(logs, text):
+    """
+    Фильтр логов по подстроке имени, фамилии или email пользователя
+
+    Args:
+        logs: QuerySet логов
+        text: Искомая подстрока
+
+    Returns:
+        Отфильтрованный QuerySet
+    """
+    return logs.filter(user__in=matching_users(text))
+
+
+def description_match(term):
+    """Условие совпадения описания лога со словом поиска"""
+    if full_text_enabled():
+        return Q(search_vector=SearchQuery(term, config=SEARCH_CONFIG))
+    return contains('description', term)
+
+
+def search_logs(logs, terms):
+    """
+    Поиск логов по словам
+
+    Каждое слово должно найтись в пользователе (имя, фамилия, email)
+    или в описании лога.
+
+    Args:
+        logs: QuerySet логов
+        terms: Список слов поиска
+
+    Returns:
+        Отфильтрованный QuerySet
+    """
+    for term in terms:
+        logs = logs.filter(Q(user__in=matching_users(term)) | description_match(term))
+    return logs
@@ -0,0 +1,128 @@
+from celery import shared_task
+import logging
+import tempfile
+
+from .export import EXPORT_TIMEOUT
+from .writer import write_events
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def write_action_logs(events):
+    """
+    Запись пачки событий журнала действий (режим ACTION_LOG_WRITE_MODE=async)
+    """
+    written, failed = write_events(events)
+    if failed:
+        logger.error(f'Не записано событий журнала: {failed} из {len(events)}')
+    return written
+
+
+@shared_task(soft_time_limit=EXPORT_TIMEOUT)
+def run_export_job(job_id):
+    """
+    Фоновый экспорт логов по задаче ExportJob
+    
+    Логи читаются порциями, после каждой порции обновляется прогресс задачи.
+    Готовый файл сохраняется в хранилище файлов по умолчанию. Если экспорт
+    прервался (ошибка, остановка воркера, превышение EXPORT_TIMEOUT),
+    задача помечается failed.
+    """
+    from django.core.files import File
+    from django.utils import timezone
+
+    from .archive import archived_count
+    from .export import archive_params, estimate_export_rows, export_filename, filter_logs, write_export
+    from .models import ActionLog, ExportJob
+
+    # Задачу забирает только один воркер
+    claimed = ExportJob.objects.filter(pk=job_id, status='pending').update(
+        status='running',
+        started_at=timezone.now()
+    )
+    if not claimed:
+        logger.warning(f'Задача экспорта {job_id} не найдена или уже выполняется')
+        return None
+
+    job = ExportJob.objects.get(pk=job_id)
+    jobs = ExportJob.objects.filter(pk=job_id)
+    error = 'Экспорт прерван'
+
+    try:
+        logs = filter_logs(ActionLog.objects.order_by('-created_at'), job.filters)
+        archive = archive_params(job.filters)
+        total_rows = estimate_export_rows(logs)
+        if archive is not None:
+            total_rows += archived_count(archive)
+        jobs.update(total_rows=total_rows)
+
+        with tempfile.TemporaryFile() as output:
+            rows = write_export(
+                logs,
+                job.export_format,
+                output,
+                progress=lambda processed: jobs.update(processed_rows=processed),
+                archive=archive
+            )
+            output.seek(0)
+            job.file.save(export_filename(job.export_format), File(output), save=False)
+
+        jobs.update(
+            status='completed',
+            file=job.file.name,
+            total_rows=rows,
+            processed_rows=rows,
+            completed_at=timezone.now()
+        )
+        logger.info(f'Экспорт {job_id} завершен: {rows} записей')
+        return rows
+
+    except Exception as e:
+        logger.error(f'Ошибка фонового экспорта {job_id}: {str(e)}')
+        error = str(e)
+        return None
+
+    finally:
+        # Не завершенная задача не должна остаться в статусе running
+        jobs.filter(status='running').update(status='failed', error=error, completed_at=timezone.now())
+
+
+@shared_task
+def fail_stale_export_jobs():
+    """
+    Пометка failed задач экспорта, прерванных вместе с воркером (ACTION_LOG_EXPORT_TIMEOUT)
+    """
+    from .export import fail_stale_export_jobs as fail_stale
+
+    failed = fail_stale()
+    if failed:
+        logger.warning(f'Прерванных задач экспорта помечено failed: {failed}')
+    return failed
+
+
+@shared_task
+def rollup_action_logs(days=None):
+    """
+    Пересчет суточной сводки логов за последние дни (ACTION_LOG_ROLLUP_RECENT_DAYS)
+    """
+    from .rollup import rollup_recent
+
+    return rollup_recent(days)
+
+
+@shared_task
+def maintain_action_log_partitions():
+    """
+    Создание секций журнала на следующие месяцы и обработка устаревших
+    (ACTION_LOG_PARTITION_MONTHS_AHEAD, ACTION_LOG_RETENTION_MONTHS)
+    """
+    from .partitions import apply_retention, ensure_partitions, is_partitioned
+
+    if not is_partitioned():
+        return None
+    created = ensure_partitions()
+    removed = apply_retention()
+    if created or removed:
+        logger.info(f'Секции журнала: создано {len(created)}, обработано устаревших {len(removed)}')
+    return len(created), len(removed)
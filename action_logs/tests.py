@@ -1,10 +1,26 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 
-from .models import ActionLog
-from .utils import log_user_action, log_login, log_logout, log_registration
+from .models import ActionLog, ActionLogDailyStat, ExportJob
+from .rollup import get_statistics, get_dashboard_summary, rollup_day, rollup_recent
+from .utils import log_user_action, log_login, log_logout, log_registration, get_kingdom_activity_logs
+from .writer import ActionLogWriter
+from .export import write_xlsx
+from .pagination import keyset_paginate, approximate_count
+from .tasks import run_export_job
+from . import archive, partitions, search
 
 User = get_user_model()
 
@@ -96,3 +112,1136 @@ class ActionLogUtilsTest(TestCase):
         log = ActionLog.objects.get(user=self.user, action='register')
         self.assertIn('Регистрация пользователя', log.description)
         self.assertEqual(log.metadata['role'], 'citizen')
+
+
+class ActionLogWriterTest(TestCase):
+    """Тесты для буферизованной записи журнала"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='User',
+            role='citizen'
+        )
+    
+    def test_sync_mode_writes_immediately(self):
+        """Тест немедленной записи в режиме sync"""
+        writer = ActionLogWriter(mode='sync', autostart=False)
+        writer.write(user=self.user, action='login', description='Test login')
+        
+        self.assertTrue(ActionLog.objects.filter(user=self.user, action='login').exists())
+        self.assertEqual(writer.metrics()['written'], 1)
+    
+    def test_buffered_mode_flushes_batch(self):
+        """Тест пакетной записи накопленных событий одним запросом"""
+        writer = ActionLogWriter(mode='buffered', batch_size=10, autostart=False)
+        event_time = timezone.now() - timedelta(minutes=5)
+        for _ in range(3):
+            writer.write(user=self.user, action='login', created_at=event_time)
+        
+        self.assertEqual(ActionLog.objects.count(), 0)
+        self.assertEqual(writer.metrics()['queue_depth'], 3)
+        
+        with self.assertNumQueries(4):  # королевства пользователей, savepoint, INSERT, release savepoint
+            self.assertEqual(writer.flush(), 3)
+        
+        self.assertEqual(ActionLog.objects.filter(created_at=event_time).count(), 3)
+        metrics = writer.metrics()
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['written'], 3)
+    
+    def test_buffered_mode_flushes_on_batch_size(self):
+        """Тест записи по достижении размера пачки"""
+        writer = ActionLogWriter(mode='buffered', batch_size=2, autostart=False)
+        writer.write(user=self.user, action='login')
+        self.assertEqual(ActionLog.objects.count(), 0)
+        
+        writer.write(user=self.user, action='logout')
+        self.assertEqual(ActionLog.objects.count(), 2)
+    
+    def test_queue_overflow_drops_events(self):
+        """Тест учета отброшенных событий при переполнении очереди"""
+        writer = ActionLogWriter(mode='buffered', batch_size=100, max_queue_size=2, autostart=False)
+        for _ in range(5):
+            writer.write(user=self.user, action='login')
+        
+        metrics = writer.metrics()
+        self.assertEqual(metrics['enqueued'], 2)
+        self.assertEqual(metrics['dropped'], 3)
+        self.assertEqual(metrics['queue_depth'], 2)
+    
+    @skipUnless(connection.vendor == 'postgresql', 'Некорректный IP отклоняет только тип inet PostgreSQL')
+    def test_failed_event_does_not_lose_batch(self):
+        """Тест записи остальных событий пачки при ошибке одного из них"""
+        writer = ActionLogWriter(mode='buffered', batch_size=10, autostart=False)
+        writer.write(user=self.user, action='login')
+        writer.write(user=self.user, action='login', ip_address='not-an-ip')
+        writer.flush()
+        
+        self.assertEqual(ActionLog.objects.count(), 1)
+        metrics = writer.metrics()
+        self.assertEqual(metrics['written'], 1)
+        self.assertEqual(metrics['failed'], 1)
+    
+    def test_async_mode_hands_batch_to_celery(self):
+        """Тест передачи пачки задаче Celery"""
+        from hart_citizens_project.celery import app
+        
+        writer = ActionLogWriter(mode='async', batch_size=10, autostart=False)
+        writer.write(user=self.user, action='login', metadata={'source': 'api'})
+        
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        try:
+            writer.flush()
+        finally:
+            app.conf.task_always_eager = eager
+        
+        log = ActionLog.objects.get(user=self.user)
+        self.assertEqual(log.metadata, {'source': 'api'})
+    
+    def test_stop_flushes_pending_events(self):
+        """Тест записи оставшихся событий при остановке"""
+        writer = ActionLogWriter(mode='buffered', batch_size=10, autostart=False)
+        writer.write(user=self.user, action='login')
+        writer.stop()
+        
+        self.assertEqual(ActionLog.objects.count(), 1)
+
+
+class ActionLogExportTest(TestCase):
+    """Тесты для потокового экспорта логов"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123',
+            first_name='Admin',
+            last_name='User',
+            role='citizen',
+            is_staff=True
+        )
+        cls.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='User',
+            role='citizen'
+        )
+        ActionLog.objects.bulk_create([
+            ActionLog(user=cls.user, action='login', description=f'Вход {i}', metadata={'n': i})
+            for i in range(10050)
+        ])
+        ActionLog.objects.create(user=cls.user, action='logout', description='Выход')
+    
+    def setUp(self):
+        self.client.force_login(self.admin)
+    
+    def test_csv_export_is_streamed_without_cap(self):
+        """Тест потокового CSV экспорта без ограничения в 10000 строк"""
+        response = self.client.get(reverse('action_logs:export_logs'), {'format': 'csv'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0][0], 'Дата')
+        self.assertEqual(len(rows) - 1, 10051)
+    
+    def test_csv_export_applies_filters(self):
+        """Тест фильтрации экспортируемых логов"""
+        response = self.client.get(reverse('action_logs:export_logs'), {'format': 'csv', 'action': 'logout'})
+        
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][5], 'Выход')
+    
+    def test_xlsx_export_does_not_touch_working_directory(self):
+        """Тест XLSX экспорта без файлов в рабочем каталоге"""
+        from openpyxl import load_workbook
+        
+        with tempfile.TemporaryDirectory() as workdir:
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                response = self.client.get(reverse('action_logs:export_logs'), {'action': 'logout'})
+                content = b''.join(response.streaming_content)
+                self.assertEqual(os.listdir(workdir), [])
+            finally:
+                os.chdir(cwd)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        worksheet = load_workbook(io.BytesIO(content), read_only=True).active
+        rows = list(worksheet.values)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][2], 'test@example.com')
+    
+    def test_write_xlsx_reports_progress(self):
+        """Тест отчета о прогрессе при записи XLSX порциями"""
+        progress = []
+        rows = write_xlsx(ActionLog.objects.all(), io.BytesIO(), chunk_size=5000, progress=progress.append)
+        
+        self.assertEqual(rows, 10051)
+        self.assertEqual(progress, [5000, 10000, 10051])
+    
+    def test_api_export_csv(self):
+        """Тест экспорта через API"""
+        response = self.client.get('/api/action-logs/logs/export/', {'export_format': 'csv', 'action': 'logout'})
+        
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))), 2)
+    
+    def test_unknown_format(self):
+        """Тест неподдерживаемого формата экспорта"""
+        response = self.client.get(reverse('action_logs:export_logs'), {'format': 'pdf'})
+        
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportJobTest(TestCase):
+    """Тесты для фоновых задач экспорта"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123',
+            first_name='Admin',
+            last_name='User',
+            role='citizen',
+            is_staff=True
+        )
+        ActionLog.objects.bulk_create([
+            ActionLog(user=cls.admin, action='login', description=f'Вход {i}')
+            for i in range(25)
+        ])
+        ActionLog.objects.create(user=cls.admin, action='logout', description='Выход')
+    
+    def setUp(self):
+        from hart_citizens_project.celery import app
+        
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', eager)
+        
+        self.client.force_login(self.admin)
+    
+    def test_create_and_poll_job(self):
+        """Тест создания задачи экспорта и получения ее статуса"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/action-logs/export-jobs/',
+                {'export_format': 'csv', 'filters': {'action': 'login'}},
+                content_type='application/json'
+            )
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'pending')
+        
+        response = self.client.get(f'/api/action-logs/export-jobs/{response.json()["id"]}/')
+        data = response.json()
+        self.assertEqual(data['status'], 'completed')
+        self.assertEqual(data['processed_rows'], 25)
+        self.assertEqual(data['progress'], 100)
+        
+        response = self.client.get(data['download_url'])
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))), 26)
+    
+    def test_task_reports_progress_by_chunks(self):
+        """Тест обновления прогресса после каждой порции"""
+        job = ExportJob.objects.create(user=self.admin, export_format='xlsx')
+        
+        updates = []
+        original_update = ExportJob.objects.none().update.__func__
+        
+        def track_update(queryset, **kwargs):
+            if 'processed_rows' in kwargs:
+                updates.append(kwargs['processed_rows'])
+            return original_update(queryset, **kwargs)
+        
+        with patch('action_logs.export.CHUNK_SIZE', 10), \
+                patch('django.db.models.query.QuerySet.update', track_update):
+            self.assertEqual(run_export_job(str(job.pk)), 26)
+        
+        self.assertEqual(updates, [10, 20, 26, 26])
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.total_rows, 26)
+        self.assertTrue(job.file.name.endswith('.xlsx'))
+        self.assertTrue(os.path.exists(job.file.path))
+    
+    def test_job_is_claimed_once(self):
+        """Тест повторного запуска уже выполненной задачи"""
+        job = ExportJob.objects.create(user=self.admin, export_format='csv')
+        
+        self.assertEqual(run_export_job(str(job.pk)), 26)
+        self.assertIsNone(run_export_job(str(job.pk)))
+    
+    def test_download_before_completion(self):
+        """Тест скачивания незавершенного экспорта"""
+        job = ExportJob.objects.create(user=self.admin, export_format='csv')
+        
+        response = self.client.get(f'/api/action-logs/export-jobs/{job.pk}/download/')
+        self.assertEqual(response.status_code, 409)
+    
+    def test_export_view_runs_in_background_on_request(self):
+        """Тест перевода экспорта в фоновый режим"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(
+                reverse('action_logs:export_logs'),
+                {'format': 'csv', 'action': 'logout', 'background': '1'}
+            )
+        
+        self.assertEqual(response.status_code, 202)
+        job = ExportJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual(job.filters, {'action': 'logout'})
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.total_rows, 1)
+    
+    def test_api_export_runs_in_background_above_threshold(self):
+        """Тест автоматического фонового экспорта больших выборок"""
+        with patch('action_logs.export.BACKGROUND_THRESHOLD', 10):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get('/api/action-logs/logs/export/')
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ExportJob.objects.get(pk=response.json()['id']).status, 'completed')
+
+    
+    def test_background_decision_bounded_count(self):
+        """Тест подсчета записей только до порога фонового экспорта"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .export import should_run_in_background
+        
+        logs = ActionLog.objects.all()
+        with patch('action_logs.export.BACKGROUND_THRESHOLD', 1):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertTrue(should_run_in_background(logs, {}))
+        self.assertIn('LIMIT 2', ctx.captured_queries[0]['sql'])
+        with patch('action_logs.export.BACKGROUND_THRESHOLD', logs.count()):
+            self.assertFalse(should_run_in_background(logs, {}))
+    
+    def test_task_counts_rows_up_to_threshold(self):
+        """Тест подсчета строк задачи экспорта без полного COUNT выборки"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        job = ExportJob.objects.create(user=self.admin, export_format='csv')
+        
+        with patch('action_logs.export.BACKGROUND_THRESHOLD', 100):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(run_export_job(str(job.pk)), 26)
+        
+        counts = [q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT 101', counts[0])
+    
+    def test_failed_export_marks_job(self):
+        """Тест пометки задачи failed при ошибке экспорта"""
+        job = ExportJob.objects.create(user=self.admin, export_format='csv')
+        
+        with patch('action_logs.export.write_export', side_effect=OSError('Диск заполнен')):
+            self.assertIsNone(run_export_job(str(job.pk)))
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'Диск заполнен')
+        self.assertIsNotNone(job.completed_at)
+    
+    def test_interrupted_export_marks_job(self):
+        """Тест пометки задачи failed при остановке воркера во время экспорта"""
+        job = ExportJob.objects.create(user=self.admin, export_format='csv')
+        
+        with patch('action_logs.export.write_export', side_effect=SystemExit(1)):
+            with self.assertRaises(SystemExit):
+                run_export_job(str(job.pk))
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'Экспорт прерван')
+    
+    def test_stale_running_jobs_failed(self):
+        """Тест пометки failed задач, оставшихся в статусе running"""
+        from .tasks import fail_stale_export_jobs
+        
+        stale = ExportJob.objects.create(
+            user=self.admin,
+            status='running',
+            started_at=timezone.now() - timedelta(hours=2)
+        )
+        recent = ExportJob.objects.create(user=self.admin, status='running', started_at=timezone.now())
+        
+        with patch('action_logs.export.EXPORT_TIMEOUT', 60 * 60):
+            self.assertEqual(fail_stale_export_jobs(), 1)
+        
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertIsNotNone(stale.completed_at)
+        self.assertEqual(recent.status, 'running')
+
+class ActionLogRollupTest(TestCase):
+    """Тесты для суточной сводки логов"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        from kingdom.models import Kingdom, King, Citizen
+        
+        cls.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        cls.citizen_user = User.objects.create_user(
+            username='citizen',
+            email='citizen@example.com',
+            password='testpass123',
+            first_name='Citizen',
+            last_name='User',
+            role='citizen'
+        )
+        Citizen.objects.create(
+            user=cls.citizen_user,
+            kingdom=cls.kingdom,
+            age=25,
+            pigeon_email='citizen@example.com'
+        )
+        cls.king_user = User.objects.create_user(
+            username='king',
+            password='testpass123',
+            first_name='King',
+            last_name='User',
+            role='king'
+        )
+        King.objects.create(user=cls.king_user, kingdom=cls.kingdom)
+        
+        cls.today = timezone.localdate()
+        cls.three_days_ago = timezone.now() - timedelta(days=3)
+        logs = [
+            ActionLog(user=cls.citizen_user, kingdom=cls.kingdom, action='login', created_at=cls.three_days_ago),
+            ActionLog(user=cls.citizen_user, kingdom=cls.kingdom, action='login', created_at=cls.three_days_ago),
+            ActionLog(user=cls.citizen_user, kingdom=cls.kingdom, action='test_start', created_at=cls.three_days_ago),
+            ActionLog(user=cls.king_user, kingdom=cls.kingdom, action='login', created_at=cls.three_days_ago),
+            ActionLog(user=cls.king_user, kingdom=cls.kingdom, action='enrollment'),
+            ActionLog(user=cls.citizen_user, kingdom=cls.kingdom, action='login'),
+        ]
+        ActionLog.objects.bulk_create(logs)
+    
+    def _raw_statistics(self):
+        """Статистика, посчитанная прямыми запросами к журналу"""
+        from django.db.models import Count
+        
+        return {
+            'total_logs': ActionLog.objects.count(),
+            'action_stats': {
+                row['action']: row['count']
+                for row in ActionLog.objects.values('action').annotate(count=Count('id'))
+            },
+            'role_stats': {
+                row['user__role']: row['count']
+                for row in ActionLog.objects.values('user__role').annotate(count=Count('id'))
+            },
+            'kingdom_stats': {
+                row['user__citizen_profile__kingdom__name']: row['count']
+                for row in ActionLog.objects.filter(
+                    user__citizen_profile__isnull=False
+                ).values('user__citizen_profile__kingdom__name').annotate(count=Count('id'))
+            },
+        }
+    
+    def test_rollup_day_groups_by_key(self):
+        """Тест группировки сводки по действию, роли и королевству"""
+        day = timezone.localdate(self.three_days_ago)
+        self.assertEqual(rollup_day(day), 3)
+        
+        stat = ActionLogDailyStat.objects.get(day=day, action='login', role='citizen')
+        self.assertEqual(stat.count, 2)
+        self.assertEqual(stat.kingdom, self.kingdom)
+        self.assertEqual(
+            ActionLogDailyStat.objects.get(day=day, action='login', role='king').kingdom,
+            self.kingdom
+        )
+    
+    def test_rollup_is_idempotent(self):
+        """Тест повторного пересчета дня"""
+        day = timezone.localdate(self.three_days_ago)
+        rollup_day(day)
+        rollup_day(day)
+        
+        self.assertEqual(ActionLogDailyStat.objects.filter(day=day).count(), 3)
+    
+    def test_statistics_match_raw_queries(self):
+        """Тест совпадения статистики из сводки с прямыми запросами"""
+        call_command('backfill_action_log_stats', stdout=io.StringIO())
+        
+        stats = get_statistics()
+        raw = self._raw_statistics()
+        self.assertEqual(stats['total_logs'], raw['total_logs'])
+        self.assertEqual({row['action']: row['count'] for row in stats['action_stats']}, raw['action_stats'])
+        self.assertEqual({row['user__role']: row['count'] for row in stats['role_stats']}, raw['role_stats'])
+        self.assertEqual(
+            {row['user__citizen_profile__kingdom__name']: row['count'] for row in stats['kingdom_stats']},
+            raw['kingdom_stats']
+        )
+        self.assertEqual(
+            [(row['day'], row['count']) for row in stats['daily_stats']],
+            [(timezone.localdate(self.three_days_ago), 4), (self.today, 2)]
+        )
+    
+    def test_today_is_counted_without_rollup(self):
+        """Тест учета текущего дня до пересчета сводки"""
+        rollup_day(timezone.localdate(self.three_days_ago))
+        ActionLog.objects.create(user=self.citizen_user, kingdom=self.kingdom, action='logout')
+        
+        summary = get_dashboard_summary()
+        self.assertEqual(summary['total_logs'], 7)
+        self.assertEqual(summary['today_logs'], 3)
+        self.assertEqual(summary['week_logs'], 7)
+        self.assertEqual(summary['top_actions'][0], {'action': 'login', 'count': 4})
+    
+    def test_statistics_query_count_does_not_depend_on_volume(self):
+        """Тест постоянного числа запросов статистики"""
+        rollup_recent(days=5)
+        with self.assertNumQueries(7):
+            get_statistics()
+        
+        ActionLog.objects.bulk_create([
+            ActionLog(user=self.citizen_user, kingdom=self.kingdom, action='login', created_at=self.three_days_ago)
+            for _ in range(50)
+        ])
+        rollup_recent(days=5)
+        with self.assertNumQueries(7):
+            stats = get_statistics()
+        self.assertEqual(stats['total_logs'], 56)
+    
+    def test_statistics_api(self):
+        """Тест API статистики логов"""
+        admin = User.objects.create_user(
+            username='admin',
+            password='testpass123',
+            first_name='Admin',
+            last_name='User',
+            role='king',
+            is_staff=True
+        )
+        rollup_recent(days=5)
+        self.client.force_login(admin)
+        
+        response = self.client.get('/api/action-logs/logs/statistics/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_logs'], 6)
+        self.assertIn('writer', response.json())
+
+
+class ActionLogKeysetPaginationTest(TestCase):
+    """Тесты для keyset-пагинации логов"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='User',
+            role='citizen'
+        )
+        now = timezone.now()
+        # Часть записей с одинаковым временем, чтобы проверить порядок по id
+        ActionLog.objects.bulk_create(
+            [ActionLog(user=cls.user, action='login', created_at=now - timedelta(minutes=i)) for i in range(30)] +
+            [ActionLog(user=cls.user, action='logout', created_at=now - timedelta(minutes=10)) for _ in range(15)]
+        )
+        cls.expected = list(ActionLog.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+    
+    def test_walk_forward_and_backward(self):
+        """Тест обхода всех страниц вперед и назад"""
+        pages = []
+        page = keyset_paginate(ActionLog.objects.all(), per_page=7)
+        self.assertFalse(page.has_previous)
+        pages.append([log.id for log in page])
+        while page.has_next:
+            page = keyset_paginate(ActionLog.objects.all(), page.next_cursor, per_page=7)
+            pages.append([log.id for log in page])
+        
+        self.assertEqual([pk for ids in pages for pk in ids], self.expected)
+        self.assertEqual(len(pages), 7)
+        
+        backward = [[log.id for log in page]]
+        while page.has_previous:
+            page = keyset_paginate(ActionLog.objects.all(), page.previous_cursor, per_page=7)
+            backward.append([log.id for log in page])
+        
+        self.assertEqual(list(reversed(backward)), pages)
+    
+    def test_ascending_order(self):
+        """Тест обхода от старых записей к новым"""
+        page = keyset_paginate(ActionLog.objects.all(), per_page=40, descending=False)
+        page = keyset_paginate(ActionLog.objects.all(), page.next_cursor, per_page=40, descending=False)
+        
+        self.assertEqual([log.id for log in page], list(reversed(self.expected))[40:])
+        self.assertFalse(page.has_next)
+    
+    def test_invalid_cursor(self):
+        """Тест поврежденного курсора"""
+        with self.assertRaises(ValueError):
+            keyset_paginate(ActionLog.objects.all(), 'not-a-cursor')
+    
+    def test_deep_page_uses_single_query(self):
+        """Тест выборки страницы одним запросом без COUNT и OFFSET"""
+        page = keyset_paginate(ActionLog.objects.all(), per_page=40)
+        
+        with self.assertNumQueries(1) as context:
+            keyset_paginate(ActionLog.objects.all(), page.next_cursor, per_page=40)
+        sql = context.captured_queries[0]['sql']
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT', sql)
+    
+    def test_approximate_count(self):
+        """Тест оценки количества записей"""
+        self.assertIsInstance(approximate_count(ActionLog.objects.all()), int)
+        self.assertIsInstance(approximate_count(ActionLog.objects.filter(action='logout')), int)
+    
+    def test_api_cursor_pagination(self):
+        """Тест курсорной пагинации в API"""
+        self.client.force_login(self.user)
+        
+        ids = []
+        url = '/api/action-logs/logs/?page_size=20&with_count=1'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn('count', data)
+            self.assertIsInstance(data['approximate_count'], int)
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+        
+        self.assertEqual(ids, [str(pk) for pk in self.expected])
+    
+    def test_api_invalid_cursor(self):
+        """Тест поврежденного курсора в API"""
+        self.client.force_login(self.user)
+        
+        response = self.client.get('/api/action-logs/logs/', {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ActionLogKingdomTest(TestCase):
+    """Тесты для королевства в логах действий"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        from kingdom.models import Kingdom, King, Citizen
+        
+        cls.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        cls.other_kingdom = Kingdom.objects.create(name='Other Kingdom')
+        cls.citizen_user = User.objects.create_user(
+            username='citizen',
+            email='citizen@example.com',
+            password='testpass123',
+            first_name='Citizen',
+            last_name='User',
+            role='citizen'
+        )
+        cls.citizen = Citizen.objects.create(
+            user=cls.citizen_user,
+            kingdom=cls.kingdom,
+            age=25,
+            pigeon_email='citizen@example.com'
+        )
+        cls.king_user = User.objects.create_user(
+            username='king',
+            password='testpass123',
+            first_name='King',
+            last_name='User',
+            role='king'
+        )
+        King.objects.create(user=cls.king_user, kingdom=cls.kingdom)
+        cls.other_user = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='testpass123',
+            first_name='Other',
+            last_name='User',
+            role='citizen'
+        )
+        Citizen.objects.create(
+            user=cls.other_user,
+            kingdom=cls.other_kingdom,
+            age=30,
+            pigeon_email='other@example.com'
+        )
+    
+    def test_writer_resolves_kingdom_in_one_query(self):
+        """Тест определения королевств пачки одним запросом"""
+        writer = ActionLogWriter(mode='buffered', batch_size=10, autostart=False)
+        # Профили пользователей не загружены
+        for user in User.objects.filter(pk__in=[self.citizen_user.pk, self.king_user.pk, self.other_user.pk]):
+            writer.write(user=user, action='login')
+        
+        with self.assertNumQueries(4):
+            writer.flush()
+        
+        self.assertEqual(ActionLog.objects.get(user=self.citizen_user).kingdom, self.kingdom)
+        self.assertEqual(ActionLog.objects.get(user=self.king_user).kingdom, self.kingdom)
+        self.assertEqual(ActionLog.objects.get(user=self.other_user).kingdom, self.other_kingdom)
+    
+    def test_loaded_profile_is_used(self):
+        """Тест использования уже загруженного профиля без запроса"""
+        user = User.objects.select_related('citizen_profile').get(pk=self.citizen_user.pk)
+        writer = ActionLogWriter(mode='buffered', batch_size=10, autostart=False)
+        writer.write(user=user, action='login')
+        
+        with self.assertNumQueries(3):
+            writer.flush()
+        self.assertEqual(ActionLog.objects.get(user=user).kingdom, self.kingdom)
+    
+    def test_kingdom_logs_use_stored_kingdom(self):
+        """Тест выборки логов королевства по сохраненному королевству"""
+        log_user_action(self.citizen_user, 'login')
+        log_user_action(self.king_user, 'login')
+        log_user_action(self.other_user, 'login')
+        
+        logs = get_kingdom_activity_logs(self.kingdom)
+        self.assertEqual({log.user for log in logs}, {self.citizen_user, self.king_user})
+        self.assertNotIn('JOIN', str(logs.query))
+        
+        self.client.force_login(self.king_user)
+        response = self.client.get('/api/action-logs/logs/kingdom_logs/')
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Секционирование есть только в PostgreSQL')
+class ActionLogPartitionTest(TestCase):
+    """Тесты для помесячных секций журнала действий"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='partition',
+            email='partition@example.com',
+            password='testpass123',
+            first_name='Partition',
+            last_name='User',
+            role='citizen'
+        )
+    
+    def _log(self, created_at):
+        return ActionLog.objects.create(
+            user=self.user,
+            action='login',
+            description='Вход',
+            created_at=created_at
+        )
+    
+    def _table(self, log):
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT tableoid::regclass::text FROM action_logs WHERE id = %s',
+                [log.pk]
+            )
+            return cursor.fetchone()[0]
+    
+    def test_table_is_partitioned(self):
+        """Тест секционирования таблицы и секций на будущие месяцы"""
+        self.assertTrue(partitions.is_partitioned())
+        current = partitions.month_start(date.today())
+        months = partitions.list_partitions()
+        for offset in range(partitions.MONTHS_AHEAD + 1):
+            self.assertIn(partitions.add_months(current, offset), months)
+    
+    def test_log_lands_in_month_partition(self):
+        """Тест записи лога в секцию своего месяца"""
+        log = self._log(timezone.now())
+        self.assertEqual(self._table(log), partitions.partition_name(date.today()))
+        
+        old_log = self._log(datetime(2001, 5, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(self._table(old_log), partitions.DEFAULT_PARTITION)
+    
+    def test_create_partition_moves_rows_from_default(self):
+        """Тест переноса логов из секции по умолчанию в новую секцию"""
+        log = self._log(datetime(2001, 5, 10, tzinfo=dt_timezone.utc))
+        other = self._log(datetime(2001, 6, 1, tzinfo=dt_timezone.utc))
+        
+        self.assertTrue(partitions.create_partition(date(2001, 5, 1)))
+        self.assertFalse(partitions.create_partition(date(2001, 5, 20)))
+        
+        self.assertEqual(self._table(log), 'action_logs_p200105')
+        self.assertEqual(self._table(other), partitions.DEFAULT_PARTITION)
+        self.assertEqual(ActionLog.objects.count(), 2)
+    
+    def test_ensure_partitions(self):
+        """Тест создания секций на месяцы вперед"""
+        created = partitions.ensure_partitions(months_ahead=2, today=date(2001, 11, 15))
+        self.assertEqual(created, [date(2001, 11, 1), date(2001, 12, 1), date(2002, 1, 1)])
+        self.assertEqual(partitions.ensure_partitions(months_ahead=2, today=date(2001, 11, 15)), [])
+    
+    def test_retention_drop(self):
+        """Тест удаления секций старше срока хранения"""
+        partitions.ensure_partitions(months_ahead=2, today=date(2001, 1, 1))
+        expired_log = self._log(datetime(2001, 1, 15, tzinfo=dt_timezone.utc))
+        kept_log = self._log(datetime(2001, 3, 15, tzinfo=dt_timezone.utc))
+        
+        self.assertEqual(partitions.expired_partitions(0), [])
+        removed = partitions.apply_retention(
+            retention_months=1, action='drop', today=date(2001, 3, 20)
+        )
+        
+        self.assertEqual(removed, [date(2001, 1, 1)])
+        self.assertIn(date(2001, 2, 1), partitions.list_partitions())
+        self.assertNotIn(date(2001, 1, 1), partitions.list_partitions())
+        self.assertFalse(ActionLog.objects.filter(pk=expired_log.pk).exists())
+        self.assertTrue(ActionLog.objects.filter(pk=kept_log.pk).exists())
+    
+    def test_retention_includes_default_partition(self):
+        """Тест обработки устаревших логов из секции по умолчанию"""
+        from django.db import connection
+        
+        expired_log = self._log(datetime(2000, 12, 15, tzinfo=dt_timezone.utc))
+        kept_log = self._log(datetime(2001, 3, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(self._table(expired_log), partitions.DEFAULT_PARTITION)
+        
+        self.assertEqual(
+            partitions.expired_default_months(retention_months=1, today=date(2001, 3, 20)),
+            [date(2000, 12, 1)]
+        )
+        with self.assertLogs('action_logs.partitions', 'WARNING') as logs:
+            removed = partitions.apply_retention(
+                retention_months=1, action='detach', today=date(2001, 3, 20)
+            )
+        
+        self.assertEqual(removed, [date(2000, 12, 1)])
+        self.assertIn('2001-03', logs.output[0])
+        self.assertFalse(ActionLog.objects.filter(pk=expired_log.pk).exists())
+        self.assertEqual(self._table(kept_log), partitions.DEFAULT_PARTITION)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM action_logs_p200012')
+            self.assertEqual(cursor.fetchone()[0], 1)
+    
+    def test_retention_detach(self):
+        """Тест отсоединения секций старше срока хранения"""
+        from django.db import connection
+        
+        partitions.create_partition(date(2001, 1, 1))
+        log = self._log(datetime(2001, 1, 15, tzinfo=dt_timezone.utc))
+        
+        partitions.remove_partition(date(2001, 1, 1), 'detach')
+        
+        self.assertFalse(ActionLog.objects.filter(pk=log.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM action_logs_p200101')
+            self.assertEqual(cursor.fetchone()[0], 1)
+    
+    def test_remove_partition_invalid_action(self):
+        """Тест неизвестного действия с секцией"""
+        with self.assertRaises(ValueError):
+            partitions.remove_partition(date(2001, 1, 1), 'truncate')
+    
+    def test_orm_paths(self):
+        """Тест чтения, пагинации, статистики и удаления по секционированной таблице"""
+        now = timezone.now()
+        logs = [self._log(now - timedelta(days=40 * i)) for i in range(3)]
+        
+        page = keyset_paginate(ActionLog.objects.all(), per_page=2)
+        self.assertEqual([log.pk for log in page], [logs[0].pk, logs[1].pk])
+        page = keyset_paginate(ActionLog.objects.all(), cursor=page.next_cursor, per_page=2)
+        self.assertEqual([log.pk for log in page], [logs[2].pk])
+        
+        self.assertGreaterEqual(approximate_count(ActionLog.objects.all()), 0)
+        self.assertEqual(get_statistics()['total_logs'], 1)
+        
+        ActionLog.objects.filter(pk=logs[2].pk).update(description='Изменено')
+        self.assertEqual(ActionLog.objects.get(pk=logs[2].pk).description, 'Изменено')
+        
+        self.user.delete()
+        self.assertEqual(ActionLog.objects.count(), 0)
+    
+    def test_command(self):
+        """Тест команды управления секциями"""
+        partitions.create_partition(date(2001, 1, 1))
+        default_log = self._log(datetime(2001, 2, 10, tzinfo=dt_timezone.utc))
+        out = io.StringIO()
+        
+        call_command('manage_action_log_partitions', '--retention-months', '12', '--dry-run', stdout=out)
+        self.assertIn('action_logs_p200101', out.getvalue())
+        self.assertIn(f'{partitions.DEFAULT_PARTITION}: 2001-02', out.getvalue())
+        self.assertIn(date(2001, 1, 1), partitions.list_partitions())
+        
+        call_command(
+            'manage_action_log_partitions', '--retention-months', '12', '--action', 'drop', stdout=out
+        )
+        self.assertNotIn(date(2001, 1, 1), partitions.list_partitions())
+        self.assertFalse(ActionLog.objects.filter(pk=default_log.pk).exists())
+
+
+class ActionLogArchiveTest(TestCase):
+    """Тесты для холодного архива логов"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123',
+            first_name='Admin',
+            last_name='User',
+            role='citizen',
+            is_staff=True
+        )
+        cls.user = User.objects.create_user(
+            username='archived',
+            email='archived@example.com',
+            password='testpass123',
+            first_name='Archived',
+            last_name='User',
+            role='citizen'
+        )
+        now = timezone.now()
+        cls.old_logs = ActionLog.objects.bulk_create([
+            ActionLog(
+                user=cls.user,
+                action='login' if i % 2 else 'logout',
+                description=f'Старый {i}',
+                metadata={'n': i},
+                created_at=datetime(2001, 1 + i % 3, 10 + i, tzinfo=dt_timezone.utc)
+            )
+            for i in range(9)
+        ])
+        cls.recent_log = ActionLog.objects.create(
+            user=cls.user, action='login', description='Свежий', created_at=now
+        )
+    
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+    
+    def _archive(self, **kwargs):
+        return archive.archive_logs(30, root=self.root.name, **kwargs)
+    
+    def test_archive_moves_old_logs(self):
+        """Тест переноса старых логов в сегменты и удаления из базы"""
+        result = self._archive(segment_rows=2, batch_size=1)
+        
+        self.assertEqual(result['rows'], 9)
+        self.assertEqual(list(ActionLog.objects.values_list('pk', flat=True)), [self.recent_log.pk])
+        
+        segments = archive.load_manifest(self.root.name)['segments']
+        self.assertEqual(sum(segment['rows'] for segment in segments), 9)
+        self.assertEqual(result['segments'], len(segments))
+        self.assertTrue(all(segment['rows'] <= 2 for segment in segments))
+        self.assertEqual(
+            {(segment['month'], segment['action']) for segment in segments},
+            {('2001-01', 'logout'), ('2001-01', 'login'), ('2001-02', 'login'),
+             ('2001-02', 'logout'), ('2001-03', 'logout'), ('2001-03', 'login')}
+        )
+        for segment in segments:
+            path = os.path.join(self.root.name, segment['path'])
+            self.assertTrue(path.endswith('.jsonl.gz'))
+            self.assertTrue(os.path.exists(path))
+        
+        self.assertEqual(self._archive()['rows'], 0)
+    
+    def test_iter_archived_logs(self):
+        """Тест чтения архива с фильтрами, от новых к старым"""
+        self._archive(segment_rows=2)
+        
+        records = list(archive.iter_archived_logs({}, root=self.root.name))
+        self.assertEqual(len(records), 9)
+        dates = [record['created_at'] for record in records]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(records[0]['user_email'], 'archived@example.com')
+        
+        records = list(archive.iter_archived_logs(
+            {'action': 'login', 'date_from': '2001-02-01', 'date_to': '2001-02-28'},
+            root=self.root.name
+        ))
+        self.assertEqual([record['description'] for record in records], ['Старый 7', 'Старый 1'])
+        
+        self.assertEqual(list(archive.iter_archived_logs({'user': 'nobody'}, root=self.root.name)), [])
+        self.assertEqual(archive.archived_count({'action': 'login'}, root=self.root.name), 4)
+    
+    def test_export_includes_archive(self):
+        """Тест экспорта логов вместе с архивом"""
+        self._archive()
+        self.client.force_login(self.admin)
+        
+        with patch.object(archive, 'ARCHIVE_ROOT', self.root.name):
+            response = self.client.get(reverse('action_logs:export_logs'), {'format': 'csv', 'archive': '1'})
+            content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content)))[1:]
+        
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0][5], 'Свежий')
+        self.assertEqual(rows[1][0], '18.03.2001 00:00:00')
+        self.assertEqual(rows[1][2], 'archived@example.com')
+        
+        response = self.client.get(reverse('action_logs:export_logs'), {'format': 'csv'})
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))) - 1, 1)
+    
+    def test_rerun_after_failed_delete(self):
+        """Тест повторного запуска после сбоя между манифестом и удалением строк"""
+        with patch.object(archive, '_delete_archived', side_effect=RuntimeError('сбой')):
+            with self.assertRaises(RuntimeError):
+                self._archive(segment_rows=2)
+        
+        segments = archive.load_manifest(self.root.name)['segments']
+        self.assertEqual([segment.get('pending') for segment in segments], [True])
+        self.assertEqual(ActionLog.objects.count(), 10)
+        
+        self.assertEqual(archive.reconcile_pending(self.root.name), 1)
+        self.assertEqual(ActionLog.objects.count(), 10 - segments[0]['rows'])
+        self._archive(segment_rows=2)
+        
+        records = list(archive.iter_archived_logs({}, root=self.root.name))
+        self.assertEqual(len(records), 9)
+        self.assertEqual(len({record['id'] for record in records}), 9)
+        self.assertFalse(any(segment.get('pending') for segment in archive.load_manifest(self.root.name)['segments']))
+        self.assertEqual(list(ActionLog.objects.values_list('pk', flat=True)), [self.recent_log.pk])
+    
+    def test_invalid_format(self):
+        """Тест неподдерживаемого формата архива"""
+        with self.assertRaises(ValueError):
+            self._archive(archive_format='xml')
+    
+    def test_command(self):
+        """Тест команды архивирования"""
+        out = io.StringIO()
+        with patch.object(archive, 'ARCHIVE_ROOT', self.root.name):
+            call_command('archive_action_logs', '--older-than-days', '30', stdout=out)
+        
+        self.assertIn('Архивировано записей: 9', out.getvalue())
+        self.assertEqual(ActionLog.objects.count(), 1)
+
+
+class ActionLogSearchTest(TestCase):
+    """Тесты поиска по журналу действий"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='searchadmin',
+            email='searchadmin@example.com',
+            password='testpass123',
+            first_name='Search',
+            last_name='Admin',
+            role='king'
+        )
+        cls.ivan = User.objects.create_user(
+            username='ivan',
+            email='ivan.petrov@example.com',
+            password='testpass123',
+            first_name='Иван',
+            last_name='Петров',
+            role='citizen'
+        )
+        cls.anna = User.objects.create_user(
+            username='anna',
+            email='anna@example.com',
+            password='testpass123',
+            first_name='Анна',
+            last_name='Смирнова',
+            role='citizen'
+        )
+        cls.ivan_login = ActionLog.objects.create(user=cls.ivan, action='login', description='Вход пользователя в систему')
+        cls.ivan_test = ActionLog.objects.create(user=cls.ivan, action='test_complete', description='Тестирование завершено')
+        cls.anna_login = ActionLog.objects.create(user=cls.anna, action='login', description='Вход пользователя в систему')
+    
+    def search(self, *terms):
+        from .search import search_logs
+        return set(search_logs(ActionLog.objects.all(), terms))
+    
+    def test_search_vector_maintained_on_write(self):
+        """Тест заполнения поискового вектора при записи и изменении лога"""
+        if not search.full_text_enabled():
+            self.skipTest('Полнотекстовый поиск доступен только в PostgreSQL')
+        
+        log = ActionLog.objects.get(pk=self.ivan_login.pk)
+        self.assertIn("'вход'", log.search_vector)
+        
+        ActionLog.objects.filter(pk=log.pk).update(description='Регистрация')
+        log.refresh_from_db()
+        self.assertIn("'регистрац'", log.search_vector)
+        self.assertNotIn("'вход'", log.search_vector)
+        
+        # Пачечная запись журнала (bulk_create) тоже заполняет вектор
+        writer = ActionLogWriter(mode='buffered', autostart=False)
+        writer.write(user=self.anna, action='logout', description='Выход из системы')
+        writer.flush()
+        self.assertTrue(ActionLog.objects.filter(action='logout', search_vector__isnull=False).exists())
+    
+    def test_search_description(self):
+        """Тест поиска по описанию с учетом словоформ"""
+        if search.full_text_enabled():
+            # Словоформа другого числа находится полнотекстовым поиском
+            self.assertEqual(self.search('пользователей'), {self.ivan_login, self.anna_login})
+        self.assertEqual(self.search('Тестирование'), {self.ivan_test})
+        self.assertEqual(self.search('регистрация'), set())
+    
+    def test_search_user(self):
+        """Тест поиска по подстроке имени, фамилии и email"""
+        self.assertEqual(self.search('петро'), {self.ivan_login, self.ivan_test})
+        self.assertEqual(self.search('ANNA@'), {self.anna_login})
+        # Все слова должны найтись: пользователь и описание
+        self.assertEqual(self.search('Иван', 'вход'), {self.ivan_login})
+    
+    def test_fallback_without_full_text(self):
+        """Тест поиска по подстроке описания без полнотекстового поиска"""
+        with patch.object(search, 'full_text_enabled', return_value=False):
+            self.assertEqual(self.search('ход', 'польз'), {self.ivan_login, self.anna_login})
+            self.assertEqual(self.search('Тестирование'), {self.ivan_test})
+            self.assertEqual(self.search('пользователей'), set())
+    
+    def test_api_search(self):
+        """Тест параметра search в API"""
+        self.client.force_login(self.admin)
+        
+        response = self.client.get('/api/action-logs/logs/', {'search': 'Петров вход'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], [str(self.ivan_login.pk)])
+    
+    def test_export_user_filter(self):
+        """Тест фильтра пользователя в экспорте"""
+        self.client.force_login(self.admin)
+        
+        response = self.client.get(reverse('action_logs:export_logs'), {'format': 'csv', 'user': 'смирн'})
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content)))[1:]
+        
+        self.assertEqual([row[2] for row in rows], ['anna@example.com'])
+    
+    def test_trigram_indexes(self):
+        """Тест триграммных индексов пользователей при доступном pg_trgm"""
+        from django.db import connection
+        if connection.vendor != 'postgresql':
+            self.skipTest('Триграммные индексы есть только в PostgreSQL')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('Расширение pg_trgm недоступно')
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'users' AND indexname LIKE '%%_trgm_idx'")
+            indexes = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(
+            indexes,
+            {'users_first_name_trgm_idx', 'users_last_name_trgm_idx', 'users_email_trgm_idx'}
+        )
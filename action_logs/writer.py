@@ -0,0 +1,347 @@
+"""
+Запись журнала действий пользователей
+
+Запись лога не должна задерживать обработку запроса, поэтому поддерживаются
+три режима (настройка ACTION_LOG_WRITE_MODE):
+
+    sync     - запись сразу в рамках запроса (ActionLog.objects.create);
+    buffered - события складываются в очередь процесса и записываются
+               пачками через bulk_create фоновым потоком по размеру пачки
+               или по истечении интервала;
+    async    - пачки из очереди передаются задаче Celery write_action_logs.
+
+В режимах buffered и async очередь ограничена по размеру: при переполнении
+событие отбрасывается и учитывается в метриках. При завершении процесса
+оставшиеся события записываются (atexit).
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from hart_citizens_project.instrumentation import span
+
+from .models import ActionLog
+
+logger = logging.getLogger(__name__)
+
+MODE_SYNC = 'sync'
+MODE_BUFFERED = 'buffered'
+MODE_ASYNC = 'async'
+MODES = (MODE_SYNC, MODE_BUFFERED, MODE_ASYNC)
+
+# Поля события, которые передаются в ActionLog
+EVENT_FIELDS = (
+    'user_id', 'kingdom_id', 'action', 'description', 'metadata',
+    'ip_address', 'user_agent', 'created_at'
+)
+
+
+# Королевство пользователя еще не известно
+UNKNOWN = object()
+
+
+def make_event(user=None, user_id=None, action='', description='', metadata=None,
+               ip_address=None, user_agent=None, created_at=None, kingdom=UNKNOWN, kingdom_id=UNKNOWN):
+    """
+    Событие журнала в виде сериализуемого в JSON словаря
+
+    Принимает те же аргументы, что и ActionLog.objects.create. Время события
+    фиксируется в момент вызова, а не в момент записи в базу. Королевство
+    (kingdom или kingdom_id) можно не передавать: оно берется из уже загруженного
+    профиля пользователя или определяется при записи пачки.
+    """
+    if user is not None:
+        user_id = user.pk
+    created_at = created_at or timezone.now()
+    event = {
+        'user_id': str(user_id) if user_id is not None else None,
+        'action': action,
+        'description': description or '',
+        'metadata': metadata or {},
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'created_at': created_at.isoformat(),
+    }
+
+    if kingdom is not UNKNOWN:
+        kingdom_id = kingdom.pk if kingdom is not None else None
+    elif kingdom_id is UNKNOWN:
+        kingdom_id = _loaded_kingdom_id(user)
+    if kingdom_id is not UNKNOWN:
+        event['kingdom_id'] = str(kingdom_id) if kingdom_id is not None else None
+    return event
+
+
+def _loaded_kingdom_id(user):
+    """Королевство из профиля пользователя, если профиль уже загружен"""
+    if user is None:
+        return UNKNOWN
+    for profile_name in ('citizen_profile', 'king_profile'):
+        profile = user._state.fields_cache.get(profile_name)
+        if profile is not None:
+            return profile.kingdom_id
+    return UNKNOWN
+
+
+def resolve_kingdoms(events):
+    """Определение королевств пользователей для событий без kingdom_id (один запрос)"""
+    user_ids = {event['user_id'] for event in events if 'kingdom_id' not in event and event.get('user_id')}
+    if not user_ids:
+        return
+
+    from kingdom.models import Citizen, King
+    kingdoms = {
+        str(user_id): str(kingdom_id)
+        # Без сортировки моделей по умолчанию: SQLite не разрешает ORDER BY в частях UNION
+        for user_id, kingdom_id in Citizen.objects.filter(user_id__in=user_ids).order_by().values_list(
+            'user_id', 'kingdom_id'
+        ).union(
+            King.objects.filter(user_id__in=user_ids).order_by().values_list('user_id', 'kingdom_id')
+        )
+    }
+    for event in events:
+        if 'kingdom_id' not in event:
+            event['kingdom_id'] = kingdoms.get(event.get('user_id'))
+
+
+def write_events(events):
+    """
+    Запись пачки событий в базу данных
+
+    Пачка записывается одним bulk_create. Если пачка не записалась целиком
+    (например, пользователь события уже удален), события записываются
+    по одному, чтобы не потерять остальные.
+
+    Returns:
+        Кортеж (written, failed)
+    """
+    resolve_kingdoms(events)
+    logs = [_to_log(event) for event in events]
+    if not logs:
+        return 0, 0
+
+    try:
+        with transaction.atomic():
+            ActionLog.objects.bulk_create(logs)
+        return len(logs), 0
+    except Exception as e:
+        logger.warning(f'Ошибка пакетной записи журнала, запись по одному: {str(e)}')
+
+    written = failed = 0
+    for log in logs:
+        try:
+            with transaction.atomic():
+                log.save(force_insert=True)
+            written += 1
+        except Exception as e:
+            failed += 1
+            logger.error(f'Не удалось записать событие журнала {log.action}: {str(e)}')
+    return written, failed
+
+
+def _to_log(event):
+    fields = {name: event.get(name) for name in EVENT_FIELDS}
+    if isinstance(fields['created_at'], str):
+        fields['created_at'] = parse_datetime(fields['created_at'])
+    fields['created_at'] = fields['created_at'] or timezone.now()
+    fields['metadata'] = fields['metadata'] or {}
+    return ActionLog(**fields)
+
+
+class ActionLogWriter:
+    """Буферизованный писатель журнала действий"""
+
+    def __init__(self, mode=MODE_SYNC, batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, autostart=True):
+        if mode not in MODES:
+            raise ValueError(f'Неизвестный режим записи журнала: {mode}')
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.autostart = autostart
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'flushes': 0,
+        }
+
+    def write(self, **fields):
+        """Запись события журнала согласно режиму"""
+        event = make_event(**fields)
+
+        if self.mode == MODE_SYNC:
+            resolve_kingdoms([event])
+            _to_log(event).save(force_insert=True)
+            self._count(1, 0)
+            return
+
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._increment('dropped')
+            logger.warning(f'Очередь журнала переполнена, событие {event["action"]} отброшено')
+            return
+        self._increment('enqueued')
+
+        if self.autostart:
+            self._ensure_thread()
+        if self._queue.qsize() >= self.batch_size:
+            if self._thread is not None and self._thread.is_alive():
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """
+        Запись всех накопленных событий
+
+        Returns:
+            Количество событий, извлеченных из очереди
+        """
+        total = 0
+        with self._flush_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    break
+                total += len(batch)
+                self._deliver(batch)
+        return total
+
+    def stop(self, timeout=5.0):
+        """Остановка фонового потока с записью оставшихся событий"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self.flush()
+
+    def metrics(self):
+        """Метрики писателя: глубина очереди и счетчики событий"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['mode'] = self.mode
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
+
+    def _deliver(self, batch):
+        if self.mode == MODE_ASYNC:
+            from .tasks import write_action_logs
+            try:
+                write_action_logs.delay(batch)
+                self._increment('flushes')
+                return
+            except Exception as e:
+                # Брокер недоступен - не теряем события, пишем сами
+                logger.error(f'Не удалось передать пачку журнала в Celery: {str(e)}')
+        self._count(*write_events(batch))
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _count(self, written, failed):
+        with self._stats_lock:
+            self._stats['written'] += written
+            self._stats['failed'] += failed
+            self._stats['flushes'] += 1
+
+    def _increment(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='action-log-writer', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f'Ошибка фоновой записи журнала: {str(e)}')
+            finally:
+                # Соединения потока не должны оставаться открытыми между сбросами
+                connections.close_all()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Писатель журнала процесса, настроенный из settings"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ActionLogWriter(
+                    mode=getattr(settings, 'ACTION_LOG_WRITE_MODE', MODE_SYNC),
+                    batch_size=getattr(settings, 'ACTION_LOG_BATCH_SIZE', 100),
+                    flush_interval=getattr(settings, 'ACTION_LOG_FLUSH_INTERVAL', 1.0),
+                    max_queue_size=getattr(settings, 'ACTION_LOG_QUEUE_MAX_SIZE', 10000),
+                )
+    return _writer
+
+
+def write_log(**fields):
+    """
+    Запись события журнала действий
+
+    Args:
+        **fields: Поля ActionLog (user, action, description, metadata,
+            ip_address, user_agent)
+    """
+    with span('actionlog'):
+        get_writer().write(**fields)
+
+
+def flush():
+    """Запись накопленных событий журнала текущего процесса"""
+    if _writer is not None:
+        return _writer.flush()
+    return 0
+
+
+def get_metrics():
+    """Метрики записи журнала текущего процесса"""
+    return get_writer().metrics()
+
+
+@atexit.register
+def _flush_on_exit():
+    if _writer is not None and _writer.mode != MODE_SYNC:
+        try:
+            _writer.stop(timeout=1.0)
+        except Exception as e:
+            logger.error(f'Ошибка записи журнала при завершении процесса: {str(e)}')
@@ -0,0 +1,19 @@
+from rest_framework.filters import SearchFilter
+
+from action_logs.search import search_logs
+
+
+class ActionLogSearchFilter(SearchFilter):
+    """
+    Поиск логов по параметру search (см. action_logs.search)
+
+    Описание ищется полнотекстово по search_vector, пользователь - по подстроке
+    имени, фамилии и email. search_fields представления используются только
+    для формы поиска browsable API.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search_logs(queryset, terms)
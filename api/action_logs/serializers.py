@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from action_logs.models import ActionLog
+from rest_framework.reverse import reverse
+from action_logs.export import FILTER_PARAMS
+from action_logs.models import ActionLog, ExportJob
 
 
 class ActionLogSerializer(serializers.ModelSerializer):
@@ -18,3 +20,38 @@ class ActionLogSerializer(serializers.ModelSerializer):
             'ip_address', 'user_agent', 'created_at'
         ]
         read_only_fields = ['id', 'created_at']
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    """Сериализатор для фоновой задачи экспорта логов"""
+    
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    progress = serializers.FloatField(read_only=True)
+    download_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ExportJob
+        fields = [
+            'id', 'export_format', 'filters', 'status', 'status_display',
+            'total_rows', 'processed_rows', 'progress', 'download_url',
+            'error', 'created_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = [
+            'id', 'status', 'total_rows', 'processed_rows', 'error',
+            'created_at', 'started_at', 'completed_at'
+        ]
+    
+    def get_download_url(self, obj):
+        """Ссылка на скачивание готового файла"""
+        if obj.status != 'completed' or not obj.file:
+            return None
+        return reverse('exportjob-download', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+    
+    def validate_filters(self, value):
+        """Валидация фильтров экспорта"""
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Фильтры должны быть объектом')
+        unknown = set(value) - set(FILTER_PARAMS)
+        if unknown:
+            raise serializers.ValidationError(f'Неизвестные фильтры: {", ".join(sorted(unknown))}')
+        return value
@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ActionLogViewSet
+from .views import ActionLogViewSet, ExportJobViewSet
 
 router = DefaultRouter()
 router.register(r'logs', ActionLogViewSet)
+router.register(r'export-jobs', ExportJobViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,15 +1,18 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, mixins, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Q
-from django.utils import timezone
-from datetime import datetime, timedelta
+from django.http import FileResponse
 
-from action_logs.models import ActionLog
-from action_logs.utils import export_logs_to_excel
-from .serializers import ActionLogSerializer
+from action_logs.models import ActionLog, ExportJob
+from action_logs.rollup import get_statistics
+from action_logs.export import (
+    archive_params, export_response, filter_logs, should_run_in_background, start_export_job
+)
+from action_logs.writer import get_metrics
+from .filters import ActionLogSearchFilter
+from .pagination import ActionLogCursorPagination
+from .serializers import ActionLogSerializer, ExportJobSerializer
 
 
 class ActionLogViewSet(viewsets.ReadOnlyModelViewSet):
@@ -18,11 +21,11 @@ class ActionLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ActionLog.objects.all()
     serializer_class = ActionLogSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # Порядок (created_at, id) задает keyset-пагинация, параметр ordering обрабатывает она же
+    pagination_class = ActionLogCursorPagination
+    filter_backends = [DjangoFilterBackend, ActionLogSearchFilter]
     filterset_fields = ['action', 'user__role']
     search_fields = ['user__first_name', 'user__last_name', 'user__email', 'description']
-    ordering_fields = ['created_at', 'action']
-    ordering = ['-created_at']
     
     def get_queryset(self):
         """Фильтрация queryset в зависимости от роли пользователя"""
@@ -33,11 +36,8 @@ class ActionLogViewSet(viewsets.ReadOnlyModelViewSet):
             return ActionLog.objects.all().select_related('user')
         elif user.is_king:
             # Короли видят логи своего королевства
-            kingdom = user.king_profile.kingdom
-            return ActionLog.objects.filter(
-                Q(user__citizen_profile__kingdom=kingdom) |
-                Q(user__king_profile__kingdom=kingdom)
-            ).select_related('user')
+            kingdom = self.request.profile.king.kingdom
+            return ActionLog.objects.filter(kingdom=kingdom).select_related('user')
         elif user.is_citizen:
             # Подданные видят только свои логи
             return ActionLog.objects.filter(user=user).select_related('user')
@@ -48,7 +48,7 @@ class ActionLogViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def user_logs(self, request):
         """Логи текущего пользователя"""
-        logs = ActionLog.objects.filter(user=request.user).order_by('-created_at')
+        logs = ActionLog.objects.filter(user=request.user).select_related('user')
         
         # Пагинация
         page = self.paginate_queryset(logs)
@@ -65,19 +65,16 @@ class ActionLogViewSet(viewsets.ReadOnlyModelViewSet):
         user = request.user
         
         if user.is_king:
-            kingdom = user.king_profile.kingdom
+            kingdom = request.profile.king.kingdom
         elif user.is_citizen:
-            kingdom = user.citizen_profile.kingdom
+            kingdom = request.profile.citizen.kingdom
         else:
             return Response(
                 {'error': 'Недостаточно прав для просмотра логов королевства'}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        logs = ActionLog.objects.filter(
-            Q(user__citizen_profile__kingdom=kingdom) |
-            Q(user__king_profile__kingdom=kingdom)
-        ).order_by('-created_at')
+        logs = ActionLog.objects.filter(kingdom=kingdom).select_related('user')
         
         # Пагинация
         page = self.paginate_queryset(logs)
@@ -90,60 +87,22 @@ class ActionLogViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
     def export(self, request):
-        """Экспорт логов в Excel"""
+        """Экспорт логов в Excel или CSV (параметр format)"""
+        # DRF использует параметр format для выбора рендерера, поэтому здесь export_format
+        export_format = request.GET.get('export_format', 'xlsx')
         try:
-            # Получаем параметры фильтрации
-            action_filter = request.GET.get('action', '')
-            user_filter = request.GET.get('user', '')
-            date_from = request.GET.get('date_from', '')
-            date_to = request.GET.get('date_to', '')
+            logs = filter_logs(ActionLog.objects.order_by('-created_at'), request.GET)
             
-            # Базовый queryset
-            logs = ActionLog.objects.all().select_related('user').order_by('-created_at')
+            # Большие выгрузки выполняются фоновой задачей
+            if should_run_in_background(logs, request.GET):
+                job = start_export_job(request.user, export_format, request.GET)
+                serializer = ExportJobSerializer(job, context={'request': request})
+                return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
             
-            # Применяем фильтры
-            if action_filter:
-                logs = logs.filter(action=action_filter)
-            
-            if user_filter:
-                logs = logs.filter(
-                    Q(user__first_name__icontains=user_filter) |
-                    Q(user__last_name__icontains=user_filter) |
-                    Q(user__email__icontains=user_filter)
-                )
-            
-            if date_from:
-                try:
-                    date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
-                    logs = logs.filter(created_at__date__gte=date_from_obj)
-                except ValueError:
-                    pass
-            
-            if date_to:
-                try:
-                    date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
-                    logs = logs.filter(created_at__date__lte=date_to_obj)
-                except ValueError:
-                    pass
-            
-            # Ограничиваем количество записей для экспорта
-            logs = logs[:10000]  # Максимум 10000 записей
-            
-            # Генерируем имя файла
-            timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'action_logs_{timestamp}.xlsx'
-            
-            # Экспортируем в Excel
-            response = export_logs_to_excel(logs, filename)
-            
-            if response:
-                return response
-            else:
-                return Response(
-                    {'error': 'Ошибка при экспорте логов'}, 
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+            return export_response(logs, export_format, archive_params(request.GET))
         
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {'error': 'Внутренняя ошибка сервера'}, 
@@ -153,42 +112,54 @@ class ActionLogViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
     def statistics(self, request):
         """Статистика логов для администраторов"""
-        from django.db.models import Count
-        
-        # Общая статистика
-        total_logs = ActionLog.objects.count()
-        
-        # Статистика по дням (последние 30 дней)
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        daily_stats = ActionLog.objects.filter(
-            created_at__gte=thirty_days_ago
-        ).extra(
-            select={'day': 'date(created_at)'}
-        ).values('day').annotate(
-            count=Count('id')
-        ).order_by('day')
+        # Статистика читается из суточной сводки, а не из всей таблицы логов
+        return Response({
+            **get_statistics(),
+            'writer': get_metrics(),
+        })
+
+
+class ExportJobViewSet(mixins.CreateModelMixin,
+                       mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """ViewSet для фоновых задач экспорта логов"""
+    
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get_queryset(self):
+        """Пользователь видит только свои задачи экспорта"""
+        return ExportJob.objects.filter(user=self.request.user)
+    
+    def create(self, request, *args, **kwargs):
+        """Постановка экспорта в очередь"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        # Статистика по действиям
-        action_stats = ActionLog.objects.values('action').annotate(
-            count=Count('id')
-        ).order_by('-count')
+        job = start_export_job(
+            request.user,
+            serializer.validated_data.get('export_format', 'xlsx'),
+            serializer.validated_data.get('filters', {})
+        )
         
-        # Статистика по ролям пользователей
-        role_stats = ActionLog.objects.values('user__role').annotate(
-            count=Count('id')
-        ).order_by('-count')
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Скачивание готового файла экспорта"""
+        job = self.get_object()
         
-        # Статистика по королевствам
-        kingdom_stats = ActionLog.objects.filter(
-            user__citizen_profile__isnull=False
-        ).values('user__citizen_profile__kingdom__name').annotate(
-            count=Count('id')
-        ).order_by('-count')
+        if job.status != 'completed' or not job.file:
+            return Response(
+                {'error': 'Экспорт еще не готов'},
+                status=status.HTTP_409_CONFLICT
+            )
         
-        return Response({
-            'total_logs': total_logs,
-            'daily_stats': list(daily_stats),
-            'action_stats': list(action_stats),
-            'role_stats': list(role_stats),
-            'kingdom_stats': list(kingdom_stats),
-        })
+        return FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename=job.file.name.rsplit('/', 1)[-1]
+        )
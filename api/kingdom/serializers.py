@@ -4,13 +4,15 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 import logging
 
 from kingdom.models import (
     Kingdom, King, Citizen, Test, Question, 
-    TestAttempt, Answer
+    TestAttempt, Answer, CandidateRanking
 )
+from kingdom.cache import get_test_definition
+from kingdom.enrollment import MAX_BATCH_SIZE
 from action_logs.models import ActionLog
 from users.models import User
 
@@ -26,8 +28,30 @@ class KingdomSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'updated_at')
 
 
-class KingSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели King"""
+class QueryPlanMixin:
+    """
+    План загрузки связей для сериализатора
+
+    Сериализатор объявляет связи, к которым обращаются его поля, а ViewSet
+    применяет план к своему queryset через setup_queryset, чтобы список
+    загружался фиксированным числом запросов независимо от размера страницы.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        """Queryset со связями, которые нужны полям сериализатора"""
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+
+class KingSerializer(QueryPlanMixin, serializers.ModelSerializer):
+    """Сериализатор для модели King (количество подданных - хранимый счетчик, без запроса)"""
+    select_related_fields = ('user', 'kingdom')
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     kingdom_name = serializers.CharField(source='kingdom.name', read_only=True)
     current_citizens_count = serializers.IntegerField(read_only=True)
@@ -38,8 +62,9 @@ class KingSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'updated_at', 'current_citizens_count')
 
 
-class CitizenSerializer(serializers.ModelSerializer):
+class CitizenSerializer(QueryPlanMixin, serializers.ModelSerializer):
     """Сериализатор для модели Citizen"""
+    select_related_fields = ('user', 'kingdom', 'king__user')
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     kingdom_name = serializers.CharField(source='kingdom.name', read_only=True)
     king_name = serializers.CharField(source='king.user.get_full_name', read_only=True)
@@ -59,16 +84,31 @@ class QuestionSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
-class TestSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели Test"""
+class TestSerializer(QueryPlanMixin, serializers.ModelSerializer):
+    """Сериализатор для модели Test (вопросы берутся из кэша определения теста)"""
+    select_related_fields = ('kingdom',)
     kingdom_name = serializers.CharField(source='kingdom.name', read_only=True)
-    questions = QuestionSerializer(many=True, read_only=True)
-    questions_count = serializers.IntegerField(read_only=True)
+    questions = serializers.SerializerMethodField()
+    questions_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Test
         fields = ('id', 'title', 'description', 'kingdom_name', 'is_active', 'questions', 'questions_count', 'created_at', 'updated_at')
         read_only_fields = ('id', 'created_at', 'updated_at', 'questions_count')
+    
+    def _definition(self, obj):
+        definition = get_test_definition(obj.kingdom_id)
+        if definition is None or definition.test_id != obj.id:
+            return None
+        return definition
+    
+    def get_questions(self, obj):
+        definition = self._definition(obj)
+        return QuestionSerializer(definition.questions if definition else [], many=True).data
+    
+    def get_questions_count(self, obj):
+        definition = self._definition(obj)
+        return definition.questions_count if definition else 0
 
 
 class AnswerSerializer(serializers.ModelSerializer):
@@ -81,8 +121,12 @@ class AnswerSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'question_text', 'is_correct', 'answered_at')
 
 
-class TestAttemptSerializer(serializers.ModelSerializer):
+class TestAttemptSerializer(QueryPlanMixin, serializers.ModelSerializer):
     """Сериализатор для модели TestAttempt"""
+    select_related_fields = ('citizen__user', 'test')
+    prefetch_related_fields = (
+        Prefetch('answers', queryset=Answer.objects.select_related('question')),
+    )
     citizen_name = serializers.CharField(source='citizen.user.get_full_name', read_only=True)
     test_title = serializers.CharField(source='test.title', read_only=True)
     answers = AnswerSerializer(many=True, read_only=True)
@@ -90,8 +134,43 @@ class TestAttemptSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = TestAttempt
-        fields = ('id', 'citizen_name', 'test_title', 'status', 'score', 'total_questions', 'percentage', 'started_at', 'completed_at', 'answers')
-        read_only_fields = ('id', 'citizen_name', 'test_title', 'score', 'total_questions', 'percentage', 'started_at', 'completed_at')
+        fields = ('id', 'citizen_name', 'test_title', 'status', 'score', 'total_questions', 'answered_count', 'percentage', 'started_at', 'completed_at', 'answers')
+        read_only_fields = ('id', 'citizen_name', 'test_title', 'score', 'total_questions', 'answered_count', 'percentage', 'started_at', 'completed_at')
+
+
+class CandidateRankingSerializer(serializers.ModelSerializer):
+    """Сериализатор строки рейтинга кандидатов"""
+    citizen_id = serializers.UUIDField(read_only=True)
+    citizen_name = serializers.CharField(source='citizen.user.get_full_name', read_only=True)
+    
+    class Meta:
+        model = CandidateRanking
+        fields = ('citizen_id', 'citizen_name', 'best_score', 'total_questions', 'percentage', 'completed_at', 'is_enrolled')
+        read_only_fields = fields
+
+
+class AnswerItemSerializer(serializers.Serializer):
+    """Сериализатор ответа на один вопрос в пакете"""
+    question_id = serializers.UUIDField()
+    answer = serializers.BooleanField()
+
+
+class BulkAnswerSerializer(serializers.Serializer):
+    """Сериализатор пакета ответов на вопросы теста"""
+    answers = AnswerItemSerializer(many=True, allow_empty=False)
+    
+    def validate_answers(self, value):
+        """Преобразуем список ответов в словарь (последний ответ на вопрос побеждает)"""
+        return {item['question_id']: item['answer'] for item in value}
+
+
+class BulkEnrollmentSerializer(serializers.Serializer):
+    """Сериализатор пакета подданных для зачисления"""
+    citizen_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE
+    )
 
 
 class ActionLogSerializer(serializers.ModelSerializer):
@@ -12,7 +12,10 @@ router.register(r'tests', views.TestViewSet)
 router.register(r'test-attempts', views.TestAttemptViewSet)
 
 urlpatterns = [
+    # До маршрутов роутера, иначе enroll совпадет с citizens/<pk>/
+    path('citizens/enroll/', views.enroll_citizens, name='enroll_citizens'),
     path('', include(router.urls)),
     path('citizens/<uuid:citizen_id>/enroll/', views.enroll_citizen, name='enroll_citizen'),
     path('dashboard/', views.dashboard_data, name='dashboard_data'),
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
 ]
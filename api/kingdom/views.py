@@ -11,11 +11,17 @@ from kingdom.models import (
     Kingdom, King, Citizen, Test, Question, 
     TestAttempt, Answer
 )
-from action_logs.models import ActionLog
+from kingdom.answers import next_question, record_answer, record_answers
+from kingdom.cache import get_test_definition, require_test_definition
+from kingdom.candidates import paginate_candidates
+from kingdom.enrollment import REASONS, enroll_citizens as enroll_batch
+from kingdom.rankings import TOP_LIMIT, top_candidates
+from action_logs.writer import write_log
 from users.models import User
 from .serializers import (
     KingdomSerializer, KingSerializer, CitizenSerializer, 
-    TestSerializer, TestAttemptSerializer, ActionLogSerializer
+    TestSerializer, TestAttemptSerializer, ActionLogSerializer,
+    BulkAnswerSerializer, BulkEnrollmentSerializer, QuestionSerializer, CandidateRankingSerializer
 )
 
 logger = logging.getLogger('kingdom')
@@ -37,7 +43,7 @@ class KingViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """Фильтруем королей по текущему пользователю"""
         if self.request.user.is_king:
-            return King.objects.filter(user=self.request.user)
+            return KingSerializer.setup_queryset(King.objects.filter(user=self.request.user))
         return King.objects.none()
 
 
@@ -50,10 +56,12 @@ class CitizenViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Фильтруем подданных по текущему пользователю"""
         if self.request.user.is_citizen:
-            return Citizen.objects.filter(user=self.request.user)
+            queryset = Citizen.objects.filter(user=self.request.user)
         elif self.request.user.is_king:
-            return Citizen.objects.filter(kingdom=self.request.user.king_profile.kingdom)
-        return Citizen.objects.none()
+            queryset = Citizen.objects.filter(kingdom=self.request.profile.king.kingdom)
+        else:
+            return Citizen.objects.none()
+        return CitizenSerializer.setup_queryset(queryset)
     
     def perform_update(self, serializer):
         """Обновление профиля подданного"""
@@ -72,10 +80,12 @@ class TestViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """Фильтруем тесты по королевству пользователя"""
         if self.request.user.is_citizen:
-            return Test.objects.filter(kingdom=self.request.user.citizen_profile.kingdom)
+            queryset = Test.objects.filter(kingdom=self.request.profile.citizen.kingdom)
         elif self.request.user.is_king:
-            return Test.objects.filter(kingdom=self.request.user.king_profile.kingdom)
-        return Test.objects.none()
+            queryset = Test.objects.filter(kingdom=self.request.profile.king.kingdom)
+        else:
+            return Test.objects.none()
+        return TestSerializer.setup_queryset(queryset)
 
 
 class TestAttemptViewSet(viewsets.ModelViewSet):
@@ -87,21 +97,26 @@ class TestAttemptViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Фильтруем попытки по текущему пользователю"""
         if self.request.user.is_citizen:
-            return TestAttempt.objects.filter(citizen__user=self.request.user)
+            queryset = TestAttempt.objects.filter(citizen__user=self.request.user)
         elif self.request.user.is_king:
-            return TestAttempt.objects.filter(citizen__kingdom=self.request.user.king_profile.kingdom)
-        return TestAttempt.objects.none()
+            queryset = TestAttempt.objects.filter(citizen__kingdom=self.request.profile.king.kingdom)
+        else:
+            return TestAttempt.objects.none()
+        if self.action in ('answer_question', 'answer_questions', 'next_question'):
+            # Ответы попытки не сериализуются, загружаем только нужные связи
+            return queryset.select_related('test', 'citizen__user')
+        return TestAttemptSerializer.setup_queryset(queryset)
     
     @action(detail=False, methods=['post'])
     def start_test(self, request):
         """Начало тестирования"""
         try:
-            citizen = request.user.citizen_profile
-            test = citizen.kingdom.test
+            citizen = request.profile.citizen
+            test = require_test_definition(citizen.kingdom_id)
             
             # Проверяем, есть ли уже активная попытка
             active_attempt = citizen.test_attempts.filter(
-                test=test,
+                test_id=test.test_id,
                 status='in_progress'
             ).first()
             
@@ -114,12 +129,12 @@ class TestAttemptViewSet(viewsets.ModelViewSet):
             # Создаем новую попытку
             attempt = TestAttempt.objects.create(
                 citizen=citizen,
-                test=test,
-                total_questions=test.questions.count()
+                test_id=test.test_id,
+                total_questions=test.questions_count
             )
             
             # Логируем начало тестирования
-            ActionLog.objects.create(
+            write_log(
                 user=request.user,
                 action='test_start',
                 description=f'API начало тестирования для {citizen.user.get_full_name()}',
@@ -148,41 +163,21 @@ class TestAttemptViewSet(viewsets.ModelViewSet):
             if not question_id or answer_value is None:
                 return Response({'error': 'question_id и answer обязательны'}, status=status.HTTP_400_BAD_REQUEST)
             
-            question = get_object_or_404(Question, id=question_id)
-            
             # Проверяем, что вопрос принадлежит тесту попытки
-            if question.test != attempt.test:
+            test = get_test_definition(attempt.test.kingdom_id)
+            question = test.question(question_id) if test and test.test_id == attempt.test_id else None
+            if question is None:
                 return Response({'error': 'Вопрос не принадлежит данному тесту'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Сохраняем ответ
-            answer, created = Answer.objects.get_or_create(
-                attempt=attempt,
-                question=question,
-                defaults={
-                    'answer': answer_value,
-                    'is_correct': answer_value == question.correct_answer,
-                }
-            )
-            
-            if not created:
-                answer.answer = answer_value
-                answer.is_correct = answer_value == question.correct_answer
-                answer.save()
-            
-            # Обновляем счетчик правильных ответов
-            correct_answers = attempt.answers.filter(is_correct=True).count()
-            attempt.score = correct_answers
-            attempt.save()
+            # Сохраняем ответ и обновляем результат попытки
+            try:
+                is_correct, completed_now = record_answer(attempt, question, answer_value, test)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Проверяем, завершен ли тест
-            total_answered = attempt.answers.count()
-            if total_answered >= attempt.total_questions:
-                attempt.status = 'completed'
-                attempt.completed_at = timezone.now()
-                attempt.save()
-                
+            if completed_now:
                 # Логируем завершение тестирования
-                ActionLog.objects.create(
+                write_log(
                     user=request.user,
                     action='test_complete',
                     description=f'API завершение тестирования для {attempt.citizen.user.get_full_name()}. Результат: {attempt.score}/{attempt.total_questions}',
@@ -194,7 +189,7 @@ class TestAttemptViewSet(viewsets.ModelViewSet):
                 logger.info(f'API завершение тестирования для подданного {attempt.citizen.user.email} с результатом {attempt.score}/{attempt.total_questions}')
             
             return Response({
-                'is_correct': answer.is_correct,
+                'is_correct': is_correct,
                 'completed': attempt.status == 'completed',
                 'score': attempt.score,
                 'total': attempt.total_questions
@@ -204,6 +199,58 @@ class TestAttemptViewSet(viewsets.ModelViewSet):
             logger.error(f'Ошибка при ответе на вопрос: {str(e)}')
             return Response({'error': 'Внутренняя ошибка сервера'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    
+    @action(detail=True, methods=['post'])
+    def answer_questions(self, request, pk=None):
+        """Пакетный ответ на вопросы теста"""
+        attempt = self.get_object()
+        serializer = BulkAnswerSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            results, completed_now = record_answers(
+                attempt,
+                get_test_definition(attempt.test.kingdom_id),
+                serializer.validated_data['answers']
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if completed_now:
+            # Логируем завершение тестирования
+            write_log(
+                user=request.user,
+                action='test_complete',
+                description=f'API завершение тестирования для {attempt.citizen.user.get_full_name()}. Результат: {attempt.score}/{attempt.total_questions}',
+                metadata={'score': attempt.score, 'total': attempt.total_questions},
+                ip_address=request.META.get('REMOTE_ADDR', ''),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+            
+            logger.info(f'API завершение тестирования для подданного {attempt.citizen.user.email} с результатом {attempt.score}/{attempt.total_questions}')
+        
+        return Response({
+            'results': [
+                {'question_id': str(question_id), 'is_correct': is_correct}
+                for question_id, is_correct in results.items()
+            ],
+            'answered': attempt.answered_count,
+            'completed': attempt.status == 'completed',
+            'score': attempt.score,
+            'total': attempt.total_questions
+        })
+    
+    @action(detail=True, methods=['get'])
+    def next_question(self, request, pk=None):
+        """Следующий вопрос попытки и прогресс (по курсору попытки, без списка вопросов)"""
+        attempt = self.get_object()
+        progress = next_question(attempt, get_test_definition(attempt.test.kingdom_id))
+        question = progress.pop('question')
+        return Response({
+            'question': QuestionSerializer(question).data if question is not None else None,
+            'completed': attempt.status == 'completed',
+            **progress
+        })
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -213,7 +260,7 @@ def enroll_citizen(request, citizen_id):
         return Response({'error': 'Только короли могут зачислять подданных'}, status=status.HTTP_403_FORBIDDEN)
     
     try:
-        king = request.user.king_profile
+        king = request.profile.king
         citizen = get_object_or_404(Citizen, id=citizen_id)
         
         # Проверяем, что подданный принадлежит королевству короля
@@ -228,11 +275,14 @@ def enroll_citizen(request, citizen_id):
         if not king.can_accept_more_citizens:
             return Response({'error': f'Вы не можете принять больше {king.max_citizens} подданных'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Зачисляем подданного
-        citizen.enroll(king)
+        # Зачисляем подданного (лимит повторно проверяется атомарно)
+        try:
+            citizen.enroll(king)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Логируем зачисление
-        ActionLog.objects.create(
+        write_log(
             user=request.user,
             action='enrollment',
             description=f'API зачисление подданного {citizen.user.get_full_name()} королем {king.user.get_full_name()}',
@@ -252,6 +302,49 @@ def enroll_citizen(request, citizen_id):
         return Response({'error': 'Ошибка при зачислении подданного'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def enroll_citizens(request):
+    """
+    API пакетного зачисления подданных королем
+
+    Зачисляются подходящие подданные в порядке рейтинга, пока есть места;
+    для остальных возвращается причина отказа (см. kingdom.enrollment).
+    """
+    if not request.user.is_king:
+        return Response({'error': 'Только короли могут зачислять подданных'}, status=status.HTTP_403_FORBIDDEN)
+    
+    serializer = BulkEnrollmentSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        king = request.profile.king
+    except King.DoesNotExist:
+        return Response({'error': 'Профиль короля не найден'}, status=status.HTTP_404_NOT_FOUND)
+    
+    enrolled, rejected = enroll_batch(
+        king,
+        serializer.validated_data['citizen_ids'],
+        ip_address=request.META.get('REMOTE_ADDR', ''),
+        user_agent=request.META.get('HTTP_USER_AGENT', '')
+    )
+    
+    if enrolled:
+        logger.info(f'API пакетное зачисление {len(enrolled)} подданных королем {king.user.email}')
+    
+    return Response({
+        'message': f'Зачислено подданных: {len(enrolled)}',
+        'enrolled': CitizenSerializer(enrolled, many=True).data,
+        'rejected': [
+            {'citizen_id': str(citizen_id), 'reason': reason, 'error': REASONS[reason]}
+            for citizen_id, reason in rejected.items()
+        ],
+        'citizens_count': king.citizens_count,
+        'max_citizens': king.max_citizens,
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_data(request):
@@ -260,23 +353,20 @@ def dashboard_data(request):
     
     if user.is_king:
         try:
-            king = user.king_profile
+            king = request.profile.king
             # Получаем подданных, прошедших тест, но не зачисленных
-            passed_citizens = Citizen.objects.filter(
-                kingdom=king.kingdom,
-                is_enrolled=False
-            ).select_related('user')
-            
-            enrolled_citizens = []
-            for citizen in passed_citizens:
-                if citizen.test_attempts.filter(status='completed').exists():
-                    enrolled_citizens.append(citizen)
+            candidates_page = paginate_candidates(king.kingdom, request.query_params.get('page'))
             
             return Response({
                 'user_type': 'king',
                 'king': KingSerializer(king).data,
-                'enrolled_citizens': CitizenSerializer(enrolled_citizens, many=True).data,
-                'current_citizens': CitizenSerializer(king.citizens.all(), many=True).data,
+                'enrolled_citizens': CitizenSerializer(candidates_page.object_list, many=True).data,
+                'candidates_count': candidates_page.paginator.count,
+                'candidates_page': candidates_page.number,
+                'candidates_num_pages': candidates_page.paginator.num_pages,
+                'current_citizens': CitizenSerializer(
+                    CitizenSerializer.setup_queryset(king.citizens.all()), many=True
+                ).data,
                 'can_accept_more': king.can_accept_more_citizens
             })
         except King.DoesNotExist:
@@ -284,7 +374,7 @@ def dashboard_data(request):
     
     elif user.is_citizen:
         try:
-            citizen = user.citizen_profile
+            citizen = request.profile.citizen
             
             # Проверяем статус зачисления
             king_data = None
@@ -294,17 +384,14 @@ def dashboard_data(request):
             # Получаем тестовое испытание
             test_data = None
             has_passed_test = False
-            try:
-                test = citizen.kingdom.test
+            test = request.profile.test
+            if test is not None:
                 test_data = TestSerializer(test).data
                 
                 # Проверяем, проходил ли уже тест
                 last_attempt = citizen.test_attempts.filter(test=test).order_by('-started_at').first()
                 if last_attempt:
                     has_passed_test = last_attempt.status == 'completed'
-                
-            except Test.DoesNotExist:
-                pass
             
             return Response({
                 'user_type': 'citizen',
@@ -317,3 +404,30 @@ def dashboard_data(request):
             return Response({'error': 'Профиль подданного не найден'}, status=status.HTTP_404_NOT_FOUND)
     
     return Response({'error': 'Неизвестный тип пользователя'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def leaderboard(request):
+    """API рейтинга кандидатов королевства (лучшие результаты подданных)"""
+    if not request.user.is_king:
+        return Response({'error': 'Рейтинг доступен только королям'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        king = request.profile.king
+    except King.DoesNotExist:
+        return Response({'error': 'Профиль короля не найден'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        limit = int(request.query_params.get('limit', TOP_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit должен быть числом'}, status=status.HTTP_400_BAD_REQUEST)
+    include_enrolled = request.query_params.get('include_enrolled') in ('1', 'true')
+    
+    rankings = top_candidates(king.kingdom_id, limit, include_enrolled)
+    return Response({
+        'results': [
+            {'rank': rank, **row}
+            for rank, row in enumerate(CandidateRankingSerializer(rankings, many=True).data, start=1)
+        ]
+    })
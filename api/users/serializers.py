@@ -8,7 +8,7 @@ from django.utils import timezone
 import logging
 
 from users.models import User
-from action_logs.models import ActionLog
+from action_logs.writer import write_log
 from kingdom.models import Kingdom, Citizen, King
 
 logger = logging.getLogger('users')
@@ -78,7 +78,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             )
         
         # Логируем регистрацию
-        ActionLog.objects.create(
+        write_log(
             user=user,
             action='register',
             description=f'API регистрация пользователя {user.get_full_name()}',
@@ -7,7 +7,8 @@ from django.utils import timezone
 import logging
 
 from users.models import User
-from action_logs.models import ActionLog
+from users.authentication import tokens_for_user
+from action_logs.writer import write_log
 from .serializers import UserSerializer, UserRegistrationSerializer, UserLoginSerializer
 
 logger = logging.getLogger('users')
@@ -22,8 +23,8 @@ def register(request):
     if serializer.is_valid():
         user = serializer.save()
         
-        # Генерируем JWT токены
-        refresh = RefreshToken.for_user(user)
+        # Генерируем JWT токены (с claims роли, см. users.authentication)
+        refresh = tokens_for_user(user)
         
         return Response({
             'user': UserSerializer(user).data,
@@ -45,11 +46,11 @@ def login(request):
     if serializer.is_valid():
         user = serializer.validated_data['user']
         
-        # Генерируем JWT токены
-        refresh = RefreshToken.for_user(user)
+        # Генерируем JWT токены (с claims роли, см. users.authentication)
+        refresh = tokens_for_user(user)
         
         # Логируем вход
-        ActionLog.objects.create(
+        write_log(
             user=user,
             action='login',
             description=f'API вход пользователя {user.get_full_name()}',
@@ -106,7 +107,7 @@ def logout(request):
             token.blacklist()
         
         # Логируем выход
-        ActionLog.objects.create(
+        write_log(
             user=request.user,
             action='logout',
             description=f'API выход пользователя {request.user.get_full_name()}',
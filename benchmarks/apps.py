@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class BenchmarksConfig(AppConfig):
+    default_auto_field = 'django.db.models.UUIDField'
+    name = 'benchmarks'
+    verbose_name = 'Нагрузочное тестирование'
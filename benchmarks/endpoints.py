@@ -0,0 +1,582 @@
+"""
+Регрессионный бенчмарк эндпоинтов
+
+ENDPOINTS описывает запрос к каждому URL из users/urls.py, kingdom/urls.py,
+action_logs/urls.py и роутеров api/*: роль клиента, метод, путь и данные.
+Эндпоинты выполняются на наборах данных нескольких размеров (DATASETS,
+генератор generate_load_data); для каждого сохраняются количество
+SQL-запросов, повторяющиеся запросы, время SQL и время ответа.
+
+Каждый запрос выполняется в транзакции, которая затем откатывается, поэтому
+изменяющие эндпоинты (регистрация, ответы, зачисление) измеряются на одном
+и том же состоянии базы, а набор данных не меняется между повторами.
+
+compare сравнивает результаты с базовой линией (endpoint_baseline.json):
+регрессия - рост количества запросов или повторов на наборе и превышение
+бюджета времени ответа (бюджеты проверяет только команда benchmark_endpoints,
+тесты от времени ответа не зависят). scaling показывает эндпоинты, количество запросов
+которых растет с размером набора (кандидаты в N+1).
+"""
+import json
+import os
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.test import Client
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from action_logs import writer
+from action_logs.models import ActionLog, ExportJob
+from kingdom.models import King, Citizen, Question, TestAttempt, CandidateRanking
+from kingdom.rankings import RANKING_ORDER
+from users.authentication import tokens_for_user
+
+from .loaddata import DEFAULT_PASSWORD, LoadDataGenerator
+from .runner import BenchmarkError, Recorder
+
+User = get_user_model()
+
+BASELINE_PATH = os.path.join(settings.BASE_DIR, 'benchmarks', 'endpoint_baseline.json')
+
+# Бюджет времени ответа (p50) по умолчанию и для эндпоинтов с хешированием пароля или выгрузкой
+LATENCY_BUDGET_MS = getattr(settings, 'BENCHMARK_LATENCY_BUDGET_MS', 500)
+SLOW_BUDGET_MS = getattr(settings, 'BENCHMARK_SLOW_BUDGET_MS', 2000)
+
+# Наборы данных от меньшего к большему (параметры LoadDataGenerator)
+DATASETS = {
+    'small': {'kingdoms': 2, 'kings': 2, 'citizens': 20, 'attempts': 20, 'questions': 5, 'logs': 200, 'enroll_ratio': 0.05},
+    'large': {
+        'kingdoms': 4, 'kings': 4, 'citizens': 400, 'attempts': 480, 'questions': 10, 'logs': 4000, 'enroll_ratio': 0.05
+    },
+}
+
+# URL, не относящиеся к приложению (документация API)
+EXCLUDED_URLS = {'schema', 'swagger-ui', 'redoc'}
+
+NEW_PASSWORD = 'Benchmark-Pass-2024'
+
+
+class EndpointFixture:
+    """
+    Участники запросов на сгенерированном наборе данных
+
+    Король со свободным местом, лучший незачисленный кандидат его
+    королевства с завершенной попыткой и администратор. Объекты для
+    отдельных запросов (активная попытка, готовый экспорт) создаются
+    внутри откатываемой транзакции запроса и запоминаются до begin().
+
+    Raises:
+        BenchmarkError: Если в наборе нет подходящих данных
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.king = King.objects.filter(
+            user__username__startswith=f'{prefix}_',
+            citizens_count__lt=F('max_citizens'),
+            kingdom__test__isnull=False
+        ).select_related('user', 'kingdom__test').order_by('id').first()
+        if self.king is None:
+            raise BenchmarkError('В наборе нет короля со свободным местом')
+        self.kingdom = self.king.kingdom
+        self.test = self.kingdom.test
+
+        ranking = CandidateRanking.objects.filter(kingdom=self.kingdom, is_enrolled=False).select_related(
+            'citizen__user', 'attempt'
+        ).order_by(*RANKING_ORDER).first()
+        if ranking is None:
+            raise BenchmarkError('В королевстве нет незачисленных кандидатов')
+        self.citizen = ranking.citizen
+        self.completed_attempt = ranking.attempt
+        self.questions = list(Question.objects.filter(test=self.test).order_by('order'))
+        self.log = ActionLog.objects.filter(kingdom=self.kingdom).order_by('-created_at', '-id').first()
+
+        self.admin = User.objects.create_superuser(
+            username=f'{prefix}_admin', password=DEFAULT_PASSWORD,
+            first_name='Benchmark', last_name='Admin', role='king'
+        )
+        self.users = {'citizen': self.citizen.user, 'king': self.king.user, 'admin': self.admin}
+        self.files = []
+        self.begin()
+
+    def begin(self):
+        """Сброс объектов, созданных для предыдущего запроса"""
+        self._objects = {}
+
+    def _once(self, name, factory):
+        if name not in self._objects:
+            self._objects[name] = factory()
+        return self._objects[name]
+
+    def client(self, role, session):
+        """
+        Клиент роли: сессия (HTML-страницы) или JWT (API)
+
+        Args:
+            role: anonymous, citizen, king или admin
+            session: True - django.test.Client с входом, False - APIClient с токеном
+        """
+        client = Client() if session else APIClient()
+        if role == 'anonymous':
+            return client
+        user = self.users[role]
+        if session:
+            client.force_login(user)
+        else:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(user).access_token}')
+        return client
+
+    def no_active_attempt(self):
+        """Удаление незавершенных попыток кандидата (для начала теста)"""
+        TestAttempt.objects.filter(citizen=self.citizen, status='in_progress').delete()
+
+    def active_attempt(self):
+        """Новая незавершенная попытка кандидата"""
+        def create():
+            self.no_active_attempt()
+            return TestAttempt.objects.create(
+                citizen=self.citizen, test=self.test, total_questions=len(self.questions)
+            )
+        return self._once('active_attempt', create)
+
+    def export_job(self):
+        """Завершенная задача экспорта администратора с файлом"""
+        def create():
+            job = ExportJob(user=self.admin, export_format='csv', status='completed', completed_at=timezone.now())
+            job.file.save('benchmark.csv', ContentFile('created_at,action\n'), save=False)
+            job.save()
+            self.files.append(job.file.name)
+            return job
+        return self._once('export_job', create)
+
+    def refresh_token(self):
+        return str(tokens_for_user(self.citizen.user))
+
+    def registration(self, **extra):
+        """Данные регистрации нового подданного королевства"""
+        username = f'{self.prefix}_new'
+        return {
+            'username': username,
+            'email': f'{username}@example.com',
+            'first_name': 'Benchmark',
+            'last_name': 'New',
+            'role': 'citizen',
+            **extra,
+        }
+
+    def close(self):
+        """Удаление файлов экспорта (записи откатываются вместе с транзакцией, файлы - нет)"""
+        for name in self.files:
+            default_storage.delete(name)
+
+
+class Endpoint:
+    """
+    Запрос к эндпоинту
+
+    Args:
+        url_name: Имя URL (с пространством имен)
+        method: HTTP метод
+        role: Роль клиента: anonymous, citizen, king или admin
+        path: Функция fixture -> URL (по умолчанию reverse(url_name))
+        data: Функция fixture -> данные запроса
+        prepare: Функция fixture, готовящая состояние базы перед запросом
+        session: Клиент с сессией (HTML-страницы) вместо JWT
+        expected: Допустимые коды ответа
+        budget_ms: Бюджет времени ответа (p50)
+        template: Шаблон страницы; если его нет, эндпоинт пропускается
+        label: Уточнение имени, если эндпоинт измеряется несколькими ролями
+    """
+
+    def __init__(self, url_name, method='get', role='citizen', path=None, data=None, prepare=None, session=False,
+                 expected=(200,), budget_ms=LATENCY_BUDGET_MS, template=None, label=None):
+        self.url_name = url_name
+        self.method = method
+        self.role = role
+        self.path = path or (lambda fixture: reverse(url_name))
+        self.data = data
+        self.prepare = prepare
+        self.session = session
+        self.expected = expected
+        self.budget_ms = budget_ms
+        self.template = template
+        self.key = f'{method.upper()} {url_name}' + (f' [{label}]' if label else '')
+
+    def skip_reason(self):
+        """Причина пропуска эндпоинта или None"""
+        if self.template is None:
+            return None
+        try:
+            get_template(self.template)
+        except TemplateDoesNotExist:
+            return f'нет шаблона {self.template}'
+        return None
+
+    def measure(self, fixture, recorder):
+        """Запрос в откатываемой транзакции с измерением"""
+        with transaction.atomic():
+            fixture.begin()
+            if self.prepare:
+                self.prepare(fixture)
+            client = fixture.client(self.role, self.session)
+            path = self.path(fixture)
+            data = self.data(fixture) if self.data else None
+            extra = {} if self.session or self.method == 'get' else {'format': 'json'}
+            recorder.request(self.key, client, self.method, path, data, expected=self.expected, **extra)
+            writer.flush()
+            transaction.set_rollback(True)
+
+
+def _url(name, *args):
+    return lambda fixture: reverse(name, args=[arg(fixture) for arg in args])
+
+
+def _pk(name):
+    return lambda fixture: getattr(fixture, name).pk
+
+
+def _active_pk(fixture):
+    return fixture.active_attempt().pk
+
+
+def _answers(fixture):
+    return {'answers': [{'question_id': str(question.pk), 'answer': True} for question in fixture.questions]}
+
+
+def _candidates(fixture):
+    rankings = CandidateRanking.objects.filter(kingdom=fixture.kingdom, is_enrolled=False).order_by(*RANKING_ORDER)
+    return {'citizen_ids': [str(pk) for pk in rankings.values_list('citizen_id', flat=True)[:10]]}
+
+
+ENDPOINTS = [
+    # users/urls.py
+    Endpoint('users:home', role='anonymous', session=True, template='users/home.html'),
+    Endpoint('users:login', role='anonymous', session=True, template='users/login.html'),
+    Endpoint(
+        'users:login', 'post', role='anonymous', session=True, expected=(302,), budget_ms=SLOW_BUDGET_MS,
+        data=lambda fixture: {'username': fixture.citizen.user.username, 'password': DEFAULT_PASSWORD}
+    ),
+    Endpoint('users:logout', session=True, expected=(302,)),
+    Endpoint('users:register', role='anonymous', session=True, template='users/registration.html'),
+    Endpoint(
+        'users:register', 'post', role='anonymous', session=True, expected=(302,), budget_ms=SLOW_BUDGET_MS,
+        data=lambda fixture: fixture.registration(
+            password1=NEW_PASSWORD, password2=NEW_PASSWORD, kingdom=str(fixture.kingdom.pk)
+        )
+    ),
+    Endpoint('users:profile', session=True, template='users/profile.html'),
+    Endpoint(
+        'users:update_profile', 'post', session=True, expected=(302,),
+        data=lambda fixture: {'first_name': 'Обновленный', 'last_name': 'Подданный', 'email': fixture.citizen.user.email}
+    ),
+    # authenticate(email=...) не поддерживается ModelBackend: эндпоинт отвечает 400
+    Endpoint(
+        'users:api_login', 'post', role='anonymous', session=True, budget_ms=SLOW_BUDGET_MS, expected=(400,),
+        data=lambda fixture: {'email': fixture.citizen.user.email, 'password': DEFAULT_PASSWORD}
+    ),
+
+    # kingdom/urls.py
+    Endpoint('kingdom:king_dashboard', role='king', session=True, template='kingdom/king_dashboard.html'),
+    Endpoint('kingdom:citizen_dashboard', session=True, template='kingdom/citizen_dashboard.html'),
+    Endpoint('kingdom:test', session=True, template='kingdom/test.html', prepare=EndpointFixture.active_attempt),
+    Endpoint(
+        'kingdom:start_test', 'post', session=True, expected=(302,), prepare=EndpointFixture.no_active_attempt
+    ),
+    Endpoint(
+        'kingdom:answer_question', 'post', session=True, prepare=EndpointFixture.active_attempt,
+        path=_url('kingdom:answer_question', lambda fixture: fixture.questions[0].pk),
+        data=lambda fixture: {'answer': 'true'}
+    ),
+    Endpoint(
+        'kingdom:test_results', session=True, template='kingdom/citizen_test_results.html',
+        path=_url('kingdom:test_results', _pk('completed_attempt'))
+    ),
+    Endpoint(
+        'kingdom:enroll_citizen', 'post', role='king', session=True, expected=(302,),
+        path=_url('kingdom:enroll_citizen', _pk('citizen'))
+    ),
+    Endpoint(
+        'kingdom:citizen_details', role='king', session=True, template='kingdom/king_citizen_details.html',
+        path=_url('kingdom:citizen_details', _pk('citizen'))
+    ),
+
+    # action_logs/urls.py
+    Endpoint('action_logs:logs_dashboard', role='admin', session=True, template='action_logs/logs_dashboard.html'),
+    Endpoint(
+        'action_logs:export_logs', role='admin', session=True,
+        data=lambda fixture: {'format': 'csv', 'date_from': timezone.localdate().isoformat()}
+    ),
+    Endpoint('action_logs:user_logs', session=True, template='action_logs/user_logs.html'),
+    Endpoint('action_logs:kingdom_logs', role='king', session=True, template='action_logs/kingdom_logs.html'),
+    Endpoint('action_logs:logs_statistics', role='admin', session=True, template='action_logs/logs_statistics.html'),
+
+    # api/action_logs
+    Endpoint('api-root', role='admin'),
+    Endpoint('actionlog-list', role='admin', label='admin'),
+    Endpoint('actionlog-list', role='king', label='king'),
+    Endpoint('actionlog-detail', role='admin', path=_url('actionlog-detail', _pk('log'))),
+    Endpoint('actionlog-export', role='admin', budget_ms=SLOW_BUDGET_MS, data=lambda fixture: {'export_format': 'csv'}),
+    Endpoint('actionlog-kingdom-logs', role='king'),
+    Endpoint('actionlog-statistics', role='admin'),
+    Endpoint('actionlog-user-logs'),
+    Endpoint('exportjob-list', role='admin'),
+    Endpoint(
+        'exportjob-list', 'post', role='admin', expected=(202,),
+        data=lambda fixture: {'export_format': 'csv', 'filters': {'action': 'login'}}
+    ),
+    Endpoint('exportjob-detail', role='admin', path=_url('exportjob-detail', lambda fixture: fixture.export_job().pk)),
+    Endpoint(
+        'exportjob-download', role='admin', path=_url('exportjob-download', lambda fixture: fixture.export_job().pk)
+    ),
+
+    # api/kingdom
+    Endpoint('kingdom_api:api-root'),
+    Endpoint('kingdom_api:kingdom-list'),
+    Endpoint('kingdom_api:kingdom-detail', path=_url('kingdom_api:kingdom-detail', _pk('kingdom'))),
+    Endpoint('kingdom_api:king-list', role='king'),
+    Endpoint('kingdom_api:king-detail', role='king', path=_url('kingdom_api:king-detail', _pk('king'))),
+    Endpoint('kingdom_api:citizen-list', role='king'),
+    # Создание подданного через список не привязывает пользователя: измеряется путь валидации
+    Endpoint('kingdom_api:citizen-list', 'post', expected=(400,), data=lambda fixture: {'age': 'не число'}),
+    Endpoint('kingdom_api:citizen-detail', role='king', path=_url('kingdom_api:citizen-detail', _pk('citizen'))),
+    Endpoint(
+        'kingdom_api:citizen-detail', 'put', path=_url('kingdom_api:citizen-detail', _pk('citizen')),
+        data=lambda fixture: {'age': 30, 'pigeon_email': fixture.citizen.pigeon_email}
+    ),
+    Endpoint(
+        'kingdom_api:citizen-detail', 'patch', path=_url('kingdom_api:citizen-detail', _pk('citizen')),
+        data=lambda fixture: {'age': 31}
+    ),
+    Endpoint(
+        'kingdom_api:citizen-detail', 'delete', role='king', expected=(204,),
+        path=_url('kingdom_api:citizen-detail', _pk('citizen'))
+    ),
+    Endpoint('kingdom_api:test-list'),
+    Endpoint('kingdom_api:test-detail', path=_url('kingdom_api:test-detail', _pk('test'))),
+    Endpoint('kingdom_api:testattempt-list', role='king'),
+    # Создание попытки через список не привязывает подданного: измеряется путь валидации
+    Endpoint('kingdom_api:testattempt-list', 'post', expected=(400,), data=lambda fixture: {'status': 'unknown'}),
+    Endpoint(
+        'kingdom_api:testattempt-start-test', 'post', expected=(201,), prepare=EndpointFixture.no_active_attempt
+    ),
+    Endpoint(
+        'kingdom_api:testattempt-detail',
+        path=_url('kingdom_api:testattempt-detail', _pk('completed_attempt'))
+    ),
+    Endpoint(
+        'kingdom_api:testattempt-detail', 'put', path=_url('kingdom_api:testattempt-detail', _active_pk),
+        data=lambda fixture: {'status': 'in_progress'}
+    ),
+    Endpoint(
+        'kingdom_api:testattempt-detail', 'patch', path=_url('kingdom_api:testattempt-detail', _active_pk),
+        data=lambda fixture: {'status': 'in_progress'}
+    ),
+    Endpoint(
+        'kingdom_api:testattempt-detail', 'delete', expected=(204,),
+        path=_url('kingdom_api:testattempt-detail', _active_pk)
+    ),
+    Endpoint(
+        'kingdom_api:testattempt-answer-question', 'post',
+        path=_url('kingdom_api:testattempt-answer-question', _active_pk),
+        data=lambda fixture: {'question_id': str(fixture.questions[0].pk), 'answer': True}
+    ),
+    Endpoint(
+        'kingdom_api:testattempt-answer-questions', 'post',
+        path=_url('kingdom_api:testattempt-answer-questions', _active_pk), data=_answers
+    ),
+    Endpoint(
+        'kingdom_api:testattempt-next-question',
+        path=_url('kingdom_api:testattempt-next-question', _active_pk)
+    ),
+    Endpoint('kingdom_api:enroll_citizen', 'post', role='king', path=_url('kingdom_api:enroll_citizen', _pk('citizen'))),
+    Endpoint('kingdom_api:enroll_citizens', 'post', role='king', data=_candidates),
+    Endpoint('kingdom_api:dashboard_data', role='king', label='king'),
+    Endpoint('kingdom_api:dashboard_data', label='citizen'),
+    Endpoint('kingdom_api:leaderboard', role='king'),
+
+    # api/users
+    Endpoint(
+        'users_api:register', 'post', role='anonymous', expected=(201,), budget_ms=SLOW_BUDGET_MS,
+        data=lambda fixture: fixture.registration(
+            password=NEW_PASSWORD, password_confirm=NEW_PASSWORD, kingdom_id=str(fixture.kingdom.pk)
+        )
+    ),
+    Endpoint(
+        'users_api:login', 'post', role='anonymous', budget_ms=SLOW_BUDGET_MS,
+        data=lambda fixture: {'username': fixture.citizen.user.username, 'password': DEFAULT_PASSWORD}
+    ),
+    Endpoint('users_api:logout', 'post'),
+    Endpoint('users_api:profile'),
+    Endpoint('users_api:update_profile', 'put', data=lambda fixture: {
+        'email': fixture.citizen.user.email, 'first_name': 'Обновленный', 'last_name': 'Подданный', 'role': 'citizen'
+    }),
+    Endpoint('users_api:update_profile', 'patch', data=lambda fixture: {'first_name': 'Обновленный'}),
+
+    # JWT
+    Endpoint(
+        'token_obtain_pair', 'post', role='anonymous', budget_ms=SLOW_BUDGET_MS,
+        data=lambda fixture: {'username': fixture.citizen.user.username, 'password': DEFAULT_PASSWORD}
+    ),
+    Endpoint('token_refresh', 'post', role='anonymous', data=lambda fixture: {'refresh': fixture.refresh_token()}),
+]
+
+
+def url_methods():
+    """
+    URL приложения, которые должен покрывать ENDPOINTS
+
+    Returns:
+        Словарь имя URL -> множество методов (для ViewSet) или пустое множество
+    """
+    urls = {}
+
+    def walk(patterns, namespace=None):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                if pattern.app_name == 'admin':
+                    continue
+                walk(pattern.url_patterns, pattern.namespace or namespace)
+            elif pattern.name and pattern.name not in EXCLUDED_URLS:
+                name = f'{namespace}:{pattern.name}' if namespace else pattern.name
+                # HEAD DRF добавляет к действиям GET сам
+                actions = set(getattr(pattern.callback, 'actions', None) or {}) - {'head'}
+                urls.setdefault(name, set()).update(actions)
+
+    walk(get_resolver().url_patterns)
+    return urls
+
+
+def missing_endpoints():
+    """URL и методы ViewSet без описания в ENDPOINTS"""
+    covered = {(endpoint.url_name, endpoint.method) for endpoint in ENDPOINTS}
+    names = {endpoint.url_name for endpoint in ENDPOINTS}
+    missing = []
+    for name, methods in sorted(url_methods().items()):
+        if name not in names:
+            missing.append(name)
+        missing.extend(f'{method.upper()} {name}' for method in sorted(methods) if (name, method) not in covered)
+    return missing
+
+
+def run_endpoints(datasets=None, repeat=3):
+    """
+    Измерение всех эндпоинтов на наборах данных
+
+    Каждый набор генерируется и удаляется в откатываемой транзакции.
+
+    Args:
+        datasets: Имена наборов из DATASETS (по умолчанию - все)
+        repeat: Количество измеряемых повторов (плюс один прогревочный)
+
+    Returns:
+        Отчет: по каждому набору - его размер и сводка по эндпоинтам,
+        skipped - пропущенные эндпоинты с причиной
+    """
+    datasets = datasets or list(DATASETS)
+    unknown = set(datasets) - set(DATASETS)
+    if unknown:
+        raise BenchmarkError(f'Неизвестные наборы данных: {", ".join(sorted(unknown))}')
+
+    skipped = {endpoint.key: endpoint.skip_reason() for endpoint in ENDPOINTS if endpoint.skip_reason()}
+    endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.key not in skipped]
+    report = {'generated_at': timezone.now().isoformat(), 'repeat': repeat, 'datasets': {}, 'skipped': skipped}
+
+    for name in datasets:
+        with transaction.atomic():
+            prefix = f'endpoints_{name}'
+            size = LoadDataGenerator(prefix=prefix, progress=lambda message: None, **DATASETS[name]).run()
+            fixture = EndpointFixture(prefix)
+            recorder = Recorder()
+            try:
+                for endpoint in endpoints:
+                    recorder.enabled = False
+                    endpoint.measure(fixture, recorder)
+                    recorder.enabled = True
+                    for _ in range(repeat):
+                        endpoint.measure(fixture, recorder)
+            finally:
+                fixture.close()
+            report['datasets'][name] = {'size': size, 'endpoints': recorder.report()}
+            transaction.set_rollback(True)
+    return report
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Базовая линия или None, если файла нет"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(report, path=BASELINE_PATH):
+    """Сохранение отчета как базовой линии (только количество запросов и время)"""
+    baseline = {'datasets': {}, 'skipped': report['skipped']}
+    for name, dataset in report['datasets'].items():
+        baseline['datasets'][name] = {
+            key: {field: summary[field] for field in ('max_queries', 'duplicates', 'db_ms', 'p50_ms')}
+            for key, summary in sorted(dataset['endpoints'].items())
+        }
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(baseline, output, ensure_ascii=False, indent=2)
+        output.write('\n')
+
+
+def compare(report, baseline, latency=True):
+    """
+    Регрессии отчета относительно базовой линии и бюджетов времени
+
+    Args:
+        report: Отчет run_endpoints
+        baseline: Базовая линия (load_baseline) или None - только бюджеты и N+1
+        latency: Проверять ли бюджеты времени ответа (зависят от машины,
+            поэтому тесты проверяют только запросы)
+
+    Returns:
+        Список описаний регрессий (пустой - регрессий нет)
+    """
+    budgets = {endpoint.key: endpoint.budget_ms for endpoint in ENDPOINTS}
+    problems = []
+    for name, dataset in report['datasets'].items():
+        expected = (baseline or {}).get('datasets', {}).get(name, {})
+        for key, summary in dataset['endpoints'].items():
+            base = expected.get(key)
+            if baseline is not None and base is None:
+                problems.append(f'{name} {key}: нет в базовой линии')
+            elif base is not None:
+                if summary['max_queries'] > base['max_queries']:
+                    problems.append(
+                        f'{name} {key}: запросов {summary["max_queries"]}, в базовой линии {base["max_queries"]}'
+                    )
+                if summary['duplicates'] > base['duplicates']:
+                    problems.append(
+                        f'{name} {key}: повторов {summary["duplicates"]}, в базовой линии {base["duplicates"]}'
+                    )
+            budget = budgets.get(key, LATENCY_BUDGET_MS)
+            if latency and summary['p50_ms'] > budget:
+                problems.append(f'{name} {key}: p50 {summary["p50_ms"]} мс, бюджет {budget} мс')
+    return problems
+
+
+def scaling(report):
+    """
+    Эндпоинты, количество запросов которых растет с размером набора
+
+    Returns:
+        Список описаний: эндпоинт и количество запросов на каждом наборе
+    """
+    names = [name for name in DATASETS if name in report['datasets']]
+    growing = []
+    for key in report['datasets'][names[0]]['endpoints'] if names else ():
+        queries = [report['datasets'][name]['endpoints'].get(key, {}).get('max_queries', 0) for name in names]
+        if any(later > earlier for earlier, later in zip(queries, queries[1:])):
+            growing.append(f'{key}: ' + ', '.join(f'{name} {count}' for name, count in zip(names, queries)))
+    return growing
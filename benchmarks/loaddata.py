@@ -0,0 +1,326 @@
+"""
+Синтетические данные для нагрузочного тестирования
+
+LoadDataGenerator создает королевства с тестами, королей, подданных,
+попытки прохождения теста с ответами и логи действий пачками bulk_create.
+Случайность задается seed: при одинаковых параметрах генерируется
+один и тот же набор данных (включая идентификаторы), поэтому результаты
+бенчмарков на разных машинах сравнимы.
+
+Подданные генерируются потоком по batch_size записей: пользователи,
+профили, попытки и ответы одной пачки записываются в одной транзакции,
+и в памяти не держится весь набор. После генерации пересчитываются
+счетчики подданных королей, рейтинг кандидатов и суточная сводка логов.
+"""
+import hashlib
+import logging
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from action_logs import partitions
+from action_logs.models import ActionLog
+from action_logs.rollup import rollup_days
+from kingdom.models import Kingdom, King, Citizen, Test, Question, TestAttempt, Answer
+from kingdom.rankings import rebuild_rankings
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+DEFAULT_PASSWORD = 'loadtest123'
+
+FIRST_NAMES = ('Анна', 'Борис', 'Виктория', 'Григорий', 'Дарья', 'Елисей', 'Жанна', 'Захар', 'Ирина', 'Кирилл')
+LAST_NAMES = ('Северный', 'Золотой', 'Лесной', 'Горный', 'Морской', 'Речной', 'Степной', 'Озерный')
+LOG_ACTIONS = [action for action, _ in ActionLog.ACTION_CHOICES]
+
+
+def stable_uuid(seed, kind, index):
+    """Детерминированный UUID записи по seed, типу и номеру"""
+    digest = hashlib.md5(f'{seed}:{kind}:{index}'.encode()).digest()
+    return uuid.UUID(bytes=digest, version=4)
+
+
+def spread(total, parts, index):
+    """Доля total для части index при равномерном распределении по parts частям"""
+    return total * (index + 1) // parts - total * index // parts
+
+
+class LoadDataGenerator:
+    """
+    Генератор набора данных заданного размера
+
+    Args:
+        kingdoms: Количество королевств (у каждого - тест)
+        kings: Количество королей (не больше kingdoms, у королевства один король)
+        citizens: Количество подданных
+        attempts: Количество попыток прохождения теста (равномерно по подданным)
+        questions: Количество вопросов в тесте; завершенная попытка отвечает на все
+        logs: Количество логов действий
+        days: Период логов и регистраций в днях до текущего момента
+        king_capacity: Максимальное количество подданных короля (1-10)
+        enroll_ratio: Доля зачисляемых подданных среди прошедших тест
+        in_progress_ratio: Доля незавершенных последних попыток
+        seed: Начальное значение генератора случайных чисел
+        prefix: Префикс имен пользователей
+        batch_size: Размер пачки bulk_create
+        password: Пароль всех пользователей набора
+        progress: Функция для вывода сообщений о ходе генерации
+    """
+
+    def __init__(self, kingdoms=50, kings=50, citizens=10000, attempts=8000, questions=10, logs=50000,
+                 days=90, king_capacity=10, enroll_ratio=0.3, in_progress_ratio=0.1, seed=0,
+                 prefix='load', batch_size=BATCH_SIZE, password=DEFAULT_PASSWORD, progress=None):
+        if kingdoms < 1:
+            raise ValueError('Нужно хотя бы одно королевство')
+        if kings > kingdoms:
+            raise ValueError('У королевства может быть только один король: kings не больше kingdoms')
+        if not 1 <= king_capacity <= 10:
+            raise ValueError('Вместимость короля должна быть от 1 до 10')
+        self.kingdoms = kingdoms
+        self.kings = kings
+        self.citizens = citizens
+        self.attempts = attempts
+        self.questions = questions
+        self.logs = logs
+        self.days = days
+        self.king_capacity = king_capacity
+        self.enroll_ratio = enroll_ratio
+        self.in_progress_ratio = in_progress_ratio
+        self.seed = seed
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.password = password
+        self.progress = progress or logger.info
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+
+    def _uuid(self, kind, index):
+        return stable_uuid(f'{self.seed}:{self.prefix}', kind, index)
+
+    def _name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def _past(self):
+        return self.now - timedelta(seconds=self.rng.random() * self.days * 24 * 60 * 60)
+
+    def run(self):
+        """
+        Генерация набора данных
+
+        Returns:
+            Словарь с количеством созданных записей по типам
+
+        Raises:
+            ValueError: Если пользователи с таким префиксом уже существуют
+        """
+        if User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise ValueError(f'Пользователи с префиксом {self.prefix}_ уже существуют')
+
+        self.password_hash = make_password(self.password)
+        self.counts = dict.fromkeys(
+            ('kingdoms', 'questions', 'kings', 'citizens', 'enrolled', 'attempts', 'answers', 'logs', 'rankings'), 0
+        )
+        for stage in (self._create_kingdoms, self._create_kings, self._create_citizens,
+                      self._update_kings, self._create_logs, self._rebuild_summaries):
+            started = time.monotonic()
+            stage()
+            self.progress(f'{stage.__name__.strip("_")}: {time.monotonic() - started:.1f} с')
+        return self.counts
+
+    def _create_kingdoms(self):
+        self.kingdom_ids = []
+        self.test_ids = []
+        self.test_questions = []
+        kingdoms, tests, questions = [], [], []
+        for index in range(self.kingdoms):
+            kingdom = Kingdom(
+                id=self._uuid('kingdom', index),
+                name=f'{self.prefix} Королевство {index + 1}',
+                description='Королевство для нагрузочного тестирования'
+            )
+            test = Test(id=self._uuid('test', index), kingdom=kingdom, title=f'Испытание королевства {index + 1}')
+            test_questions = []
+            for order in range(1, self.questions + 1):
+                question = Question(
+                    id=self._uuid('question', index * self.questions + order),
+                    test=test,
+                    text=f'Вопрос {order} испытания королевства {index + 1}?',
+                    correct_answer=self.rng.random() < 0.5,
+                    order=order
+                )
+                questions.append(question)
+                test_questions.append((question.id, question.correct_answer))
+            kingdoms.append(kingdom)
+            tests.append(test)
+            self.kingdom_ids.append(kingdom.id)
+            self.test_ids.append(test.id)
+            self.test_questions.append(test_questions)
+
+        with transaction.atomic():
+            Kingdom.objects.bulk_create(kingdoms, batch_size=self.batch_size)
+            Test.objects.bulk_create(tests, batch_size=self.batch_size)
+            Question.objects.bulk_create(questions, batch_size=self.batch_size)
+        self.counts['kingdoms'] = len(kingdoms)
+        self.counts['questions'] = len(questions)
+
+    def _user(self, kind, index, role, email=None):
+        first_name, last_name = self._name()
+        return User(
+            id=self._uuid(f'user-{kind}', index),
+            username=f'{self.prefix}_{kind}_{index}',
+            email=email,
+            first_name=first_name,
+            last_name=last_name,
+            role=role,
+            password=self.password_hash,
+            date_joined=self._past()
+        )
+
+    def _create_kings(self):
+        # Король королевства: [id, вместимость, количество подданных] или None
+        self.kingdom_kings = [None] * self.kingdoms
+        for start in range(0, self.kings, self.batch_size):
+            users, kings = [], []
+            for index in range(start, min(start + self.batch_size, self.kings)):
+                user = self._user('king', index, 'king')
+                king = King(
+                    id=self._uuid('king', index),
+                    user=user,
+                    kingdom_id=self.kingdom_ids[index],
+                    max_citizens=self.rng.randint(1, self.king_capacity)
+                )
+                users.append(user)
+                kings.append(king)
+                self.kingdom_kings[index] = [king.id, king.max_citizens, 0]
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                King.objects.bulk_create(kings)
+        self.counts['kings'] = self.kings
+
+    def _create_citizens(self):
+        for start in range(0, self.citizens, self.batch_size):
+            batch = {'users': [], 'citizens': [], 'attempts': [], 'answers': []}
+            for index in range(start, min(start + self.batch_size, self.citizens)):
+                self._add_citizen(index, batch)
+            with transaction.atomic():
+                User.objects.bulk_create(batch['users'])
+                Citizen.objects.bulk_create(batch['citizens'])
+                TestAttempt.objects.bulk_create(batch['attempts'])
+                Answer.objects.bulk_create(batch['answers'], batch_size=self.batch_size)
+            self.counts['citizens'] += len(batch['citizens'])
+            self.counts['attempts'] += len(batch['attempts'])
+            self.counts['answers'] += len(batch['answers'])
+            self.progress(f'Подданные: {self.counts["citizens"]}/{self.citizens}')
+
+    def _add_citizen(self, index, batch):
+        kingdom_index = index % self.kingdoms
+        email = f'{self.prefix}.citizen{index}@example.com'
+        user = self._user('citizen', index, 'citizen', email)
+        citizen = Citizen(
+            id=self._uuid('citizen', index),
+            user=user,
+            kingdom_id=self.kingdom_ids[kingdom_index],
+            age=self.rng.randint(16, 80),
+            pigeon_email=email
+        )
+        batch['users'].append(user)
+        batch['citizens'].append(citizen)
+
+        attempts = spread(self.attempts, self.citizens, index)
+        passed = False
+        for number in range(attempts):
+            in_progress = number == attempts - 1 and self.rng.random() < self.in_progress_ratio
+            passed |= self._add_attempt(citizen, kingdom_index, f'{index}-{number}', in_progress, batch)
+
+        if passed and self.rng.random() < self.enroll_ratio:
+            king = self.kingdom_kings[kingdom_index]
+            if king is not None and king[2] < king[1]:
+                king[2] += 1
+                citizen.is_enrolled = True
+                citizen.king_id = king[0]
+                citizen.enrolled_at = self._past()
+                self.counts['enrolled'] += 1
+
+    def _add_attempt(self, citizen, kingdom_index, key, in_progress, batch):
+        """Попытка с ответами; возвращает True для завершенной попытки"""
+        questions = self.test_questions[kingdom_index]
+        answered = self.rng.randint(0, max(len(questions) - 1, 0)) if in_progress else len(questions)
+        attempt = TestAttempt(
+            id=self._uuid('attempt', key),
+            citizen=citizen,
+            test_id=self.test_ids[kingdom_index],
+            total_questions=len(questions),
+            answered_count=answered,
+            question_cursor=answered
+        )
+        score = 0
+        for question_id, correct_answer in questions[:answered]:
+            is_correct = self.rng.random() < 0.7
+            score += is_correct
+            batch['answers'].append(Answer(
+                attempt=attempt,
+                question_id=question_id,
+                answer=correct_answer if is_correct else not correct_answer,
+                is_correct=is_correct
+            ))
+        attempt.score = score
+        if not in_progress:
+            attempt.status = 'completed'
+            attempt.completed_at = self._past()
+        batch['attempts'].append(attempt)
+        return not in_progress
+
+    def _update_kings(self):
+        kings = [
+            King(id=king_id, citizens_count=count)
+            for king_id, _, count in filter(None, self.kingdom_kings)
+            if count
+        ]
+        King.objects.bulk_update(kings, ['citizens_count'], batch_size=self.batch_size)
+
+    def _create_logs(self):
+        if not self.logs:
+            return
+        # Секции за весь период, чтобы логи не попадали в секцию по умолчанию
+        if partitions.is_partitioned():
+            month = partitions.month_start(self.now - timedelta(days=self.days))
+            while month <= partitions.month_start(self.now):
+                partitions.create_partition(month)
+                month = partitions.add_months(month, 1)
+
+        for start in range(0, self.logs, self.batch_size):
+            logs = []
+            for _ in range(start, min(start + self.batch_size, self.logs)):
+                if self.kings and self.rng.random() < 0.05:
+                    index = self.rng.randrange(self.kings)
+                    user_id = self._uuid('user-king', index)
+                else:
+                    if not self.citizens:
+                        continue
+                    index = self.rng.randrange(self.citizens)
+                    user_id = self._uuid('user-citizen', index)
+                action = self.rng.choice(LOG_ACTIONS)
+                logs.append(ActionLog(
+                    user_id=user_id,
+                    kingdom_id=self.kingdom_ids[index % self.kingdoms],
+                    action=action,
+                    description=f'Нагрузочное тестирование: {action}',
+                    ip_address=f'10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}',
+                    user_agent='generate_load_data',
+                    created_at=self._past()
+                ))
+            ActionLog.objects.bulk_create(logs)
+            self.counts['logs'] += len(logs)
+
+    def _rebuild_summaries(self):
+        self.counts['rankings'] = rebuild_rankings()
+        if self.counts['logs']:
+            rollup_days(timezone.localdate(self.now - timedelta(days=self.days)), timezone.localdate(self.now))
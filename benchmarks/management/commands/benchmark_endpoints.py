@@ -0,0 +1,76 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks.endpoints import (
+    BASELINE_PATH, DATASETS, compare, load_baseline, run_endpoints, save_baseline, scaling
+)
+from benchmarks.runner import BenchmarkError
+
+
+class Command(BaseCommand):
+    help = (
+        'Регрессионный бенчмарк всех эндпоинтов: количество SQL-запросов, повторы, время SQL и ответа '
+        'на наборах данных разного размера в тестовой базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            action='append',
+            choices=list(DATASETS),
+            help='Набор данных (можно указать несколько раз), по умолчанию - все'
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Количество измеряемых повторов запроса')
+        parser.add_argument('--baseline', default=BASELINE_PATH, help='JSON-файл базовой линии')
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Сохранить результаты как базовую линию вместо сравнения'
+        )
+        parser.add_argument('--output', help='JSON-файл полного отчета')
+        parser.add_argument('--keepdb', action='store_true', help='Не удалять тестовую базу после прогона')
+
+    def handle(self, *args, **options):
+        # Как и тесты, бенчмарк работает в отдельной тестовой базе
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = run_endpoints(options['dataset'], repeat=options['repeat'])
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+                output.write('\n')
+
+        for name, dataset in report['datasets'].items():
+            self.stdout.write(f'{name}: {dataset["size"]["citizens"]} подданных')
+            for key, summary in dataset['endpoints'].items():
+                self.stdout.write(
+                    f'  {key}: запросов {summary["max_queries"]}, повторов {summary["duplicates"]}, '
+                    f'SQL {summary["db_ms"]} мс, p50 {summary["p50_ms"]} мс'
+                )
+        for key, reason in report['skipped'].items():
+            self.stdout.write(self.style.WARNING(f'Пропущен {key}: {reason}'))
+        for line in scaling(report):
+            self.stdout.write(self.style.WARNING(f'Запросы растут с размером набора: {line}'))
+
+        if options['update_baseline']:
+            save_baseline(report, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия сохранена в {options["baseline"]}'))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline is None:
+            raise CommandError(f'Нет базовой линии {options["baseline"]}: запустите с --update-baseline')
+        problems = compare(report, baseline)
+        if problems:
+            raise CommandError('Регрессии:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.notifications import run_notification_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Микробенчмарк рендеринга уведомлений: f-строки и strip_tags против предкомпилированных шаблонов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cohort', type=int, default=100, help='Количество писем в когорте')
+        parser.add_argument('--kings', type=int, default=1, help='Количество разных королей в когорте')
+        parser.add_argument('--iterations', type=int, default=50, help='Количество измеряемых итераций')
+        parser.add_argument('--warmup', type=int, default=3, help='Количество итераций прогрева')
+
+    def handle(self, *args, **options):
+        if options['cohort'] < 1 or options['kings'] < 1 or options['iterations'] < 1:
+            raise CommandError('--cohort, --kings и --iterations должны быть положительными')
+
+        report = run_notification_benchmark(
+            cohort=options['cohort'],
+            kings=options['kings'],
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+        )
+        for mode, summary in report.items():
+            self.stdout.write(
+                f'{mode}: p50 {summary["p50_ms"]} мс, p95 {summary["p95_ms"]} мс, '
+                f'{summary["per_message_us"]} мкс на письмо'
+            )
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.loaddata import BATCH_SIZE, DEFAULT_PASSWORD, LoadDataGenerator
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетического набора данных для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kingdoms', type=int, default=50, help='Количество королевств')
+        parser.add_argument('--kings', type=int, default=50, help='Количество королей (не больше королевств)')
+        parser.add_argument('--citizens', type=int, default=10000, help='Количество подданных')
+        parser.add_argument('--attempts', type=int, default=8000, help='Количество попыток прохождения теста')
+        parser.add_argument('--questions', type=int, default=10, help='Количество вопросов в тесте королевства')
+        parser.add_argument('--logs', type=int, default=50000, help='Количество логов действий')
+        parser.add_argument('--days', type=int, default=90, help='Период логов и регистраций в днях')
+        parser.add_argument('--king-capacity', type=int, default=10, help='Максимум подданных короля (1-10)')
+        parser.add_argument('--enroll-ratio', type=float, default=0.3, help='Доля зачисляемых среди прошедших тест')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--prefix', default='load', help='Префикс имен пользователей')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Размер пачки bulk_create')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Пароль всех пользователей')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            generator = LoadDataGenerator(
+                kingdoms=options['kingdoms'],
+                kings=options['kings'],
+                citizens=options['citizens'],
+                attempts=options['attempts'],
+                questions=options['questions'],
+                logs=options['logs'],
+                days=options['days'],
+                king_capacity=options['king_capacity'],
+                enroll_ratio=options['enroll_ratio'],
+                seed=options['seed'],
+                prefix=options['prefix'],
+                batch_size=options['batch_size'],
+                password=options['password'],
+                progress=self.stdout.write,
+            )
+            counts = generator.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for name, count in counts.items():
+            self.stdout.write(f'  {name}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Данные созданы за {time.monotonic() - started:.1f} с'))
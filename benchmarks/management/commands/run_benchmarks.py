@@ -0,0 +1,55 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks.runner import BenchmarkError
+from benchmarks.scenarios import SCENARIOS, run_scenarios
+
+DEFAULT_OUTPUT = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Сценарии нагрузочного тестирования: p50/p95/p99 и количество SQL-запросов на запрос'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=sorted(SCENARIOS),
+            help='Сценарий (можно указать несколько раз), по умолчанию - все'
+        )
+        parser.add_argument('--iterations', type=int, default=20, help='Количество измеряемых итераций')
+        parser.add_argument('--warmup', type=int, default=2, help='Количество итераций прогрева')
+        parser.add_argument('--export-days', type=int, default=1, help='Период экспорта логов в днях')
+        parser.add_argument('--output', default=DEFAULT_OUTPUT, help='JSON-файл отчета')
+
+    def handle(self, *args, **options):
+        # Тестовое окружение: локальная почта и допустимый хост тестового клиента
+        setup_test_environment()
+        try:
+            report = run_scenarios(
+                options['scenario'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                export_days=options['export_days'],
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            teardown_test_environment()
+
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+            output.write('\n')
+
+        for scenario, steps in report['scenarios'].items():
+            self.stdout.write(scenario)
+            for step, summary in steps.items():
+                self.stdout.write(
+                    f'  {step}: p50 {summary["p50_ms"]} мс, p95 {summary["p95_ms"]} мс, '
+                    f'p99 {summary["p99_ms"]} мс, запросов {summary["queries"]}'
+                )
+        self.stdout.write(self.style.SUCCESS(f'Отчет сохранен в {options["output"]}'))
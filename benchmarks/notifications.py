@@ -0,0 +1,84 @@
+"""
+Микробенчмарк рендеринга уведомлений
+
+Сравнивает три способа подготовить уведомления о зачислении для когорты:
+
+    legacy - HTML из f-строки и текст через strip_tags на каждое письмо
+    (как до kingdom.rendering);
+    render - предкомпилированные шаблоны, рендеринг на каждое письмо;
+    batch - kingdom.rendering.render_batch для всей когорты.
+
+Обращений к базе нет, уведомления не сохраняются.
+"""
+import time
+
+from django.utils.html import strip_tags
+
+from kingdom import rendering
+from .runner import percentile
+
+MODES = ('legacy', 'render', 'batch')
+
+
+def legacy_enrollment(king_name, kingdom_name):
+    """Рендеринг уведомления о зачислении прежним способом"""
+    html_message = f"""
+        <html>
+        <body>
+            <h2>Поздравляем!</h2>
+            <p>Дорогой подданный,</p>
+            <p>Мы рады сообщить, что король <strong>{king_name}</strong>
+            зачислил вас в подданные королевства <strong>{kingdom_name}</strong>!</p>
+            <p>Теперь вы официально являетесь подданным этого королевства.</p>
+            <p>С уважением,<br>
+            Кадровая служба королевства</p>
+        </body>
+        </html>
+        """
+    subject = f'Поздравляем! Вы зачислены в королевство {kingdom_name}'
+    return subject, strip_tags(html_message), html_message
+
+
+def _run(mode, contexts):
+    if mode == 'legacy':
+        return [legacy_enrollment(**context) for context in contexts]
+    if mode == 'render':
+        return [rendering.render('enrollment', **context) for context in contexts]
+    return rendering.render_batch('enrollment', contexts)
+
+
+def run_notification_benchmark(cohort=100, kings=1, iterations=50, warmup=3):
+    """
+    Микробенчмарк рендеринга уведомлений о зачислении
+
+    Args:
+        cohort: Количество писем в когорте
+        kings: Количество разных королей в когорте
+        iterations: Количество измеряемых итераций
+        warmup: Количество итераций прогрева (компиляция шаблонов)
+
+    Returns:
+        Словарь {режим: сводка}, сводка - p50_ms, p95_ms, mean_ms на когорту
+        и per_message_us (среднее на письмо)
+    """
+    contexts = [
+        {'king_name': f'Король {index % kings}', 'kingdom_name': f'Королевство {index % kings}'}
+        for index in range(cohort)
+    ]
+    report = {}
+    for mode in MODES:
+        for _ in range(warmup):
+            _run(mode, contexts)
+        wall = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            _run(mode, contexts)
+            wall.append((time.perf_counter() - started) * 1000)
+        mean = sum(wall) / len(wall)
+        report[mode] = {
+            'p50_ms': round(percentile(wall, 50), 3),
+            'p95_ms': round(percentile(wall, 95), 3),
+            'mean_ms': round(mean, 3),
+            'per_message_us': round(mean * 1000 / cohort, 2),
+        }
+    return report
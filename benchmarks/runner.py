@@ -0,0 +1,113 @@
+"""
+Измерение запросов к приложению для бенчмарков
+
+Recorder выполняет запрос тестовым клиентом Django и сохраняет для него
+время ответа, количество SQL-запросов, количество повторов (одинаковый
+SQL с одинаковыми параметрами) и суммарное время SQL. Потоковые ответы
+(экспорт) читаются целиком внутри измерения.
+"""
+import math
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class BenchmarkError(Exception):
+    """Неожиданный ответ приложения во время бенчмарка"""
+
+
+def percentile(values, percent):
+    """
+    Процентиль с линейной интерполяцией
+
+    Args:
+        values: Список значений
+        percent: Процентиль (0-100)
+
+    Returns:
+        Значение процентиля или None для пустого списка
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples):
+    """
+    Сводка измерений одного шага
+
+    Returns:
+        Словарь requests, p50_ms, p95_ms, p99_ms, mean_ms, max_ms,
+        queries (среднее на запрос), max_queries, duplicates (максимум
+        на запрос), db_ms (среднее на запрос)
+    """
+    wall = [sample['wall_ms'] for sample in samples]
+    queries = [sample['queries'] for sample in samples]
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(wall, 50), 2),
+        'p95_ms': round(percentile(wall, 95), 2),
+        'p99_ms': round(percentile(wall, 99), 2),
+        'mean_ms': round(sum(wall) / len(wall), 2),
+        'max_ms': round(max(wall), 2),
+        'queries': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+        'duplicates': max(sample['duplicates'] for sample in samples),
+        'db_ms': round(sum(sample['db_ms'] for sample in samples) / len(samples), 2),
+    }
+
+
+class Recorder:
+    """Измерения запросов, сгруппированные по именам шагов"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.enabled = True
+
+    def request(self, name, client, method, path, data=None, expected=(200,), **extra):
+        """
+        Запрос тестовым клиентом с измерением
+
+        Args:
+            name: Имя шага в отчете
+            client: django.test.Client или APIClient
+            method: HTTP метод ('get', 'post', ...)
+            path: URL
+            data: Данные запроса
+            expected: Допустимые коды ответа
+
+        Returns:
+            Ответ приложения
+
+        Raises:
+            BenchmarkError: Если код ответа не входит в expected
+        """
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, **extra)
+            if getattr(response, 'streaming', False):
+                for _ in response.streaming_content:
+                    pass
+            wall_ms = (time.perf_counter() - started) * 1000
+
+        if response.status_code not in expected:
+            raise BenchmarkError(f'{name}: {method.upper()} {path} вернул {response.status_code}')
+        if self.enabled:
+            sql = [query['sql'] for query in queries.captured_queries]
+            self.samples[name].append({
+                'wall_ms': wall_ms,
+                'queries': len(sql),
+                'duplicates': len(sql) - len(set(sql)),
+                'db_ms': sum(float(query['time']) for query in queries.captured_queries) * 1000,
+            })
+        return response
+
+    def report(self):
+        """Сводка по всем шагам"""
+        return {name: summarize(samples) for name, samples in self.samples.items()}
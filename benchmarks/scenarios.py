@@ -0,0 +1,215 @@
+"""
+Сценарии бенчмарков
+
+Сценарии выполняются тестовым клиентом Django против текущей базы
+(обычно с набором generate_load_data) и повторяют типичные действия:
+
+    enrollment - регистрация подданного, прохождение теста, зачисление королем;
+    dashboards - панели короля и подданного, рейтинг и списки API;
+    log_export - статистика и список логов API, экспорт CSV за период.
+
+Пользователи, созданные сценарием enrollment, удаляются после каждой
+итерации, поэтому места королей и данные базы не расходуются.
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from action_logs import writer
+from action_logs.models import ActionLog
+from action_logs.pagination import approximate_count
+from kingdom.models import Kingdom, King, Citizen, TestAttempt
+from users.authentication import tokens_for_user
+
+from .runner import BenchmarkError, Recorder
+
+User = get_user_model()
+
+PASSWORD = 'benchmark123'
+
+
+def _api_client(user=None):
+    client = APIClient()
+    if user is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(user).access_token}')
+    return client
+
+
+def _session_client(user):
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+class BenchmarkContext:
+    """
+    Участники сценариев: король со свободным местом, подданный
+    его королевства и администратор
+
+    Raises:
+        BenchmarkError: Если в базе нет подходящих данных
+    """
+
+    def __init__(self, prefix='bench', export_days=1):
+        self.prefix = prefix
+        self.export_days = export_days
+        self.king = King.objects.filter(
+            citizens_count__lt=F('max_citizens'),
+            kingdom__test__isnull=False
+        ).select_related('user', 'kingdom').order_by('id').first()
+        if self.king is None:
+            raise BenchmarkError('Нет короля со свободным местом: сгенерируйте данные командой generate_load_data')
+        self.citizen = Citizen.objects.filter(kingdom_id=self.king.kingdom_id).select_related('user').order_by('id').first()
+        if self.citizen is None:
+            raise BenchmarkError('В королевстве короля нет подданных')
+
+        self.created_admin = False
+        self.admin = User.objects.filter(is_staff=True, is_active=True).order_by('date_joined').first()
+        if self.admin is None:
+            self.admin = User.objects.create_superuser(
+                username=f'{prefix}_admin', password=PASSWORD,
+                first_name='Benchmark', last_name='Admin', role='king'
+            )
+            self.created_admin = True
+
+        self.king_api = _api_client(self.king.user)
+        self.citizen_api = _api_client(self.citizen.user)
+        self.admin_api = _api_client(self.admin)
+        self.king_session = _session_client(self.king.user)
+        self.citizen_session = _session_client(self.citizen.user)
+        self.admin_session = _session_client(self.admin)
+
+    def close(self):
+        """Удаление служебных данных сценариев"""
+        writer.flush()
+        User.objects.filter(username__startswith=f'{self.prefix}_run_').delete()
+        if self.created_admin:
+            self.admin.delete()
+
+
+def enrollment(context, recorder, iteration):
+    """Регистрация подданного, прохождение теста и зачисление королем"""
+    client = _api_client()
+    username = f'{context.prefix}_run_{iteration}'
+    response = recorder.request('register', client, 'post', '/api/users/auth/register/', {
+        'username': username,
+        'email': f'{username}@example.com',
+        'first_name': 'Benchmark',
+        'last_name': str(iteration),
+        'role': 'citizen',
+        'password': PASSWORD,
+        'password_confirm': PASSWORD,
+        'kingdom_id': str(context.king.kingdom_id),
+    }, expected=(201,), format='json')
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["tokens"]["access"]}')
+
+    try:
+        response = recorder.request(
+            'start_test', client, 'post', '/api/kingdom/test-attempts/start_test/', expected=(201,)
+        )
+        attempt_id = response.data['attempt']['id']
+
+        response = recorder.request('test', client, 'get', '/api/kingdom/tests/')
+        questions = response.data['results'][0]['questions']
+
+        recorder.request(
+            'answer_questions', client, 'post', f'/api/kingdom/test-attempts/{attempt_id}/answer_questions/',
+            {'answers': [{'question_id': question['id'], 'answer': True} for question in questions]},
+            format='json'
+        )
+
+        response = recorder.request('citizen_profile', client, 'get', '/api/kingdom/citizens/')
+        citizen_id = response.data['results'][0]['id']
+
+        recorder.request('enroll', context.king_api, 'post', f'/api/kingdom/citizens/{citizen_id}/enroll/')
+    finally:
+        # Подданный удаляется, место короля освобождается (сигнал post_delete)
+        writer.flush()
+        User.objects.filter(username=username).delete()
+
+
+def dashboards(context, recorder, iteration):
+    """Панели короля и подданного, рейтинг кандидатов и списки API"""
+    recorder.request('king_dashboard', context.king_session, 'get', reverse('kingdom:king_dashboard'))
+    recorder.request('citizen_dashboard', context.citizen_session, 'get', reverse('kingdom:citizen_dashboard'))
+    recorder.request('api_king_dashboard', context.king_api, 'get', '/api/kingdom/dashboard/')
+    recorder.request('api_citizen_dashboard', context.citizen_api, 'get', '/api/kingdom/dashboard/')
+    recorder.request('api_leaderboard', context.king_api, 'get', '/api/kingdom/leaderboard/')
+    recorder.request('api_citizens', context.king_api, 'get', '/api/kingdom/citizens/')
+    recorder.request('api_test_attempts', context.king_api, 'get', '/api/kingdom/test-attempts/')
+
+
+def log_export(context, recorder, iteration):
+    """Статистика и список логов API, экспорт CSV за последние дни"""
+    today = timezone.localdate()
+    recorder.request('api_logs_statistics', context.admin_api, 'get', '/api/action-logs/logs/statistics/')
+    recorder.request('api_logs', context.admin_api, 'get', '/api/action-logs/logs/')
+    recorder.request('export_csv', context.admin_session, 'get', reverse('action_logs:export_logs'), {
+        'format': 'csv',
+        'date_from': (today - timedelta(days=context.export_days - 1)).isoformat(),
+        'date_to': today.isoformat(),
+    })
+
+
+SCENARIOS = {
+    'enrollment': enrollment,
+    'dashboards': dashboards,
+    'log_export': log_export,
+}
+
+
+def dataset_size():
+    """Размер набора данных (логи - оценка без COUNT(*))"""
+    return {
+        'kingdoms': Kingdom.objects.count(),
+        'kings': King.objects.count(),
+        'citizens': Citizen.objects.count(),
+        'attempts': TestAttempt.objects.count(),
+        'logs': approximate_count(ActionLog.objects.all()),
+    }
+
+
+def run_scenarios(names=None, iterations=20, warmup=2, prefix='bench', export_days=1):
+    """
+    Выполнение сценариев
+
+    Args:
+        names: Имена сценариев из SCENARIOS (по умолчанию - все)
+        iterations: Количество измеряемых итераций сценария
+        warmup: Количество итераций прогрева (кэши, соединения), не попадающих в отчет
+        prefix: Префикс служебных пользователей
+        export_days: Период экспорта логов в днях
+
+    Returns:
+        Отчет: размер набора данных и сводка по шагам каждого сценария
+    """
+    names = names or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise BenchmarkError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+
+    context = BenchmarkContext(prefix, export_days)
+    report = {
+        'generated_at': timezone.now().isoformat(),
+        'iterations': iterations,
+        'dataset': dataset_size(),
+        'scenarios': {},
+    }
+    try:
+        for name in names:
+            recorder = Recorder()
+            recorder.enabled = False
+            for iteration in range(warmup):
+                SCENARIOS[name](context, recorder, f'warmup_{iteration}')
+            recorder.enabled = True
+            for iteration in range(iterations):
+                SCENARIOS[name](context, recorder, iteration)
+            report['scenarios'][name] = recorder.report()
+    finally:
+        context.close()
+    return report
@@ -0,0 +1,226 @@
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from action_logs.models import ActionLog
+from kingdom.models import Kingdom, King, Citizen, TestAttempt, Answer, CandidateRanking
+
+from .endpoints import LATENCY_BUDGET_MS, compare, load_baseline, missing_endpoints, run_endpoints, scaling
+from .loaddata import LoadDataGenerator, spread
+from .notifications import MODES, legacy_enrollment, run_notification_benchmark
+from .runner import BenchmarkError, percentile, summarize
+from .scenarios import run_scenarios
+
+User = get_user_model()
+
+# Общий для процессов кэш для сравнения с базовой линией:
+# базовая линия снята с кэшем снимков пользователей JWT (не LocMemCache)
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'hart_citizens_test_cache'),
+    }
+}
+
+
+class LoadDataGeneratorTest(TestCase):
+    """Тесты генератора синтетических данных"""
+
+    def generate(self, **options):
+        params = dict(kingdoms=3, kings=2, citizens=30, attempts=40, questions=4, logs=50, days=10, seed=1)
+        params.update(options)
+        return LoadDataGenerator(progress=lambda message: None, **params).run()
+
+    def test_counts(self):
+        """Тест количества созданных записей"""
+        counts = self.generate()
+
+        self.assertEqual(Kingdom.objects.count(), 3)
+        self.assertEqual(King.objects.count(), 2)
+        self.assertEqual(Citizen.objects.count(), 30)
+        self.assertEqual(TestAttempt.objects.count(), 40)
+        self.assertEqual(ActionLog.objects.count(), 50)
+        self.assertEqual(counts['answers'], Answer.objects.count())
+        self.assertEqual(counts['rankings'], CandidateRanking.objects.count())
+        self.assertEqual(counts['enrolled'], Citizen.objects.filter(is_enrolled=True).count())
+
+    def test_king_capacity(self):
+        """Тест соблюдения вместимости королей и счетчиков подданных"""
+        self.generate(citizens=60, attempts=60, enroll_ratio=1, in_progress_ratio=0)
+
+        for king in King.objects.all():
+            enrolled = Citizen.objects.filter(king=king, is_enrolled=True).count()
+            self.assertEqual(king.citizens_count, enrolled)
+            self.assertLessEqual(enrolled, king.max_citizens)
+        self.assertFalse(Citizen.objects.filter(is_enrolled=True, king__isnull=True).exists())
+
+    def test_attempts_consistent(self):
+        """Тест согласованности попыток и ответов"""
+        self.generate()
+
+        for attempt in TestAttempt.objects.all():
+            answers = attempt.answers.all()
+            self.assertEqual(attempt.answered_count, len(answers))
+            self.assertEqual(attempt.score, sum(answer.is_correct for answer in answers))
+            if attempt.status == 'completed':
+                self.assertEqual(attempt.answered_count, attempt.total_questions)
+
+    def test_deterministic(self):
+        """Тест повторяемости набора при одинаковом seed"""
+        self.generate(prefix='first')
+        first = list(Citizen.objects.order_by('user__username').values_list('age', flat=True))
+        self.generate(prefix='second')
+        second = list(
+            Citizen.objects.filter(user__username__startswith='second_')
+            .order_by('user__username').values_list('age', flat=True)
+        )
+        self.assertEqual(first, second)
+
+    def test_validation(self):
+        """Тест проверки параметров и префикса"""
+        with self.assertRaises(ValueError):
+            LoadDataGenerator(kingdoms=1, kings=2)
+        with self.assertRaises(ValueError):
+            LoadDataGenerator(king_capacity=11)
+
+        self.generate()
+        with self.assertRaises(ValueError):
+            self.generate()
+
+    def test_spread(self):
+        """Тест равномерного распределения"""
+        parts = [spread(10, 4, index) for index in range(4)]
+        self.assertEqual(sum(parts), 10)
+        self.assertLessEqual(max(parts) - min(parts), 1)
+
+
+class BenchmarkRunnerTest(TestCase):
+    """Тесты измерений и сценариев бенчмарков"""
+
+    def test_percentile(self):
+        """Тест процентилей с интерполяцией"""
+        values = [4, 1, 3, 2]
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 50), 2.5)
+        self.assertEqual(percentile(values, 100), 4)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize(self):
+        """Тест сводки измерений шага"""
+        summary = summarize([
+            {'wall_ms': 10, 'queries': 2, 'duplicates': 0, 'db_ms': 1},
+            {'wall_ms': 20, 'queries': 4, 'duplicates': 1, 'db_ms': 3},
+        ])
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual(summary['p50_ms'], 15)
+        self.assertEqual(summary['queries'], 3)
+        self.assertEqual(summary['max_queries'], 4)
+        self.assertEqual(summary['duplicates'], 1)
+        self.assertEqual(summary['db_ms'], 2)
+
+    def test_empty_database(self):
+        """Тест ошибки без сгенерированных данных"""
+        with self.assertRaises(BenchmarkError):
+            run_scenarios(iterations=1, warmup=0)
+
+    def test_run_scenarios(self):
+        """Тест выполнения всех сценариев на небольшом наборе"""
+        LoadDataGenerator(
+            kingdoms=2, kings=2, citizens=10, attempts=10, questions=3, logs=20, days=2,
+            enroll_ratio=0, seed=2, progress=lambda message: None
+        ).run()
+
+        report = run_scenarios(iterations=2, warmup=1)
+
+        self.assertEqual(report['dataset']['citizens'], 10)
+        self.assertEqual(set(report['scenarios']), {'enrollment', 'dashboards', 'log_export'})
+        enroll = report['scenarios']['enrollment']['enroll']
+        self.assertEqual(enroll['requests'], 2)
+        self.assertLessEqual(enroll['p50_ms'], enroll['p99_ms'])
+        # Служебные пользователи сценариев удалены
+        self.assertFalse(User.objects.filter(username__startswith='bench_run_').exists())
+        self.assertEqual(Citizen.objects.count(), 10)
+
+
+class NotificationBenchmarkTest(TestCase):
+    """Тесты микробенчмарка рендеринга уведомлений"""
+
+    def test_report(self):
+        """Тест сводки по всем режимам"""
+        report = run_notification_benchmark(cohort=5, kings=2, iterations=2, warmup=1)
+        self.assertEqual(set(report), set(MODES))
+        for summary in report.values():
+            self.assertLessEqual(summary['p50_ms'], summary['p95_ms'])
+
+    def test_same_content(self):
+        """Тест совпадения писем прежнего и нового рендеринга"""
+        from kingdom import rendering
+
+        subject, _, _ = legacy_enrollment('Test King', 'Test Kingdom')
+        rendered = rendering.render('enrollment', king_name='Test King', kingdom_name='Test Kingdom')
+        self.assertEqual(rendered.subject, subject)
+        self.assertIn('Test Kingdom', rendered.body)
+
+
+class EndpointRegressionTest(TestCase):
+    """Регрессионный бенчмарк эндпоинтов относительно базовой линии"""
+
+    def summary(self, queries, duplicates=0, p50_ms=10):
+        return {'max_queries': queries, 'duplicates': duplicates, 'db_ms': 1, 'p50_ms': p50_ms}
+
+    def report(self, **datasets):
+        return {
+            'datasets': {name: {'endpoints': endpoints} for name, endpoints in datasets.items()},
+            'skipped': {},
+        }
+
+    def test_every_url_covered(self):
+        """Тест описания каждого URL приложения и каждого метода ViewSet"""
+        self.assertEqual(missing_endpoints(), [])
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_no_regressions(self):
+        """Тест количества запросов и повторов всех эндпоинтов (без времени ответа)"""
+        from django.core.cache import cache
+        
+        cache.clear()
+        baseline = load_baseline()
+        self.assertIsNotNone(baseline, 'Нет базовой линии: manage.py benchmark_endpoints --update-baseline')
+
+        report = run_endpoints(repeat=1)
+
+        self.assertEqual(compare(report, baseline, latency=False), [])
+        self.assertEqual(report['skipped'], baseline['skipped'])
+
+    def test_compare(self):
+        """Тест обнаружения регрессий"""
+        endpoints = {'GET a': self.summary(2), 'GET b': self.summary(3, duplicates=1)}
+        baseline = {'datasets': {'small': endpoints}, 'skipped': {}}
+
+        self.assertEqual(compare(self.report(small=endpoints), baseline), [])
+        problems = compare(self.report(small={
+            'GET a': self.summary(3),
+            'GET b': self.summary(2, duplicates=2),
+            'GET c': self.summary(1, p50_ms=LATENCY_BUDGET_MS + 1),
+        }), baseline)
+        self.assertEqual(len(problems), 4)
+        self.assertIn('small GET a: запросов 3, в базовой линии 2', problems)
+        self.assertIn('small GET c: нет в базовой линии', problems)
+
+        # Без проверки времени ответа медленный эндпоинт не регрессия
+        slow = {'GET a': self.summary(2, p50_ms=LATENCY_BUDGET_MS + 1)}
+        self.assertEqual(compare(self.report(small=slow), baseline, latency=False), [])
+        self.assertEqual(len(compare(self.report(small=slow), baseline)), 1)
+
+        # Меньше запросов - не регрессия
+        self.assertEqual(compare(self.report(small={'GET a': self.summary(1)}), baseline), [])
+
+    def test_scaling(self):
+        """Тест обнаружения роста запросов с размером набора"""
+        report = self.report(
+            small={'GET a': self.summary(2), 'GET b': self.summary(3)},
+            large={'GET a': self.summary(2), 'GET b': self.summary(5)},
+        )
+        self.assertEqual(scaling(report), ['GET b: small 3, large 5'])
@@ -0,0 +1,255 @@
+"""
+Инструментирование запросов: SQL, время обработки и заголовок Server-Timing
+
+RequestInstrumentationMiddleware оборачивает выполнение SQL всех соединений
+(connection.execute_wrapper) на время запроса и собирает:
+
+    количество запросов и суммарное время SQL;
+    повторы - одинаковый SQL с одинаковыми параметрами;
+    N+1 - один и тот же SQL, выполненный REQUEST_NPLUSONE_THRESHOLD и более раз;
+    участки кода, отмеченные span() (например, запись журнала действий).
+
+Доля REQUEST_INSTRUMENTATION_SAMPLE_RATE запросов выбирается в начале запроса.
+Для остальных запросов учитываются только количество, время и текст SQL
+(текст - только при включенном поиске N+1), а ключ из параметров для
+подсчета повторов не строится: повторы считаются у выбранных запросов и при
+включенном заголовке Server-Timing.
+
+Результат добавляется в заголовок Server-Timing (REQUEST_SERVER_TIMING) и
+пишется логгером этого модуля одной JSON-записью: доля
+REQUEST_INSTRUMENTATION_SAMPLE_RATE обычных запросов на уровне INFO, медленные
+(REQUEST_SLOW_THRESHOLD_MS) и запросы с N+1 - всегда, на уровне WARNING,
+вместе с самыми долгими SQL и шаблонами N+1.
+
+Время и SQL потоковых ответов учитываются только до возврата ответа: запросы,
+выполняемые при отдаче тела (например, потоковый экспорт CSV), не учитываются.
+"""
+import heapq
+import json
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Сколько самых долгих SQL попадает в запись о медленном запросе
+SLOWEST_QUERIES = 5
+# Ограничение длины SQL в записи лога
+SQL_MAX_LENGTH = 1000
+
+_current = ContextVar('request_stats', default=None)
+
+
+def _ms(started):
+    return (time.perf_counter() - started) * 1000
+
+
+def _truncate(sql):
+    return sql if len(sql) <= SQL_MAX_LENGTH else sql[:SQL_MAX_LENGTH] + '...'
+
+
+class RequestStats:
+    """Статистика SQL и отмеченных участков кода одного запроса"""
+
+    def __init__(self, patterns=True, params=True):
+        """
+        Args:
+            patterns: Учитывать SQL по тексту (шаблоны N+1)
+            params: Учитывать SQL с параметрами (повторы)
+        """
+        self.started = time.perf_counter()
+        self.track_patterns = patterns
+        self.track_params = params
+        self.total_ms = None
+        self.queries = 0
+        self.sql_ms = 0.0
+        # SQL -> [количество, время]
+        self.patterns = defaultdict(lambda: [0, 0.0])
+        # (SQL, параметры) -> количество
+        self.executions = Counter()
+        # Куча (время, SQL) самых долгих запросов
+        self.slowest = []
+        # Имя участка -> [количество, время]
+        self.spans = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query(sql, params, _ms(started))
+
+    def add_query(self, sql, params, ms):
+        """Учет выполненного SQL"""
+        self.queries += 1
+        self.sql_ms += ms
+        if self.track_patterns:
+            pattern = self.patterns[sql]
+            pattern[0] += 1
+            pattern[1] += ms
+        if self.track_params:
+            self.executions[(sql, repr(params))] += 1
+        if len(self.slowest) < SLOWEST_QUERIES:
+            heapq.heappush(self.slowest, (ms, sql))
+        elif ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (ms, sql))
+
+    def add_span(self, name, ms):
+        """Учет выполнения участка кода"""
+        span = self.spans[name]
+        span[0] += 1
+        span[1] += ms
+
+    def finish(self):
+        self.total_ms = _ms(self.started)
+
+    @property
+    def duplicates(self):
+        """
+        Количество лишних выполнений одинакового SQL с одинаковыми параметрами
+        (None, если параметры не учитывались)
+        """
+        if not self.track_params:
+            return None
+        return sum(count - 1 for count in self.executions.values() if count > 1)
+
+    def repeated(self, threshold):
+        """
+        Шаблоны N+1
+
+        Args:
+            threshold: Минимальное количество выполнений одного SQL (0 - поиск отключен)
+
+        Returns:
+            Список {'sql', 'count', 'ms'} по убыванию количества
+        """
+        if threshold <= 0:
+            return []
+        found = [
+            {'sql': _truncate(sql), 'count': count, 'ms': round(ms, 2)}
+            for sql, (count, ms) in self.patterns.items()
+            if count >= threshold
+        ]
+        return sorted(found, key=lambda pattern: -pattern['count'])
+
+    def slowest_queries(self):
+        """Самые долгие SQL запроса по убыванию времени"""
+        return [
+            {'sql': _truncate(sql), 'ms': round(ms, 2)}
+            for ms, sql in sorted(self.slowest, reverse=True)
+        ]
+
+    def server_timing(self, nplusone):
+        """Значение заголовка Server-Timing"""
+        metrics = [
+            f'total;dur={self.total_ms:.1f}',
+            f'db;dur={self.sql_ms:.1f};desc="{self.queries} SQL"',
+        ]
+        for name, (count, ms) in self.spans.items():
+            metrics.append(f'{name};dur={ms:.1f};desc="{count}"')
+        if self.duplicates:
+            metrics.append(f'dup;desc="{self.duplicates}"')
+        if nplusone:
+            metrics.append(f'nplusone;desc="{len(nplusone)}"')
+        return ', '.join(metrics)
+
+
+def current_stats():
+    """Статистика текущего запроса или None вне инструментированного запроса"""
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """
+    Учет времени участка кода в статистике текущего запроса
+
+    Вне инструментированного запроса ничего не делает.
+
+    Args:
+        name: Имя метрики Server-Timing (латиница, без пробелов)
+    """
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_span(name, _ms(started))
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Подсчет SQL и времени обработки запроса, заголовок Server-Timing
+    и структурированный лог медленных запросов
+
+    Подключается первым в MIDDLEWARE, чтобы учитывать SQL остальных
+    middleware (сессии, аутентификация).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION_ENABLED', True):
+            return self.get_response(request)
+
+        threshold = getattr(settings, 'REQUEST_NPLUSONE_THRESHOLD', 5)
+        server_timing = getattr(settings, 'REQUEST_SERVER_TIMING', settings.DEBUG)
+        sampled = random.random() < getattr(settings, 'REQUEST_INSTRUMENTATION_SAMPLE_RATE', 0)
+        stats = RequestStats(patterns=threshold > 0, params=sampled or server_timing)
+        token = _current.set(stats)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        stats.finish()
+
+        nplusone = stats.repeated(threshold)
+        if server_timing:
+            response['Server-Timing'] = stats.server_timing(nplusone)
+        self.report(request, response, stats, nplusone, sampled)
+        return response
+
+    def report(self, request, response, stats, nplusone, sampled):
+        """Запись статистики запроса в лог"""
+        slow = stats.total_ms >= getattr(settings, 'REQUEST_SLOW_THRESHOLD_MS', 1000)
+        if not (slow or nplusone or sampled):
+            return
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(stats.total_ms, 2),
+            'db_ms': round(stats.sql_ms, 2),
+            'queries': stats.queries,
+            'spans': {name: round(ms, 2) for name, (count, ms) in stats.spans.items()},
+        }
+        if stats.track_params:
+            record['duplicates'] = stats.duplicates
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            record['user_id'] = str(user.pk)
+
+        if slow or nplusone:
+            record['slow'] = slow
+            record['nplusone'] = nplusone
+            record['slowest'] = stats.slowest_queries()
+            logger.warning(
+                '%s %s', 'Медленный запрос' if slow else 'Запрос с N+1',
+                json.dumps(record, ensure_ascii=False), extra={'request_stats': record}
+            )
+        else:
+            logger.info('Запрос %s', json.dumps(record, ensure_ascii=False), extra={'request_stats': record})
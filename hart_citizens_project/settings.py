@@ -11,9 +11,11 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,9 +56,11 @@ INSTALLED_APPS = [
     "users",
     "kingdom",
     "action_logs",
+    "benchmarks",
 ]
 
 MIDDLEWARE = [
+    "hart_citizens_project.instrumentation.RequestInstrumentationMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -64,6 +68,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "kingdom.middleware.RequestProfileMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -129,7 +134,8 @@ WSGI_APPLICATION = "hart_citizens_project.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        # PostgreSQL; django.db.backends.sqlite3 - для проверки резервных путей без PostgreSQL
+        "ENGINE": config('DB_ENGINE', default='django.db.backends.postgresql'),
         "NAME": config('DB_NAME', default='hart_citizens'),
         "USER": config('DB_USER', default='postgres'),
         "PASSWORD": config('DB_PASSWORD', default='postgres'),
@@ -139,6 +145,87 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
+
+# Тесты (manage.py test) не зависят от запущенного Redis: по умолчанию
+# у них кэш в памяти процесса, тесты общего кэша задают его сами
+TESTING = sys.argv[1:2] == ['test']
+
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache' if TESTING
+            else 'django.core.cache.backends.redis.RedisCache'
+        ),
+        "LOCATION": config('CACHE_LOCATION', default='' if TESTING else REDIS_URL),
+    }
+}
+
+# Кэш в памяти процесса не виден другим воркерам: сброс кэша по сигналам
+# (kingdom.cache, users.authentication) дошел бы только до одного процесса
+PROCESS_LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+if not DEBUG and not TESTING and CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS:
+    raise ImproperlyConfigured('CACHE_BACKEND: при DEBUG=False нужен общий для процессов кэш (Redis)')
+
+# Кэш определений тестовых испытаний (kingdom.cache)
+TEST_DEFINITION_CACHE_TIMEOUT = config('TEST_DEFINITION_CACHE_TIMEOUT', default=60 * 60, cast=int)
+TEST_DEFINITION_LOCAL_CACHE_SIZE = config('TEST_DEFINITION_LOCAL_CACHE_SIZE', default=256, cast=int)
+
+# Запись журнала действий (action_logs.writer): sync, buffered или async
+ACTION_LOG_WRITE_MODE = config('ACTION_LOG_WRITE_MODE', default='sync')
+ACTION_LOG_BATCH_SIZE = config('ACTION_LOG_BATCH_SIZE', default=100, cast=int)
+ACTION_LOG_FLUSH_INTERVAL = config('ACTION_LOG_FLUSH_INTERVAL', default=1.0, cast=float)
+ACTION_LOG_QUEUE_MAX_SIZE = config('ACTION_LOG_QUEUE_MAX_SIZE', default=10000, cast=int)
+
+# Очередь уведомлений (kingdom.notifications): размер пачки и количество пачек за запуск задачи,
+# число попыток, начальная и максимальная задержка повтора и аренда пачки отправителем (секунды),
+# срок хранения отправленных писем и писем с ошибкой (дни) и размер пачки их удаления
+NOTIFICATION_OUTBOX_BATCH_SIZE = config('NOTIFICATION_OUTBOX_BATCH_SIZE', default=100, cast=int)
+NOTIFICATION_OUTBOX_MAX_BATCHES = config('NOTIFICATION_OUTBOX_MAX_BATCHES', default=10, cast=int)
+NOTIFICATION_MAX_ATTEMPTS = config('NOTIFICATION_MAX_ATTEMPTS', default=5, cast=int)
+NOTIFICATION_RETRY_DELAY = config('NOTIFICATION_RETRY_DELAY', default=60, cast=int)
+NOTIFICATION_RETRY_MAX_DELAY = config('NOTIFICATION_RETRY_MAX_DELAY', default=60 * 60, cast=int)
+NOTIFICATION_OUTBOX_LEASE = config('NOTIFICATION_OUTBOX_LEASE', default=5 * 60, cast=int)
+NOTIFICATION_OUTBOX_RETENTION_DAYS = config('NOTIFICATION_OUTBOX_RETENTION_DAYS', default=30, cast=int)
+NOTIFICATION_OUTBOX_PURGE_BATCH_SIZE = config('NOTIFICATION_OUTBOX_PURGE_BATCH_SIZE', default=1000, cast=int)
+
+# Инструментирование запросов (hart_citizens_project.instrumentation): доля запросов,
+# записываемых в лог с подсчетом повторов, порог медленного запроса, порог N+1
+# (0 - поиск N+1 отключен) и заголовок Server-Timing
+REQUEST_INSTRUMENTATION_ENABLED = config('REQUEST_INSTRUMENTATION_ENABLED', default=True, cast=bool)
+REQUEST_INSTRUMENTATION_SAMPLE_RATE = config('REQUEST_INSTRUMENTATION_SAMPLE_RATE', default=0.0, cast=float)
+REQUEST_SLOW_THRESHOLD_MS = config('REQUEST_SLOW_THRESHOLD_MS', default=1000, cast=int)
+REQUEST_NPLUSONE_THRESHOLD = config('REQUEST_NPLUSONE_THRESHOLD', default=5, cast=int)
+REQUEST_SERVER_TIMING = config('REQUEST_SERVER_TIMING', default=DEBUG, cast=bool)
+
+# Размер порции чтения логов при экспорте (action_logs.export)
+ACTION_LOG_EXPORT_CHUNK_SIZE = config('ACTION_LOG_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+# Экспорт большего количества записей выполняется фоновой задачей (ExportJob)
+ACTION_LOG_EXPORT_BACKGROUND_THRESHOLD = config('ACTION_LOG_EXPORT_BACKGROUND_THRESHOLD', default=100000, cast=int)
+# Предельное время фонового экспорта в секундах (задачи, выполняющиеся дольше, помечаются failed)
+ACTION_LOG_EXPORT_TIMEOUT = config('ACTION_LOG_EXPORT_TIMEOUT', default=60 * 60, cast=int)
+
+# Сколько последних дней пересчитывает задача суточной сводки логов (action_logs.rollup)
+ACTION_LOG_ROLLUP_RECENT_DAYS = config('ACTION_LOG_ROLLUP_RECENT_DAYS', default=2, cast=int)
+
+# Помесячные секции журнала действий (action_logs.partitions)
+ACTION_LOG_PARTITION_MONTHS_AHEAD = config('ACTION_LOG_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+# Срок хранения логов в месяцах (0 - хранить бессрочно) и действие с устаревшими секциями: detach или drop
+ACTION_LOG_RETENTION_MONTHS = config('ACTION_LOG_RETENTION_MONTHS', default=0, cast=int)
+ACTION_LOG_RETENTION_ACTION = config('ACTION_LOG_RETENTION_ACTION', default='detach')
+
+# Холодный архив журнала действий (action_logs.archive): каталог, формат (jsonl или parquet),
+# количество записей в сегменте и размер порции чтения/удаления
+ACTION_LOG_ARCHIVE_ROOT = config('ACTION_LOG_ARCHIVE_ROOT', default=str(BASE_DIR / 'archive' / 'action_logs'))
+ACTION_LOG_ARCHIVE_FORMAT = config('ACTION_LOG_ARCHIVE_FORMAT', default='jsonl')
+ACTION_LOG_ARCHIVE_SEGMENT_ROWS = config('ACTION_LOG_ARCHIVE_SEGMENT_ROWS', default=100000, cast=int)
+ACTION_LOG_ARCHIVE_BATCH_SIZE = config('ACTION_LOG_ARCHIVE_BATCH_SIZE', default=5000, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -201,7 +288,7 @@ MEDIA_ROOT = BASE_DIR / "media"
 # Django REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
@@ -232,8 +319,13 @@ SIMPLE_JWT = {
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
     "JTI_CLAIM": "jti",
+    "TOKEN_OBTAIN_SERIALIZER": "users.authentication.ProfileTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.authentication.ProfileTokenRefreshSerializer",
 }
 
+# Время жизни кэша пользователя для JWT-аутентификации (users.authentication)
+JWT_USER_CACHE_TIMEOUT = config('JWT_USER_CACHE_TIMEOUT', default=5 * 60, cast=int)
+
 # DRF Spectacular (Swagger)
 SPECTACULAR_SETTINGS = {
     "TITLE": "Hart Citizens API",
@@ -303,17 +395,46 @@ LOGGING = {
             "level": "DEBUG",
             "propagate": False,
         },
+        "hart_citizens_project.instrumentation": {
+            "handlers": ["console", "file"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
 
 # Celery settings
-CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Периодические задачи (celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'rollup-action-logs': {
+        'task': 'action_logs.tasks.rollup_action_logs',
+        'schedule': config('ACTION_LOG_ROLLUP_INTERVAL', default=15 * 60, cast=int),
+    },
+    'fail-stale-export-jobs': {
+        'task': 'action_logs.tasks.fail_stale_export_jobs',
+        'schedule': config('ACTION_LOG_EXPORT_SWEEP_INTERVAL', default=15 * 60, cast=int),
+    },
+    'maintain-action-log-partitions': {
+        'task': 'action_logs.tasks.maintain_action_log_partitions',
+        'schedule': config('ACTION_LOG_PARTITION_INTERVAL', default=24 * 60 * 60, cast=int),
+    },
+    'drain-notification-outbox': {
+        'task': 'kingdom.tasks.drain_notification_outbox',
+        'schedule': config('NOTIFICATION_OUTBOX_INTERVAL', default=30, cast=int),
+    },
+    'purge-notification-outbox': {
+        'task': 'kingdom.tasks.purge_notification_outbox',
+        'schedule': config('NOTIFICATION_OUTBOX_PURGE_INTERVAL', default=24 * 60 * 60, cast=int),
+    },
+}
+
 # Jazzmin settings
 JAZZMIN_SETTINGS = {
     # title of the window (Will default to current_admin_site.site_title if absent or None)
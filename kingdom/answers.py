@@ -0,0 +1,262 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import get_test_definition
+from .models import TestAttempt, Answer
+from .rankings import refresh_ranking
+
+
+def record_answer(attempt, question, answer_value, definition=None):
+    """
+    Запись ответа на вопрос с инкрементальным пересчетом результата
+
+    Все изменения выполняются в одной транзакции под блокировкой строки попытки,
+    поэтому одновременные ответы в рамках одной попытки не теряют баллы.
+    Баллы и количество ответов обновляются через F() выражения, без пересчета
+    всех ответов попытки, так что стоимость ответа не зависит от длины теста.
+
+    Args:
+        attempt: Попытка прохождения теста (поля обновляются актуальными значениями)
+        question: Вопрос, принадлежащий тесту попытки (модель или CachedQuestion)
+        answer_value: Ответ (bool)
+        definition: Определение теста попытки (по умолчанию берется из кэша)
+
+    Returns:
+        Кортеж (is_correct, completed_now): правильность ответа и признак того,
+        что именно этот ответ завершил попытку
+
+    Raises:
+        ValueError: Если попытка уже завершена
+    """
+    is_correct = answer_value == question.correct_answer
+
+    with transaction.atomic():
+        locked = _lock_attempt(attempt)
+
+        previous = Answer.objects.filter(
+            attempt_id=attempt.pk,
+            question_id=question.pk
+        ).values_list('id', 'is_correct').first()
+
+        if previous is None:
+            Answer.objects.create(
+                attempt_id=attempt.pk,
+                question_id=question.pk,
+                answer=answer_value,
+                is_correct=is_correct
+            )
+            answered_delta = 1
+            score_delta = int(is_correct)
+        else:
+            answer_id, was_correct = previous
+            Answer.objects.filter(id=answer_id).update(answer=answer_value, is_correct=is_correct)
+            answered_delta = 0
+            score_delta = int(is_correct) - int(was_correct)
+
+        if definition is None:
+            definition = get_test_definition(attempt.test.kingdom_id)
+        cursor = _advance_cursor(attempt, locked, definition, {question.pk}, answered_delta)
+        completed_now = _apply_counters(attempt, locked, score_delta, answered_delta, cursor)
+
+    return is_correct, completed_now
+
+
+def record_answers(attempt, definition, answers):
+    """
+    Пакетная запись ответов на вопросы теста
+
+    Вопросы проверяются по кэшированному определению теста, ответы записываются одним
+    bulk_create с обновлением при конфликте по (attempt, question),
+    после чего результат попытки пересчитывается и попытка при необходимости
+    завершается в той же транзакции.
+
+    Args:
+        attempt: Попытка прохождения теста (поля обновляются актуальными значениями)
+        definition: Определение теста попытки (kingdom.cache.TestDefinition)
+        answers: Словарь {question_id: answer_value}
+
+    Returns:
+        Кортеж (results, completed_now): словарь {question_id: is_correct}
+        и признак того, что пакет завершил попытку
+
+    Raises:
+        ValueError: Если попытка завершена или вопросы не принадлежат тесту попытки
+    """
+    if definition is None or definition.test_id != attempt.test_id:
+        raise ValueError('Тестовое испытание попытки не найдено')
+
+    correct_answers = {}
+    for question_id in answers:
+        question = definition.question(question_id)
+        if question is not None:
+            correct_answers[question_id] = question.correct_answer
+    unknown = set(answers) - set(correct_answers)
+    if unknown:
+        raise ValueError('Вопросы не принадлежат данному тесту: ' + ', '.join(sorted(str(q) for q in unknown)))
+
+    results = {
+        question_id: answer_value == correct_answers[question_id]
+        for question_id, answer_value in answers.items()
+    }
+
+    with transaction.atomic():
+        locked = _lock_attempt(attempt)
+
+        previous = dict(
+            Answer.objects.filter(
+                attempt_id=attempt.pk,
+                question_id__in=list(answers)
+            ).values_list('question_id', 'is_correct')
+        )
+
+        Answer.objects.bulk_create(
+            [
+                Answer(
+                    attempt_id=attempt.pk,
+                    question_id=question_id,
+                    answer=answer_value,
+                    is_correct=results[question_id]
+                )
+                for question_id, answer_value in answers.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['attempt', 'question'],
+            update_fields=['answer', 'is_correct']
+        )
+
+        answered_delta = len(answers) - len(previous)
+        score_delta = sum(
+            int(is_correct) - int(previous.get(question_id, False))
+            for question_id, is_correct in results.items()
+        )
+
+        cursor = _advance_cursor(attempt, locked, definition, set(answers), answered_delta)
+        completed_now = _apply_counters(attempt, locked, score_delta, answered_delta, cursor)
+
+    return results, completed_now
+
+
+def _lock_attempt(attempt):
+    """Блокировка строки попытки до конца транзакции"""
+    locked = TestAttempt.objects.select_for_update().only(
+        'status', 'score', 'answered_count', 'total_questions', 'question_cursor'
+    ).get(pk=attempt.pk)
+
+    if locked.status != 'in_progress':
+        raise ValueError('Попытка тестирования уже завершена')
+    return locked
+
+
+def _advance_cursor(attempt, locked, definition, answered_ids, answered_delta):
+    """
+    Новая позиция следующего вопроса после записи ответов
+
+    Вопросы до курсора отвечены все, поэтому при ответах по порядку курсор
+    сдвигается без запросов. Ответы базы читаются, только если курсор
+    сдвинулся, а за ним остались отвеченные ранее вопросы (ответы не по порядку).
+    Без определения теста попытки курсор не меняется.
+    """
+    if definition is None or definition.test_id != attempt.test_id:
+        return locked.question_cursor
+    questions = definition.questions
+    cursor = min(locked.question_cursor, len(questions))
+    start = cursor
+    while cursor < len(questions) and questions[cursor].id in answered_ids:
+        cursor += 1
+
+    answered_count = locked.answered_count + answered_delta
+    if cursor > start and answered_count > cursor:
+        answered = set(Answer.objects.filter(attempt_id=attempt.pk).values_list('question_id', flat=True))
+        while cursor < len(questions) and questions[cursor].id in answered:
+            cursor += 1
+    return cursor
+
+
+def _apply_counters(attempt, locked, score_delta, answered_delta, cursor):
+    """
+    Применение приращений баллов, количества ответов и курсора к заблокированной попытке
+
+    Завершает попытку условным UPDATE, если ответы даны на все вопросы,
+    и пересчитывает рейтинг подданного. Возвращает True, если попытка
+    завершена именно этим вызовом.
+    """
+    changes = {}
+    if answered_delta or score_delta:
+        changes.update(
+            score=F('score') + score_delta,
+            answered_count=F('answered_count') + answered_delta
+        )
+    if cursor != locked.question_cursor:
+        changes['question_cursor'] = cursor
+    if changes:
+        TestAttempt.objects.filter(pk=attempt.pk).update(**changes)
+
+    attempt.score = locked.score + score_delta
+    attempt.answered_count = locked.answered_count + answered_delta
+    attempt.total_questions = locked.total_questions
+    attempt.question_cursor = cursor
+    attempt.status = locked.status
+
+    if attempt.answered_count < attempt.total_questions:
+        return False
+
+    completed_at = timezone.now()
+    completed_now = TestAttempt.objects.filter(
+        pk=attempt.pk,
+        status='in_progress',
+        answered_count__gte=F('total_questions')
+    ).update(status='completed', completed_at=completed_at) == 1
+    if completed_now:
+        attempt.status = 'completed'
+        attempt.completed_at = completed_at
+        refresh_ranking(attempt.citizen_id)
+    return completed_now
+
+
+def _first_unanswered(attempt, questions):
+    """Позиция первого неотвеченного вопроса по ответам попытки в базе"""
+    answered = set(Answer.objects.filter(attempt_id=attempt.pk).values_list('question_id', flat=True))
+    return next(
+        (index for index, question in enumerate(questions) if question.id not in answered),
+        len(questions)
+    )
+
+
+def next_question(attempt, definition):
+    """
+    Следующий вопрос попытки и прогресс по сохраненному курсору
+
+    Вопрос под курсором проверяется одним запросом. Если он уже отвечен или
+    вопросы кончились раньше ответов (вопросы теста изменились после расчета
+    курсора), следующий вопрос ищется по всем ответам попытки.
+
+    Args:
+        attempt: Попытка прохождения теста
+        definition: Определение теста попытки (kingdom.cache.TestDefinition)
+
+    Returns:
+        Словарь question (CachedQuestion или None), position, answered, total,
+        remaining и progress (процент отвеченных вопросов)
+    """
+    question = None
+    position = attempt.question_cursor
+    if attempt.status == 'in_progress' and definition is not None and definition.test_id == attempt.test_id:
+        questions = definition.questions
+        if position < len(questions):
+            stale = Answer.objects.filter(attempt_id=attempt.pk, question_id=questions[position].id).exists()
+        else:
+            stale = attempt.answered_count < attempt.total_questions
+        if stale:
+            position = _first_unanswered(attempt, questions)
+        if position < len(questions):
+            question = questions[position]
+    total = attempt.total_questions
+    return {
+        'question': question,
+        'position': position,
+        'answered': attempt.answered_count,
+        'total': total,
+        'remaining': max(total - attempt.answered_count, 0),
+        'progress': round(attempt.answered_count / total * 100, 2) if total else 0,
+    }
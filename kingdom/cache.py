@@ -0,0 +1,229 @@
+"""
+Кэш определений тестовых испытаний королевств
+
+Определение теста (сам тест, его вопросы по порядку и правильные ответы)
+меняется редко, а читается на каждом шаге тестирования. Определение хранится
+в двух уровнях: LRU-кэш в памяти процесса перед кэшем Django (CACHES).
+Каждое королевство имеет номер версии в кэше Django; сигналы post_save/post_delete
+моделей Test и Question увеличивают версию, после чего устаревшие записи
+обоих уровней перестают использоваться. Поэтому кэш Django должен быть общим
+для всех процессов (Redis, см. CACHES): версия в LocMemCache видна только
+одному воркеру.
+
+При ошибке кэша Django (Redis недоступен) определение читается из базы
+данных без кэширования в обоих уровнях.
+"""
+import logging
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Test, Question
+
+logger = logging.getLogger('kingdom')
+
+# Псевдоним кэша Django, максимальный размер LRU и TTL записей в кэше Django
+CACHE_ALIAS = getattr(settings, 'TEST_DEFINITION_CACHE_ALIAS', 'default')
+LOCAL_CACHE_SIZE = getattr(settings, 'TEST_DEFINITION_LOCAL_CACHE_SIZE', 256)
+CACHE_TIMEOUT = getattr(settings, 'TEST_DEFINITION_CACHE_TIMEOUT', 60 * 60)
+
+VERSION_KEY = 'kingdom:test_definition:version:{kingdom_id}'
+DEFINITION_KEY = 'kingdom:test_definition:{kingdom_id}:v{version}'
+
+
+class CachedQuestion(namedtuple('CachedQuestion', 'id text order correct_answer created_at')):
+    """Вопрос теста из кэша"""
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class TestDefinition:
+    """Неизменяемое определение тестового испытания королевства"""
+
+    def __init__(self, test_id, kingdom_id, title, description, is_active, questions):
+        self.test_id = test_id
+        self.kingdom_id = kingdom_id
+        self.title = title
+        self.description = description
+        self.is_active = is_active
+        self.questions = tuple(questions)
+        self._by_id = {question.id: question for question in self.questions}
+
+    def __str__(self):
+        return self.title
+
+    @property
+    def questions_count(self):
+        """Количество вопросов"""
+        return len(self.questions)
+
+    def question(self, question_id):
+        """Вопрос по идентификатору или None, если он не принадлежит тесту"""
+        if not isinstance(question_id, uuid.UUID):
+            try:
+                question_id = uuid.UUID(str(question_id))
+            except ValueError:
+                return None
+        return self._by_id.get(question_id)
+
+    def to_dict(self):
+        """Представление для хранения в кэше Django"""
+        return {
+            'test_id': self.test_id,
+            'kingdom_id': self.kingdom_id,
+            'title': self.title,
+            'description': self.description,
+            'is_active': self.is_active,
+            'questions': [tuple(question) for question in self.questions],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Восстановление из кэша Django"""
+        return cls(
+            test_id=data['test_id'],
+            kingdom_id=data['kingdom_id'],
+            title=data['title'],
+            description=data['description'],
+            is_active=data['is_active'],
+            questions=[CachedQuestion(*question) for question in data['questions']],
+        )
+
+
+# Отсутствие теста у королевства тоже кэшируется
+MISSING = {'missing': True}
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _current_version(kingdom_id):
+    """Текущая версия определения теста королевства или None, если кэш недоступен"""
+    cache = _cache()
+    key = VERSION_KEY.format(kingdom_id=kingdom_id)
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, 1, timeout=None)
+            version = cache.get(key, 1)
+    except Exception as e:
+        logger.warning(f'Кэш определений тестов недоступен: {e}')
+        return None
+    return version
+
+
+def _load(kingdom_id):
+    """Загрузка определения теста из базы данных (два запроса)"""
+    test = Test.objects.filter(kingdom_id=kingdom_id).first()
+    if test is None:
+        return None
+    questions = Question.objects.filter(test=test).order_by('order', 'created_at').values_list(
+        'id', 'text', 'order', 'correct_answer', 'created_at'
+    )
+    return TestDefinition(
+        test_id=test.id,
+        kingdom_id=test.kingdom_id,
+        title=test.title,
+        description=test.description,
+        is_active=test.is_active,
+        questions=[CachedQuestion(*row) for row in questions],
+    )
+
+
+def _remember_locally(kingdom_id, version, definition):
+    with _local_lock:
+        _local[kingdom_id] = (version, definition)
+        _local.move_to_end(kingdom_id)
+        while len(_local) > LOCAL_CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def get_test_definition(kingdom_id):
+    """
+    Определение тестового испытания королевства
+
+    Args:
+        kingdom_id: Идентификатор королевства
+
+    Returns:
+        TestDefinition или None, если у королевства нет теста
+    """
+    version = _current_version(kingdom_id)
+    if version is None:
+        # Без версии нельзя проверить ни один уровень кэша
+        return _load(kingdom_id)
+
+    with _local_lock:
+        entry = _local.get(kingdom_id)
+        if entry is not None and entry[0] == version:
+            _local.move_to_end(kingdom_id)
+            return entry[1]
+
+    key = DEFINITION_KEY.format(kingdom_id=kingdom_id, version=version)
+    try:
+        data = _cache().get(key)
+    except Exception as e:
+        logger.warning(f'Кэш определений тестов недоступен: {e}')
+        return _load(kingdom_id)
+    if data is None:
+        definition = _load(kingdom_id)
+        try:
+            _cache().set(key, definition.to_dict() if definition else MISSING, timeout=CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f'Кэш определений тестов недоступен: {e}')
+    elif data == MISSING:
+        definition = None
+    else:
+        definition = TestDefinition.from_dict(data)
+
+    _remember_locally(kingdom_id, version, definition)
+    return definition
+
+
+def require_test_definition(kingdom_id):
+    """
+    Определение тестового испытания королевства
+
+    Raises:
+        Test.DoesNotExist: Если у королевства нет теста
+    """
+    definition = get_test_definition(kingdom_id)
+    if definition is None:
+        raise Test.DoesNotExist('Тестовое испытание королевства не найдено')
+    return definition
+
+
+def invalidate_test_definition(kingdom_id):
+    """
+    Сброс определения теста королевства во всех процессах
+
+    Если кэш Django недоступен, сбрасывается только LRU текущего процесса;
+    ошибка пишется в лог.
+    """
+    cache = _cache()
+    key = VERSION_KEY.format(kingdom_id=kingdom_id)
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, timeout=None)
+    except Exception as e:
+        logger.error(f'Не удалось сбросить кэш определения теста королевства {kingdom_id}: {e}')
+    with _local_lock:
+        _local.pop(kingdom_id, None)
+
+
+def clear_local_cache():
+    """Очистка LRU-кэша текущего процесса"""
+    with _local_lock:
+        _local.clear()
@@ -0,0 +1,56 @@
+from django.core.paginator import Paginator
+from django.db.models import Exists, OuterRef, Subquery
+
+from .models import Citizen, TestAttempt
+
+# Количество кандидатов на одной странице панели короля
+CANDIDATES_PER_PAGE = 50
+
+
+def get_candidates(kingdom):
+    """
+    Кандидаты на зачисление: подданные королевства, прошедшие тест, но еще не зачисленные
+
+    Проверка прохождения теста и результат последней завершенной попытки
+    вычисляются подзапросами, поэтому весь список загружается одним запросом
+    независимо от количества кандидатов.
+
+    Args:
+        kingdom: Королевство
+
+    Returns:
+        QuerySet подданных с аннотациями last_score и last_total_questions
+    """
+    completed_attempts = TestAttempt.objects.filter(
+        citizen=OuterRef('pk'),
+        status='completed'
+    )
+    last_completed = completed_attempts.order_by('-completed_at')
+
+    return Citizen.objects.filter(
+        kingdom=kingdom,
+        is_enrolled=False
+    ).filter(
+        Exists(completed_attempts)
+    ).annotate(
+        last_score=Subquery(last_completed.values('score')[:1]),
+        last_total_questions=Subquery(last_completed.values('total_questions')[:1]),
+    ).select_related('user', 'kingdom').order_by('-created_at', 'id')
+
+
+def paginate_candidates(kingdom, page_number=None, per_page=CANDIDATES_PER_PAGE):
+    """
+    Страница кандидатов на зачисление
+
+    Стоимость постоянна: один COUNT и один запрос выборки страницы.
+
+    Args:
+        kingdom: Королевство
+        page_number: Номер страницы (некорректные значения приводятся к допустимым)
+        per_page: Количество кандидатов на странице
+
+    Returns:
+        Page с кандидатами
+    """
+    paginator = Paginator(get_candidates(kingdom), per_page)
+    return paginator.get_page(page_number)
@@ -0,0 +1,152 @@
+"""
+Пакетное зачисление подданных королем
+
+Подданные пакета проверяются одним запросом (королевство, статус зачисления,
+наличие завершенной попытки, как и при одиночном зачислении) под блокировкой
+строк. Под блокировкой строки короля зачисляется столько подходящих
+подданных, сколько осталось мест, в порядке рейтинга (см. kingdom.rankings;
+подданные без строки рейтинга - с завершенной попыткой теста без вопросов -
+идут последними), остальные возвращаются с причиной отказа. Зачисление, счетчик короля,
+рейтинг, логи и уведомления в очереди outbox (по одному bulk_create)
+фиксируются одной транзакцией.
+"""
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from action_logs.writer import make_event, write_events
+from .models import CandidateRanking, Citizen, King, TestAttempt
+from .notifications import enqueue, enrollment_key, enrollment_messages
+
+# Максимальное количество подданных в одном пакете
+MAX_BATCH_SIZE = 100
+
+# Причины отказа в зачислении
+NOT_FOUND = 'not_found'
+WRONG_KINGDOM = 'wrong_kingdom'
+ALREADY_ENROLLED = 'already_enrolled'
+NO_COMPLETED_TEST = 'no_completed_test'
+NO_CAPACITY = 'no_capacity'
+
+REASONS = {
+    NOT_FOUND: 'Подданный не найден',
+    WRONG_KINGDOM: 'Подданный не принадлежит вашему королевству',
+    ALREADY_ENROLLED: 'Подданный уже зачислен',
+    NO_COMPLETED_TEST: 'Подданный не прошел тестовое испытание',
+    NO_CAPACITY: 'Нет свободных мест',
+}
+
+
+def _rank_key(citizen):
+    """Порядок рейтинга кандидатов: процент, баллы, более раннее завершение"""
+    try:
+        ranking = citizen.ranking
+    except CandidateRanking.DoesNotExist:
+        # Попытка теста без вопросов в рейтинг не попадает
+        return (1, 0, 0, None, str(citizen.pk))
+    return (0, -ranking.percentage, -ranking.best_score, ranking.completed_at, str(ranking.pk))
+
+
+def _rejection(citizen, king):
+    if citizen.kingdom_id != king.kingdom_id:
+        return WRONG_KINGDOM
+    if citizen.is_enrolled:
+        return ALREADY_ENROLLED
+    if not citizen.has_completed_test:
+        return NO_COMPLETED_TEST
+    return None
+
+
+def enroll_citizens(king, citizen_ids, ip_address=None, user_agent=None):
+    """
+    Пакетное зачисление подданных к королю
+
+    Args:
+        king: Король (счетчик подданных обновляется актуальным значением)
+        citizen_ids: Идентификаторы подданных (не больше MAX_BATCH_SIZE)
+        ip_address: IP адрес для журнала действий
+        user_agent: User Agent для журнала действий
+
+    Returns:
+        Кортеж (enrolled, rejected): список зачисленных подданных в порядке
+        рейтинга и словарь {id подданного: причина из REASONS}
+
+    Raises:
+        ValueError: Если пакет больше MAX_BATCH_SIZE
+    """
+    citizen_ids = list(dict.fromkeys(citizen_ids))
+    if len(citizen_ids) > MAX_BATCH_SIZE:
+        raise ValueError(f'За один раз можно зачислить не больше {MAX_BATCH_SIZE} подданных')
+
+    rejected = {}
+    with transaction.atomic():
+        # Одновременные зачисления к этому королю ждут фиксации пакета
+        locked = King.objects.select_for_update().get(pk=king.pk)
+        citizens = {
+            citizen.pk: citizen
+            for citizen in Citizen.objects.filter(pk__in=citizen_ids)
+            .annotate(has_completed_test=Exists(
+                TestAttempt.objects.filter(citizen_id=OuterRef('pk'), status='completed')
+            ))
+            .select_related('user', 'kingdom', 'ranking')
+            .select_for_update(of=('self',))
+        }
+
+        eligible = []
+        for citizen_id in citizen_ids:
+            citizen = citizens.get(citizen_id)
+            reason = NOT_FOUND if citizen is None else _rejection(citizen, king)
+            if reason is None:
+                eligible.append(citizen)
+            else:
+                rejected[citizen_id] = reason
+
+        eligible.sort(key=_rank_key)
+        free = max(locked.max_citizens - locked.citizens_count, 0)
+        enrolled = eligible[:free]
+        for citizen in eligible[free:]:
+            rejected[citizen.pk] = NO_CAPACITY
+
+        if enrolled:
+            enrolled_ids = [citizen.pk for citizen in enrolled]
+            enrolled_at = timezone.now()
+            Citizen.objects.filter(pk__in=enrolled_ids).update(
+                is_enrolled=True, king=king, enrolled_at=enrolled_at, updated_at=enrolled_at
+            )
+            King.objects.filter(pk=king.pk).update(citizens_count=F('citizens_count') + len(enrolled))
+            CandidateRanking.objects.filter(citizen_id__in=enrolled_ids).update(is_enrolled=True)
+
+            king_name = king.user.get_full_name()
+            write_events([
+                make_event(
+                    user_id=king.user_id,
+                    kingdom_id=king.kingdom_id,
+                    action='enrollment',
+                    description=f'API пакетное зачисление подданного {citizen.user.get_full_name()} королем {king_name}',
+                    metadata={'citizen_id': str(citizen.pk), 'batch_size': len(enrolled)},
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                    created_at=enrolled_at,
+                )
+                for citizen in enrolled
+            ])
+
+            for citizen in enrolled:
+                citizen.is_enrolled = True
+                citizen.king = king
+                citizen.enrolled_at = enrolled_at
+                citizen.updated_at = enrolled_at
+                if hasattr(citizen, 'ranking'):
+                    citizen.ranking.is_enrolled = True
+
+            enqueue(enrollment_messages(
+                (
+                    (citizen.pigeon_email, enrollment_key(citizen.pk, enrolled_at))
+                    for citizen in enrolled
+                ),
+                king_name, king.kingdom.name
+            ))
+
+        king.citizens_count = locked.citizens_count + len(enrolled)
+
+    return enrolled, rejected
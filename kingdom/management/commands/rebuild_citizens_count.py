@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from kingdom.models import King
+
+
+class Command(BaseCommand):
+    help = 'Пересчет хранимого счетчика подданных у королей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        mismatched = King.objects.annotate(
+            actual_count=Count('citizens')
+        ).exclude(
+            citizens_count=F('actual_count')
+        ).select_related('user', 'kingdom')
+
+        fixed = 0
+        for king in mismatched:
+            self.stdout.write(
+                f'{king.kingdom.name}: счетчик {king.citizens_count}, фактически {king.actual_count}'
+            )
+            if not options['dry_run']:
+                King.objects.filter(pk=king.pk).update(citizens_count=king.actual_count)
+            fixed += 1
+
+        if options['dry_run']:
+            self.stdout.write(f'Найдено расхождений: {fixed}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено счетчиков: {fixed}'))
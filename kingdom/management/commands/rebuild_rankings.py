@@ -0,0 +1,26 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from kingdom.models import Kingdom
+from kingdom.rankings import rebuild_rankings
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет рейтинга кандидатов по завершенным попыткам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kingdom',
+            help='Идентификатор королевства (по умолчанию - все королевства)'
+        )
+
+    def handle(self, *args, **options):
+        kingdom = None
+        if options['kingdom']:
+            try:
+                kingdom = Kingdom.objects.get(pk=options['kingdom'])
+            except (Kingdom.DoesNotExist, ValidationError):
+                raise CommandError(f'Королевство {options["kingdom"]} не найдено')
+
+        rows = rebuild_rankings(kingdom)
+        self.stdout.write(self.style.SUCCESS(f'Строк рейтинга: {rows}'))
@@ -0,0 +1,15 @@
+from .profiles import LazyRequestProfile
+
+
+class RequestProfileMiddleware:
+    """
+    Добавляет в запрос request.profile - профиль роли пользователя
+    с королевством и тестом, загружаемый одним запросом (см. kingdom.profiles)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = LazyRequestProfile(request)
+        return self.get_response(request)
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-16 22:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_answer_counters(apps, schema_editor):
+    """Заполняем счетчики ответов и баллы для существующих попыток"""
+    TestAttempt = apps.get_model('kingdom', 'TestAttempt')
+    Answer = apps.get_model('kingdom', 'Answer')
+
+    answers = Answer.objects.filter(attempt=OuterRef('pk')).order_by().values('attempt')
+    TestAttempt.objects.update(
+        answered_count=Coalesce(Subquery(answers.annotate(c=Count('id')).values('c')), 0),
+        score=Coalesce(Subquery(answers.annotate(c=Count('id', filter=Q(is_correct=True))).values('c')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kingdom', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testattempt',
+            name='answered_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отвечено вопросов'),
+        ),
+        migrations.RunPython(fill_answer_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-16 22:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_citizens_count(apps, schema_editor):
+    """Заполняем счетчик подданных для существующих королей"""
+    King = apps.get_model('kingdom', 'King')
+    Citizen = apps.get_model('kingdom', 'Citizen')
+
+    citizens = Citizen.objects.filter(king=OuterRef('pk')).order_by().values('king')
+    King.objects.update(
+        citizens_count=Coalesce(Subquery(citizens.annotate(c=Count('id')).values('c')), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kingdom', '0003_testattempt_answered_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='king',
+            name='citizens_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подданных'),
+        ),
+        migrations.RunPython(fill_citizens_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:39
+
+from django.db import migrations, models
+
+
+def fill_question_cursor(apps, schema_editor):
+    """Заполняем позицию следующего вопроса для незавершенных попыток"""
+    TestAttempt = apps.get_model('kingdom', 'TestAttempt')
+    Question = apps.get_model('kingdom', 'Question')
+    Answer = apps.get_model('kingdom', 'Answer')
+
+    questions = {}
+    for attempt in TestAttempt.objects.filter(status='in_progress', answered_count__gt=0).only('id', 'test_id'):
+        if attempt.test_id not in questions:
+            questions[attempt.test_id] = list(
+                Question.objects.filter(test_id=attempt.test_id).order_by('order', 'created_at').values_list('id', flat=True)
+            )
+        answered = set(Answer.objects.filter(attempt_id=attempt.id).values_list('question_id', flat=True))
+        cursor = 0
+        for question_id in questions[attempt.test_id]:
+            if question_id not in answered:
+                break
+            cursor += 1
+        TestAttempt.objects.filter(id=attempt.id).update(question_cursor=cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kingdom', '0004_king_citizens_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testattempt',
+            name='question_cursor',
+            field=models.PositiveIntegerField(default=0, verbose_name='Позиция следующего вопроса'),
+        ),
+        migrations.RunPython(fill_question_cursor, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:44
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, FloatField
+
+
+def fill_rankings(apps, schema_editor):
+    """Заполняем рейтинг по лучшим завершенным попыткам подданных"""
+    TestAttempt = apps.get_model('kingdom', 'TestAttempt')
+    CandidateRanking = apps.get_model('kingdom', 'CandidateRanking')
+
+    ratio = ExpressionWrapper(F('score') * 1.0 / F('total_questions'), output_field=FloatField())
+    attempts = TestAttempt.objects.filter(status='completed', total_questions__gt=0, completed_at__isnull=False).alias(ratio=ratio).order_by(
+        'citizen_id', '-ratio', '-score', 'completed_at', 'id'
+    ).select_related('citizen')
+    if schema_editor.connection.features.can_distinct_on_fields:
+        attempts = attempts.distinct('citizen_id')
+
+    # Без DISTINCT ON (SQLite) берется первая попытка подданного в этом порядке
+    best, seen = [], set()
+    for attempt in attempts:
+        if attempt.citizen_id not in seen:
+            seen.add(attempt.citizen_id)
+            best.append(attempt)
+
+    CandidateRanking.objects.bulk_create([
+        CandidateRanking(
+            citizen_id=attempt.citizen_id,
+            kingdom_id=attempt.citizen.kingdom_id,
+            attempt_id=attempt.id,
+            best_score=attempt.score,
+            total_questions=attempt.total_questions,
+            percentage=round(attempt.score / attempt.total_questions * 100, 2),
+            completed_at=attempt.completed_at,
+            is_enrolled=attempt.citizen.is_enrolled,
+        )
+        for attempt in best
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kingdom', '0005_testattempt_question_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidateRanking',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('best_score', models.PositiveIntegerField(default=0, verbose_name='Лучший результат')),
+                ('total_questions', models.PositiveIntegerField(default=0, verbose_name='Всего вопросов')),
+                ('percentage', models.FloatField(default=0, verbose_name='Процент правильных ответов')),
+                ('completed_at', models.DateTimeField(verbose_name='Завершено')),
+                ('is_enrolled', models.BooleanField(default=False, verbose_name='Зачислен')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('attempt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='kingdom.testattempt', verbose_name='Лучшая попытка')),
+                ('citizen', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ranking', to='kingdom.citizen', verbose_name='Подданный')),
+                ('kingdom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='kingdom.kingdom', verbose_name='Королевство')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг кандидата',
+                'verbose_name_plural': 'Рейтинг кандидатов',
+                'db_table': 'candidate_rankings',
+                'ordering': ['-percentage', '-best_score', 'completed_at', 'id'],
+                'indexes': [models.Index(fields=['kingdom', '-percentage', '-best_score', 'completed_at', 'id'], name='rankings_kingdom_top_idx'), models.Index(condition=models.Q(('is_enrolled', False)), fields=['kingdom', '-percentage', '-best_score', 'completed_at', 'id'], name='rankings_candidates_top_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rankings, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
@@ -45,6 +47,11 @@ class King(models.Model):
         validators=[MinValueValidator(1), MaxValueValidator(10)],
         verbose_name='Максимальное количество подданных'
     )
+    citizens_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подданных'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     
@@ -58,8 +65,14 @@ class King(models.Model):
     
     @property
     def current_citizens_count(self):
-        """Возвращает текущее количество подданных"""
-        return self.citizens.count()
+        """Возвращает текущее количество подданных (хранимый счетчик)"""
+        return self.citizens_count
+    
+    def rebuild_citizens_count(self):
+        """Пересчитывает хранимый счетчик подданных по фактическим данным"""
+        self.citizens_count = self.citizens.count()
+        King.objects.filter(pk=self.pk).update(citizens_count=self.citizens_count)
+        return self.citizens_count
     
     @property
     def can_accept_more_citizens(self):
@@ -107,15 +120,82 @@ class Citizen(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.kingdom.name})"
     
+    def clean(self):
+        """
+        Проверка короля при зачислении через админку
+
+        Король задается только зачисленному подданному. Новый король должен
+        быть из королевства подданного и иметь свободное место.
+        """
+        if self.king_id and not self.is_enrolled:
+            raise ValidationError({'king': 'Король задается только зачисленному подданному'})
+        if not (self.is_enrolled and self.king_id):
+            return
+        previous = None
+        if not self._state.adding:
+            previous = Citizen.objects.filter(pk=self.pk).values_list('king_id', flat=True).first()
+        if previous == self.king_id:
+            return
+        if self.king.kingdom_id != self.kingdom_id:
+            raise ValidationError({'king': 'Король должен быть из королевства подданного'})
+        if not self.king.can_accept_more_citizens:
+            raise ValidationError({'king': f'Король {self.king.user.get_full_name()} не может принять больше подданных'})
+    
+    def save(self, *args, **kwargs):
+        """
+        Сохранение подданного (админка, импорт)
+
+        Дата зачисления проставляется при зачислении и сбрасывается при
+        отчислении. Место у нового короля занимает сигнал post_save
+        (move_king_place) условным UPDATE счетчика; такое сохранение
+        выполняется в транзакции, поэтому при отказе изменения подданного
+        откатываются.
+
+        Raises:
+            ValueError: Если король задан незачисленному подданному
+                или у нового короля нет свободного места
+        """
+        if self.king_id and not self.is_enrolled:
+            raise ValueError('Король задается только зачисленному подданному')
+        if not self.is_enrolled:
+            self.enrolled_at = None
+        elif self.king_id and self.enrolled_at is None:
+            self.enrolled_at = timezone.now()
+        if self.king_id and (self._state.adding or self.king_id != self._loaded_king_id):
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+    
     def enroll(self, king):
-        """Зачисляет подданного к королю"""
-        if not king.can_accept_more_citizens:
-            raise ValueError(f"Король {king.user.get_full_name()} не может принять больше подданных")
+        """
+        Зачисляет подданного к королю
+        
+        Место занимается условным UPDATE счетчика короля (citizens_count < max_citizens),
+        поэтому одновременные зачисления не могут превысить лимит.
+        """
+        with transaction.atomic():
+            reserved = King.objects.filter(
+                pk=king.pk,
+                citizens_count__lt=F('max_citizens')
+            ).update(citizens_count=F('citizens_count') + 1)
+            if not reserved:
+                raise ValueError(f"Король {king.user.get_full_name()} не может принять больше подданных")
+            
+            enrolled_at = timezone.now()
+            enrolled = Citizen.objects.filter(
+                pk=self.pk,
+                is_enrolled=False
+            ).update(is_enrolled=True, king=king, enrolled_at=enrolled_at, updated_at=enrolled_at)
+            if not enrolled:
+                raise ValueError(f"Подданный {self.user.get_full_name()} уже зачислен")
+            CandidateRanking.objects.filter(citizen_id=self.pk).update(is_enrolled=True)
         
+        king.citizens_count = King.objects.values_list('citizens_count', flat=True).get(pk=king.pk)
         self.is_enrolled = True
         self.king = king
-        self.enrolled_at = timezone.now()
-        self.save()
+        self.enrolled_at = enrolled_at
+        self.updated_at = enrolled_at
 
 
 class Test(models.Model):
@@ -199,6 +279,8 @@ class TestAttempt(models.Model):
     )
     score = models.PositiveIntegerField(default=0, verbose_name='Баллы')
     total_questions = models.PositiveIntegerField(default=0, verbose_name='Всего вопросов')
+    answered_count = models.PositiveIntegerField(default=0, verbose_name='Отвечено вопросов')
+    question_cursor = models.PositiveIntegerField(default=0, verbose_name='Позиция следующего вопроса')
     started_at = models.DateTimeField(auto_now_add=True, verbose_name='Начато')
     completed_at = models.DateTimeField(blank=True, null=True, verbose_name='Завершено')
     
@@ -257,4 +339,113 @@ class Answer(models.Model):
         """Автоматически заполняем is_correct на основе ответа и правильного ответа вопроса"""
         if self.is_correct is None:
             self.is_correct = self.answer == self.question.correct_answer
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class CandidateRanking(models.Model):
+    """
+    Рейтинг подданного в королевстве по лучшей завершенной попытке
+
+    Таблица обновляется при завершении попытки и при зачислении
+    (см. kingdom.rankings), а топ королевства читается по индексу.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    citizen = models.OneToOneField(
+        Citizen,
+        on_delete=models.CASCADE,
+        verbose_name='Подданный',
+        related_name='ranking'
+    )
+    kingdom = models.ForeignKey(
+        Kingdom,
+        on_delete=models.CASCADE,
+        verbose_name='Королевство',
+        related_name='rankings'
+    )
+    attempt = models.ForeignKey(
+        TestAttempt,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        verbose_name='Лучшая попытка',
+        related_name='+'
+    )
+    best_score = models.PositiveIntegerField(default=0, verbose_name='Лучший результат')
+    total_questions = models.PositiveIntegerField(default=0, verbose_name='Всего вопросов')
+    percentage = models.FloatField(default=0, verbose_name='Процент правильных ответов')
+    completed_at = models.DateTimeField(verbose_name='Завершено')
+    is_enrolled = models.BooleanField(default=False, verbose_name='Зачислен')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    
+    class Meta:
+        verbose_name = 'Рейтинг кандидата'
+        verbose_name_plural = 'Рейтинг кандидатов'
+        db_table = 'candidate_rankings'
+        ordering = ['-percentage', '-best_score', 'completed_at', 'id']
+        indexes = [
+            models.Index(
+                fields=['kingdom', '-percentage', '-best_score', 'completed_at', 'id'],
+                name='rankings_kingdom_top_idx'
+            ),
+            models.Index(
+                fields=['kingdom', '-percentage', '-best_score', 'completed_at', 'id'],
+                name='rankings_candidates_top_idx',
+                condition=Q(is_enrolled=False)
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.citizen} - {self.percentage}%"
+
+
+class OutboxMessage(models.Model):
+    """
+    Уведомление в очереди отправки
+
+    Письма записываются в таблицу вместе с изменением, которое их вызвало,
+    и отправляются пачками периодической задачей (см. kingdom.notifications).
+    """
+    
+    KIND_CHOICES = [
+        ('enrollment', 'Зачисление'),
+        ('test_completion', 'Завершение тестирования'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Тип')
+    # Повторная постановка того же уведомления в очередь игнорируется
+    dedup_key = models.CharField(max_length=255, unique=True, verbose_name='Ключ дедупликации')
+    recipient = models.EmailField(verbose_name='Получатель')
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    html_body = models.TextField(blank=True, verbose_name='HTML')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток отправки')
+    # Время следующей попытки: отсрочка после ошибки или аренда пачки отправителем
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')
+    
+    class Meta:
+        verbose_name = 'Уведомление в очереди'
+        verbose_name_plural = 'Очередь уведомлений'
+        db_table = 'notification_outbox'
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                name='outbox_pending_idx',
+                condition=Q(status='pending')
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.recipient} ({self.get_status_display()})"
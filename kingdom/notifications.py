@@ -0,0 +1,290 @@
+"""
+Очередь уведомлений (outbox)
+
+Уведомления не отправляются в момент события: они записываются в таблицу
+OutboxMessage (обычно в той же транзакции, что и событие), а периодическая
+задача drain_notification_outbox отправляет их пачками по одному
+SMTP-соединению (get_connection + send_messages).
+
+    Дедупликация - уникальный dedup_key события (enrollment_key,
+    test_completion_key): повторная постановка уведомления о том же событии
+    (например, при повторе задачи) игнорируется, а о новом событии с тем же
+    текстом (повторное прохождение теста) - нет.
+    Аренда - выбранная пачка сдвигает next_attempt_at на LEASE_SECONDS,
+    поэтому параллельные отправители не берут одни и те же письма, а письма
+    упавшего отправителя вернутся в очередь.
+    Повторы - после ошибки письмо откладывается с экспоненциальной задержкой
+    (RETRY_DELAY * 2^(попытка-1), не больше RETRY_MAX_DELAY), после
+    MAX_ATTEMPTS попыток получает статус failed.
+    Хранение - отправленные письма и письма с ошибкой старше
+    RETENTION_DAYS удаляет периодическая задача purge_notification_outbox.
+
+Тексты писем рендерятся по предкомпилированным шаблонам (kingdom.rendering).
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import rendering
+from .models import OutboxMessage
+
+logger = logging.getLogger('kingdom')
+
+BATCH_SIZE = getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 100)
+# Сколько пачек отправляет один запуск задачи
+MAX_BATCHES = getattr(settings, 'NOTIFICATION_OUTBOX_MAX_BATCHES', 10)
+MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+RETRY_DELAY = getattr(settings, 'NOTIFICATION_RETRY_DELAY', 60)
+RETRY_MAX_DELAY = getattr(settings, 'NOTIFICATION_RETRY_MAX_DELAY', 60 * 60)
+LEASE_SECONDS = getattr(settings, 'NOTIFICATION_OUTBOX_LEASE', 5 * 60)
+RETENTION_DAYS = getattr(settings, 'NOTIFICATION_OUTBOX_RETENTION_DAYS', 30)
+# Сколько строк удаляется одной транзакцией при очистке очереди
+PURGE_BATCH_SIZE = getattr(settings, 'NOTIFICATION_OUTBOX_PURGE_BATCH_SIZE', 1000)
+
+
+def enrollment_key(citizen_id, enrolled_at):
+    """Ключ дедупликации уведомления о зачислении: подданный и время зачисления"""
+    return f'enrollment:{citizen_id}:{enrolled_at.isoformat()}'
+
+
+def test_completion_key(attempt_id):
+    """Ключ дедупликации уведомления о результатах: попытка тестирования"""
+    return f'test_completion:{attempt_id}'
+
+
+def build_message(kind, recipient, rendered, dedup_key):
+    """
+    Уведомление для очереди (не сохраняется)
+
+    Args:
+        kind: Тип уведомления из OutboxMessage.KIND_CHOICES
+        recipient: Email получателя
+        rendered: Тема, текст и HTML письма (kingdom.rendering.RenderedNotification)
+        dedup_key: Ключ дедупликации события (enrollment_key, test_completion_key)
+
+    Returns:
+        OutboxMessage
+
+    Raises:
+        ValueError: Если ключ дедупликации не задан
+    """
+    if not dedup_key:
+        raise ValueError('Не задан ключ дедупликации уведомления')
+    return OutboxMessage(
+        kind=kind,
+        recipient=recipient,
+        subject=rendered.subject,
+        body=rendered.body,
+        html_body=rendered.html_body,
+        dedup_key=dedup_key,
+    )
+
+
+def enrollment_message(citizen_email, king_name, kingdom_name, dedup_key):
+    """Уведомление подданного о зачислении"""
+    rendered = rendering.render('enrollment', king_name=king_name, kingdom_name=kingdom_name)
+    return build_message('enrollment', citizen_email, rendered, dedup_key)
+
+
+def enrollment_messages(recipients, king_name, kingdom_name):
+    """
+    Уведомления о зачислении для когорты одного короля
+
+    Письмо рендерится один раз на всю когорту.
+
+    Args:
+        recipients: Пары (email получателя, ключ дедупликации)
+        king_name: Имя короля
+        kingdom_name: Название королевства
+
+    Returns:
+        Список OutboxMessage
+    """
+    recipients = list(recipients)
+    rendered = rendering.render_batch(
+        'enrollment', [{'king_name': king_name, 'kingdom_name': kingdom_name}] * len(recipients)
+    )
+    return [
+        build_message('enrollment', email, message, dedup_key)
+        for (email, dedup_key), message in zip(recipients, rendered)
+    ]
+
+
+def test_completion_message(citizen_email, test_title, score, total_questions, dedup_key):
+    """Уведомление подданного о результатах тестирования"""
+    rendered = rendering.render(
+        'test_completion',
+        test_title=test_title,
+        score=score,
+        total_questions=total_questions,
+        percentage=round((score / total_questions) * 100, 2) if total_questions else 0,
+    )
+    return build_message('test_completion', citizen_email, rendered, dedup_key)
+
+
+def enqueue(messages):
+    """
+    Постановка уведомлений в очередь одним INSERT
+
+    Уведомления с уже известным dedup_key пропускаются.
+    """
+    messages = list(messages)
+    if messages:
+        OutboxMessage.objects.bulk_create(messages, ignore_conflicts=True)
+    return len(messages)
+
+
+def purge_outbox(retention_days=None, batch_size=None):
+    """
+    Удаление отправленных писем и писем с ошибкой старше срока хранения
+
+    Строки удаляются пачками по batch_size, каждая в своей транзакции.
+    Письма в очереди (pending) не удаляются.
+
+    Args:
+        retention_days: Срок хранения в днях (по умолчанию RETENTION_DAYS)
+        batch_size: Размер пачки удаления (по умолчанию PURGE_BATCH_SIZE)
+
+    Returns:
+        Количество удаленных писем
+    """
+    cutoff = timezone.now() - timedelta(days=RETENTION_DAYS if retention_days is None else retention_days)
+    expired = OutboxMessage.objects.filter(status__in=('sent', 'failed'), created_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(expired.values_list('pk', flat=True)[:batch_size or PURGE_BATCH_SIZE])
+        if not ids:
+            break
+        with transaction.atomic():
+            deleted += OutboxMessage.objects.filter(pk__in=ids).delete()[0]
+    if deleted:
+        logger.info(f'Очередь уведомлений: удалено {deleted} писем старше {cutoff:%Y-%m-%d}')
+    return deleted
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой после attempts неудачных"""
+    return timedelta(seconds=min(RETRY_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY))
+
+
+def claim_batch(batch_size=None):
+    """
+    Выбор пачки писем, готовых к отправке, с арендой на LEASE_SECONDS
+
+    Строки, заблокированные другим отправителем, пропускаются (SKIP LOCKED).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .select_for_update(skip_locked=True)[:batch_size or BATCH_SIZE]
+        )
+        if messages:
+            OutboxMessage.objects.filter(pk__in=[message.pk for message in messages]).update(
+                next_attempt_at=now + timedelta(seconds=LEASE_SECONDS)
+            )
+    return messages
+
+
+def _email(message):
+    email = EmailMultiAlternatives(
+        subject=message.subject,
+        body=message.body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[message.recipient],
+    )
+    if message.html_body:
+        email.attach_alternative(message.html_body, 'text/html')
+    return email
+
+
+def send_batch(messages, connection=None):
+    """
+    Отправка пачки писем по одному соединению и запись результатов
+
+    Ошибка отдельного письма не прерывает пачку; ошибка открытия
+    соединения считается ошибкой всех писем пачки.
+
+    Returns:
+        Метрики пачки: claimed, sent, retried, failed, duration_ms
+    """
+    started = time.perf_counter()
+    connection = connection or get_connection(fail_silently=False)
+    sent, errors = [], {}
+    try:
+        connection.open()
+    except Exception as e:
+        errors = {message.pk: str(e) for message in messages}
+    else:
+        try:
+            for message in messages:
+                try:
+                    connection.send_messages([_email(message)])
+                    sent.append(message.pk)
+                except Exception as e:
+                    errors[message.pk] = str(e)
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    if sent:
+        OutboxMessage.objects.filter(pk__in=sent).update(status='sent', sent_at=now, last_error='')
+
+    failed = []
+    for message in messages:
+        if message.pk not in errors:
+            continue
+        message.attempts += 1
+        message.last_error = errors[message.pk]
+        if message.attempts >= MAX_ATTEMPTS:
+            message.status = 'failed'
+        else:
+            message.next_attempt_at = now + retry_delay(message.attempts)
+        failed.append(message)
+    if failed:
+        OutboxMessage.objects.bulk_update(failed, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    return {
+        'claimed': len(messages),
+        'sent': len(sent),
+        'retried': sum(message.status == 'pending' for message in failed),
+        'failed': sum(message.status == 'failed' for message in failed),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def drain_outbox(batch_size=None, max_batches=None, connection=None):
+    """
+    Отправка писем из очереди пачками
+
+    Args:
+        batch_size: Размер пачки (по умолчанию BATCH_SIZE)
+        max_batches: Максимум пачек за вызов (по умолчанию MAX_BATCHES)
+        connection: Почтовое соединение (по умолчанию get_connection())
+
+    Returns:
+        Сумма метрик пачек и количество пачек (batches)
+    """
+    totals = {'batches': 0, 'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'duration_ms': 0}
+    for _ in range(max_batches or MAX_BATCHES):
+        messages = claim_batch(batch_size)
+        if not messages:
+            break
+        metrics = send_batch(messages, connection)
+        logger.info(
+            f'Очередь уведомлений: пачка {metrics["claimed"]}, отправлено {metrics["sent"]}, '
+            f'отложено {metrics["retried"]}, ошибок {metrics["failed"]}, {metrics["duration_ms"]} мс'
+        )
+        totals['batches'] += 1
+        for key, value in metrics.items():
+            totals[key] += value
+        if metrics['claimed'] < (batch_size or BATCH_SIZE):
+            break
+    totals['duration_ms'] = round(totals['duration_ms'], 2)
+    return totals
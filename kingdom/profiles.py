@@ -0,0 +1,119 @@
+"""
+Профиль пользователя в рамках запроса
+
+Представления почти всегда обращаются к request.user.king_profile или
+request.user.citizen_profile, затем к .kingdom и .kingdom.test - и каждый
+шаг был отдельным ленивым запросом. RequestProfileMiddleware добавляет
+в запрос request.profile: при первом обращении профиль роли загружается
+одним запросом вместе с королевством и тестом и кэшируется на объекте
+пользователя, поэтому user.king_profile / user.citizen_profile после этого
+тоже не обращаются к базе.
+
+Профиль загружается лениво, чтобы учитывался пользователь, установленный
+аутентификацией DRF (JWT), а не только сессией: DRF записывает пользователя
+и в исходный HttpRequest. Между запросами профиль не кэшируется: в нем есть
+часто меняющиеся поля (citizens_count, is_enrolled), на которых основаны
+проверки при зачислении.
+"""
+from .models import King, Citizen, Test
+
+# Связи, загружаемые вместе с профилем роли
+PROFILE_RELATED = {
+    'king_profile': (King, ('kingdom__test',)),
+    'citizen_profile': (Citizen, ('kingdom__test', 'king__user')),
+}
+
+
+def _role_accessor(user):
+    if user.is_king:
+        return 'king_profile'
+    if user.is_citizen:
+        return 'citizen_profile'
+    return None
+
+
+def load_profile(user):
+    """
+    Загрузка профиля роли пользователя одним запросом
+
+    Профиль (или его отсутствие) сохраняется в кэше связи пользователя.
+
+    Returns:
+        King, Citizen или None
+    """
+    if not user.is_authenticated:
+        return None
+    accessor = _role_accessor(user)
+    if accessor is None:
+        return None
+
+    # user может быть SimpleLazyObject из AuthenticationMiddleware
+    relation = user._meta.get_field(accessor)
+    if relation.is_cached(user):
+        return relation.get_cached_value(user)
+
+    model, related = PROFILE_RELATED[accessor]
+    profile = model.objects.select_related(*related).filter(user=user).first()
+    relation.set_cached_value(user, profile)
+    if profile is not None:
+        model.user.field.set_cached_value(profile, user)
+    return profile
+
+
+class RequestProfile:
+    """Роль пользователя запроса: профиль короля или подданного, королевство и тест"""
+
+    def __init__(self, user):
+        self.user = user
+        self.profile = load_profile(user)
+
+    @property
+    def king(self):
+        """Профиль короля (King.DoesNotExist, если его нет)"""
+        return self.user.king_profile
+
+    @property
+    def citizen(self):
+        """Профиль подданного (Citizen.DoesNotExist, если его нет)"""
+        return self.user.citizen_profile
+
+    @property
+    def kingdom(self):
+        """Королевство профиля или None"""
+        return self.profile.kingdom if self.profile is not None else None
+
+    @property
+    def test(self):
+        """Тестовое испытание королевства или None"""
+        kingdom = self.kingdom
+        if kingdom is None:
+            return None
+        try:
+            return kingdom.test
+        except Test.DoesNotExist:
+            return None
+
+
+def get_request_profile(request):
+    """
+    Профиль пользователя запроса
+
+    Профиль пересоздается, если пользователь запроса сменился
+    (например, после аутентификации DRF).
+    """
+    user = request.user
+    profile = getattr(request, '_request_profile', None)
+    if profile is None or profile.user is not user:
+        profile = RequestProfile(user)
+        request._request_profile = profile
+    return profile
+
+
+class LazyRequestProfile:
+    """Профиль, вычисляемый по текущему пользователю запроса при обращении к атрибутам"""
+
+    def __init__(self, request):
+        self._request = request
+
+    def __getattr__(self, name):
+        return getattr(get_request_profile(self._request), name)
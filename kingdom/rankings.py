@@ -0,0 +1,140 @@
+"""
+Рейтинг кандидатов королевства
+
+CandidateRanking хранит для каждого подданного с завершенной попыткой
+лучший результат (процент, баллы, время завершения) и статус зачисления.
+Строка пересчитывается при завершении попытки, статус зачисления
+обновляется при зачислении, поэтому топ королевства читается одним
+запросом по индексу (kingdom, -percentage, -best_score, completed_at, id)
+без сортировки попыток в Python.
+"""
+from django.db import connection, transaction
+from django.db.models import ExpressionWrapper, F, FloatField
+
+from .models import CandidateRanking, Citizen, TestAttempt
+
+# Порядок рейтинга: процент, баллы, более раннее завершение
+RANKING_ORDER = ('-percentage', '-best_score', 'completed_at', 'id')
+
+# Количество кандидатов в топе по умолчанию и максимальное
+TOP_LIMIT = 50
+MAX_TOP_LIMIT = 200
+
+# Размер пачки при полном пересчете рейтинга
+REBUILD_BATCH_SIZE = 1000
+
+
+def _best_attempts():
+    """Завершенные попытки, упорядоченные от лучшей к худшей"""
+    percentage = ExpressionWrapper(F('score') * 1.0 / F('total_questions'), output_field=FloatField())
+    return TestAttempt.objects.filter(status='completed', total_questions__gt=0, completed_at__isnull=False).alias(
+        ratio=percentage
+    ).order_by('-ratio', '-score', 'completed_at', 'id')
+
+
+def _ranking(citizen, attempt):
+    return CandidateRanking(
+        citizen_id=citizen.pk,
+        kingdom_id=citizen.kingdom_id,
+        attempt_id=attempt.pk,
+        best_score=attempt.score,
+        total_questions=attempt.total_questions,
+        percentage=attempt.percentage,
+        completed_at=attempt.completed_at,
+        is_enrolled=citizen.is_enrolled,
+    )
+
+
+def refresh_ranking(citizen_id):
+    """
+    Пересчет строки рейтинга подданного по его лучшей завершенной попытке
+
+    Строка удаляется, если завершенных попыток нет.
+
+    Returns:
+        CandidateRanking или None
+    """
+    attempt = _best_attempts().filter(citizen_id=citizen_id).select_related('citizen').first()
+    if attempt is None:
+        CandidateRanking.objects.filter(citizen_id=citizen_id).delete()
+        return None
+
+    ranking = _ranking(attempt.citizen, attempt)
+    CandidateRanking.objects.bulk_create(
+        [ranking],
+        update_conflicts=True,
+        unique_fields=['citizen'],
+        update_fields=[
+            'kingdom', 'attempt', 'best_score', 'total_questions',
+            'percentage', 'completed_at', 'is_enrolled', 'updated_at'
+        ]
+    )
+    return ranking
+
+
+def sync_citizen(citizen):
+    """Обновление статуса зачисления и королевства подданного в рейтинге"""
+    CandidateRanking.objects.filter(citizen_id=citizen.pk).exclude(
+        is_enrolled=citizen.is_enrolled,
+        kingdom_id=citizen.kingdom_id
+    ).update(is_enrolled=citizen.is_enrolled, kingdom_id=citizen.kingdom_id)
+
+
+def rebuild_rankings(kingdom=None):
+    """
+    Полный пересчет рейтинга (для существующих данных и сверки)
+
+    Args:
+        kingdom: Королевство или None для всех королевств
+
+    Returns:
+        Количество строк рейтинга
+    """
+    citizens = Citizen.objects.all()
+    if kingdom is not None:
+        citizens = citizens.filter(kingdom=kingdom)
+
+    # Лучшая попытка каждого подданного одним запросом (DISTINCT ON), читается потоком;
+    # без DISTINCT ON (SQLite) берется первая попытка подданного в этом порядке
+    best = _best_attempts().filter(citizen__in=citizens).order_by(
+        'citizen_id', '-ratio', '-score', 'completed_at', 'id'
+    ).select_related('citizen')
+    if connection.features.can_distinct_on_fields:
+        best = best.distinct('citizen_id')
+
+    rows = 0
+    with transaction.atomic():
+        CandidateRanking.objects.filter(citizen__in=citizens).delete()
+        rankings = []
+        previous = None
+        for attempt in best.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            if attempt.citizen_id == previous:
+                continue
+            previous = attempt.citizen_id
+            rankings.append(_ranking(attempt.citizen, attempt))
+            if len(rankings) >= REBUILD_BATCH_SIZE:
+                CandidateRanking.objects.bulk_create(rankings)
+                rows += len(rankings)
+                rankings = []
+        CandidateRanking.objects.bulk_create(rankings)
+        rows += len(rankings)
+    return rows
+
+
+def top_candidates(kingdom, limit=TOP_LIMIT, include_enrolled=False):
+    """
+    Лучшие подданные королевства по рейтингу
+
+    Args:
+        kingdom: Королевство или его идентификатор
+        limit: Количество строк (не больше MAX_TOP_LIMIT)
+        include_enrolled: Включать ли зачисленных подданных
+
+    Returns:
+        QuerySet CandidateRanking с загруженными подданными и пользователями
+    """
+    rankings = CandidateRanking.objects.filter(kingdom=kingdom)
+    if not include_enrolled:
+        rankings = rankings.filter(is_enrolled=False)
+    limit = max(1, min(limit, MAX_TOP_LIMIT))
+    return rankings.select_related('citizen__user').order_by(*RANKING_ORDER)[:limit]
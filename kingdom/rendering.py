@@ -0,0 +1,113 @@
+"""
+Рендеринг уведомлений по шаблонам Jinja2
+
+Шаблоны уведомления NAME лежат в templates/notifications: NAME.html (HTML,
+с автоэкранированием) и NAME.txt (текстовая версия, без strip_tags при
+каждой отправке), тема задается в SUBJECTS. Окружение Jinja2 и
+скомпилированные шаблоны создаются один раз на процесс (воркер) и не
+перечитываются с диска.
+
+render_batch рендерит уведомления для списка контекстов за один проход:
+одинаковые контексты (например, зачисление когорты одним королем)
+рендерятся один раз.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+TEMPLATE_DIR = 'notifications'
+
+# Темы писем по имени уведомления
+SUBJECTS = {
+    'enrollment': 'Поздравляем! Вы зачислены в королевство {{ kingdom_name }}',
+    'test_completion': 'Результаты тестирования: {{ test_title }}',
+}
+
+
+class RenderedNotification:
+    """Тема, текст и HTML уведомления"""
+
+    __slots__ = ('subject', 'body', 'html_body')
+
+    def __init__(self, subject, body, html_body):
+        self.subject = subject
+        self.body = body
+        self.html_body = html_body
+
+
+class NotificationTemplate:
+    """Скомпилированные шаблоны темы, текста и HTML уведомления"""
+
+    def __init__(self, environment, name):
+        if name not in SUBJECTS:
+            raise ValueError(f'Неизвестное уведомление: {name}')
+        self.name = name
+        self.subject = environment.from_string(SUBJECTS[name])
+        self.text = environment.get_template(f'{TEMPLATE_DIR}/{name}.txt')
+        self.html = environment.get_template(f'{TEMPLATE_DIR}/{name}.html')
+
+    def render(self, context):
+        """Рендеринг уведомления для одного контекста"""
+        return RenderedNotification(
+            subject=self.subject.render(context).strip(),
+            body=self.text.render(context),
+            html_body=self.html.render(context),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_environment():
+    """Окружение Jinja2 уведомлений (одно на процесс)"""
+    return Environment(
+        loader=FileSystemLoader([str(path) for path in settings.TEMPLATES[0]['DIRS']]),
+        # Экранируются только .html, тема и .txt - обычный текст
+        autoescape=select_autoescape(['html'], default_for_string=False),
+        undefined=StrictUndefined,
+        keep_trailing_newline=True,
+        # Шаблоны не перечитываются с диска после компиляции
+        auto_reload=False,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_notification_template(name):
+    """Скомпилированные шаблоны уведомления (одни на процесс)"""
+    return NotificationTemplate(get_environment(), name)
+
+
+def render(name, **context):
+    """
+    Рендеринг уведомления
+
+    Args:
+        name: Имя уведомления из SUBJECTS
+        **context: Переменные шаблона
+
+    Returns:
+        RenderedNotification
+    """
+    return get_notification_template(name).render(context)
+
+
+def render_batch(name, contexts):
+    """
+    Рендеринг уведомления для списка контекстов за один проход
+
+    Args:
+        name: Имя уведомления из SUBJECTS
+        contexts: Список словарей переменных шаблона (значения - хэшируемые)
+
+    Returns:
+        Список RenderedNotification в порядке contexts; для одинаковых
+        контекстов возвращается один и тот же объект
+    """
+    template = get_notification_template(name)
+    rendered = {}
+    result = []
+    for context in contexts:
+        key = tuple(sorted(context.items()))
+        if key not in rendered:
+            rendered[key] = template.render(context)
+        result.append(rendered[key])
+    return result
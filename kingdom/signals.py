@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_test_definition
+from .models import King, Citizen, Test, Question, TestAttempt
+from .rankings import refresh_ranking, sync_citizen
+from users.authentication import invalidate_user
+
+
+@receiver(post_delete, sender=Citizen)
+def release_king_place(sender, instance, **kwargs):
+    """Освобождаем место у короля при удалении зачисленного подданного"""
+    if instance.king_id:
+        King.objects.filter(
+            pk=instance.king_id,
+            citizens_count__gt=0
+        ).update(citizens_count=F('citizens_count') - 1)
+
+
+@receiver(post_init, sender=Citizen)
+def remember_loaded_king(sender, instance, **kwargs):
+    """Король подданного на момент загрузки (отложенное поле не читается)"""
+    instance._loaded_king_id = instance.__dict__.get('king_id')
+
+
+@receiver(pre_save, sender=Citizen)
+def remember_king_place(sender, instance, raw=False, **kwargs):
+    """Король подданного до сохранения (админка, импорт)"""
+    previous = None
+    if not instance._state.adding:
+        previous = instance._loaded_king_id
+        if previous != instance.king_id:
+            # Зачисление меняет короля через UPDATE, актуальное значение - в базе
+            previous = Citizen.objects.filter(pk=instance.pk).values_list('king_id', flat=True).first()
+    instance._previous_king_id = previous
+
+
+@receiver(post_save, sender=Citizen)
+def move_king_place(sender, instance, raw=False, **kwargs):
+    """
+    Перенос места в счетчиках королей при смене короля через save()
+
+    Зачисление (Citizen.enroll, kingdom.enrollment) меняет счетчик само
+    и сохраняет подданного через UPDATE, поэтому сюда не попадает. Место у
+    нового короля занимается тем же условным UPDATE (citizens_count <
+    max_citizens); если места нет, ValueError откатывает транзакцию
+    Citizen.save().
+    """
+    previous = getattr(instance, '_previous_king_id', None)
+    instance._loaded_king_id = instance.king_id
+    if raw or previous == instance.king_id:
+        return
+    if previous:
+        King.objects.filter(
+            pk=previous,
+            citizens_count__gt=0
+        ).update(citizens_count=F('citizens_count') - 1)
+    if instance.king_id:
+        reserved = King.objects.filter(
+            pk=instance.king_id,
+            citizens_count__lt=F('max_citizens')
+        ).update(citizens_count=F('citizens_count') + 1)
+        if not reserved:
+            raise ValueError('Король не может принять больше подданных')
+
+
+def _invalidate_test_definition(kingdom_id):
+    """Сброс кэша определения теста сразу и повторно после фиксации транзакции"""
+    invalidate_test_definition(kingdom_id)
+    transaction.on_commit(lambda: invalidate_test_definition(kingdom_id))
+
+
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def invalidate_test_cache_on_test_change(sender, instance, **kwargs):
+    """Сброс кэша определения теста при изменении теста"""
+    _invalidate_test_definition(instance.kingdom_id)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_test_cache_on_question_change(sender, instance, **kwargs):
+    """Сброс кэша определения теста при изменении вопроса"""
+    if Question.test.is_cached(instance):
+        kingdom_id = instance.test.kingdom_id
+    else:
+        kingdom_id = Test.objects.filter(pk=instance.test_id).values_list('kingdom_id', flat=True).first()
+    if kingdom_id is not None:
+        _invalidate_test_definition(kingdom_id)
+
+
+@receiver(post_save, sender=King)
+@receiver(post_delete, sender=King)
+@receiver(post_save, sender=Citizen)
+@receiver(post_delete, sender=Citizen)
+def invalidate_user_on_profile_change(sender, instance, **kwargs):
+    """Сброс кэша JWT-аутентификации при изменении профиля роли"""
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Citizen)
+def sync_ranking_on_citizen_change(sender, instance, created, **kwargs):
+    """Статус зачисления и королевство подданного в рейтинге кандидатов"""
+    if not created:
+        sync_citizen(instance)
+
+
+@receiver(post_save, sender=TestAttempt)
+def refresh_ranking_on_attempt_save(sender, instance, **kwargs):
+    """Пересчет рейтинга при сохранении завершенной попытки вне записи ответов (админка)"""
+    if instance.status == 'completed':
+        refresh_ranking(instance.citizen_id)
+
+
+@receiver(post_delete, sender=TestAttempt)
+def refresh_ranking_on_attempt_delete(sender, instance, **kwargs):
+    """Пересчет рейтинга при удалении попытки"""
+    refresh_ranking(instance.citizen_id)
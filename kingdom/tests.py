@@ -1,4 +1,7 @@
-from django.test import TestCase, Client
+import os
+import tempfile
+
+from django.test import TestCase, TransactionTestCase, Client, override_settings, skipUnlessDBFeature
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
@@ -6,10 +9,20 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from kingdom.models import Kingdom, King, Citizen, Test, Question, TestAttempt, Answer
+from kingdom.models import Kingdom, King, Citizen, Test, Question, TestAttempt, Answer, CandidateRanking
+from action_logs.models import ActionLog
 
 User = get_user_model()
 
+# Общий для процессов кэш для тестов с точным количеством запросов:
+# снимки пользователей JWT хранятся только в таком кэше (не LocMemCache)
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'hart_citizens_test_cache'),
+    }
+}
+
 
 class UserModelTest(TestCase):
     """Тесты для модели User"""
@@ -458,4 +471,1750 @@ class APITest(APITestCase):
         response = self.client.get('/api/kingdom/dashboard/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['user_type'], 'citizen')
-        self.assertIn('citizen', response.data)
\ No newline at end of file
+        self.assertIn('citizen', response.data)
+
+class KingCandidatesQueryTest(TestCase):
+    """Тесты отбора кандидатов на зачисление"""
+    
+    def setUp(self):
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.king_user = User.objects.create_user(
+            username='kinguser',
+            password='testpass123',
+            first_name='Test',
+            last_name='King',
+            role='king'
+        )
+        self.king = King.objects.create(user=self.king_user, kingdom=self.kingdom, max_citizens=5)
+        self.test = Test.objects.create(kingdom=self.kingdom, title='Test Title')
+        self.candidates_created = 0
+    
+    def create_candidates(self, count, status='completed'):
+        """Создание подданных с попыткой тестирования"""
+        citizens = []
+        for _ in range(count):
+            self.candidates_created += 1
+            n = self.candidates_created
+            user = User.objects.create_user(
+                username=f'candidate{n}',
+                email=f'candidate{n}@example.com',
+                password='testpass123',
+                first_name='Candidate',
+                last_name=str(n),
+                role='citizen'
+            )
+            citizen = Citizen.objects.create(
+                user=user,
+                kingdom=self.kingdom,
+                age=20,
+                pigeon_email=f'candidate{n}@example.com'
+            )
+            TestAttempt.objects.create(
+                citizen=citizen,
+                test=self.test,
+                status=status,
+                score=2,
+                total_questions=3,
+                completed_at=timezone.now() if status == 'completed' else None
+            )
+            citizens.append(citizen)
+        return citizens
+    
+    def test_only_passed_not_enrolled_citizens(self):
+        """В кандидаты попадают только прошедшие тест и не зачисленные"""
+        from kingdom.candidates import get_candidates
+        
+        passed = self.create_candidates(2)
+        self.create_candidates(1, status='in_progress')
+        enrolled = self.create_candidates(1)[0]
+        enrolled.is_enrolled = True
+        enrolled.king = self.king
+        enrolled.save()
+        
+        candidates = list(get_candidates(self.kingdom))
+        self.assertEqual({c.id for c in candidates}, {c.id for c in passed})
+        self.assertEqual(candidates[0].last_score, 2)
+        self.assertEqual(candidates[0].last_total_questions, 3)
+    
+    def test_selection_query_count_is_constant(self):
+        """Количество запросов не зависит от числа кандидатов"""
+        from kingdom.candidates import paginate_candidates
+        
+        for count in (3, 30):
+            self.create_candidates(count)
+            with self.assertNumQueries(2):
+                page = paginate_candidates(self.kingdom, per_page=100)
+                candidates = list(page.object_list)
+                for citizen in candidates:
+                    citizen.user.get_full_name()
+                    citizen.last_score
+            self.assertEqual(len(candidates), self.candidates_created)
+    
+    def test_dashboard_api_query_count_is_constant(self):
+        """API панели короля выполняет одинаковое число запросов при росте кандидатов"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        refresh = RefreshToken.for_user(self.king_user)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        # Первый запрос заполняет кэш JWT-аутентификации
+        client.get('/api/kingdom/dashboard/')
+        
+        query_counts = []
+        for count in (2, 20):
+            self.create_candidates(count)
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.get('/api/kingdom/dashboard/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['candidates_count'], self.candidates_created)
+            query_counts.append(len(ctx.captured_queries))
+        
+        self.assertEqual(query_counts[0], query_counts[1])
+    
+    def test_king_dashboard_paginates_candidates(self):
+        """Панель короля показывает кандидатов постранично"""
+        from kingdom.candidates import CANDIDATES_PER_PAGE
+        
+        self.create_candidates(CANDIDATES_PER_PAGE + 1)
+        client = Client()
+        client.force_login(self.king_user)
+        
+        response = client.get(reverse('kingdom:king_dashboard'), {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['candidates_page'].number, 2)
+        self.assertEqual(len(response.context['enrolled_citizens']), 1)
+        self.assertEqual(response.context['candidates_page'].paginator.count, CANDIDATES_PER_PAGE + 1)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class RecordAnswerTest(TestCase):
+    """Тесты записи ответов на вопросы"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='citizenuser',
+            email='citizen@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='Citizen',
+            role='citizen'
+        )
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.citizen = Citizen.objects.create(
+            user=self.user,
+            kingdom=self.kingdom,
+            age=25,
+            pigeon_email='citizen@example.com'
+        )
+        self.test = Test.objects.create(kingdom=self.kingdom, title='Test Title')
+    
+    def create_attempt(self, questions_count):
+        """Создание теста с вопросами и попытки его прохождения"""
+        Question.objects.filter(test=self.test).delete()
+        questions = [
+            Question.objects.create(test=self.test, text=f'Question {i}?', correct_answer=True, order=i)
+            for i in range(questions_count)
+        ]
+        attempt = TestAttempt.objects.create(
+            citizen=self.citizen,
+            test=self.test,
+            total_questions=questions_count
+        )
+        return attempt, questions
+    
+    def test_score_and_completion(self):
+        """Баллы и завершение попытки обновляются инкрементально"""
+        from kingdom.answers import record_answer
+        
+        attempt, questions = self.create_attempt(2)
+        
+        self.assertEqual(record_answer(attempt, questions[0], True), (True, False))
+        self.assertEqual(record_answer(attempt, questions[1], False), (False, True))
+        
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.status, 'completed')
+        self.assertIsNotNone(attempt.completed_at)
+        self.assertEqual(attempt.score, 1)
+        self.assertEqual(attempt.answered_count, 2)
+    
+    def test_changing_answer_adjusts_score(self):
+        """Повторный ответ на вопрос пересчитывает баллы без повторного учета"""
+        from kingdom.answers import record_answer
+        
+        attempt, questions = self.create_attempt(3)
+        
+        record_answer(attempt, questions[0], False)
+        record_answer(attempt, questions[0], True)
+        
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.score, 1)
+        self.assertEqual(attempt.answered_count, 1)
+        self.assertEqual(Answer.objects.filter(attempt=attempt).count(), 1)
+    
+    def test_completed_attempt_rejects_answers(self):
+        """Ответы в завершенную попытку не принимаются"""
+        from kingdom.answers import record_answer
+        
+        attempt, questions = self.create_attempt(1)
+        record_answer(attempt, questions[0], True)
+        
+        with self.assertRaises(ValueError):
+            record_answer(attempt, questions[0], False)
+    
+    def test_answer_question_api(self):
+        """API ответа на вопрос использует инкрементальный пересчет"""
+        attempt, questions = self.create_attempt(1)
+        refresh = RefreshToken.for_user(self.user)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        
+        response = client.post(
+            f'/api/kingdom/test-attempts/{attempt.id}/answer_question/',
+            {'question_id': str(questions[0].id), 'answer': True},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'is_correct': True, 'completed': True, 'score': 1, 'total': 1})
+        self.assertTrue(ActionLog.objects.filter(user=self.user, action='test_complete').exists())
+    
+    def test_query_count_does_not_depend_on_test_length(self):
+        """Стоимость ответа не зависит от количества вопросов и ответов"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from kingdom.answers import record_answer
+        
+        query_counts = []
+        for questions_count in (3, 30):
+            attempt, questions = self.create_attempt(questions_count)
+            for question in questions[:-2]:
+                record_answer(attempt, question, True)
+            with CaptureQueriesContext(connection) as ctx:
+                record_answer(attempt, questions[-2], True)
+            query_counts.append(len(ctx.captured_queries))
+            attempt.delete()
+        
+        self.assertEqual(query_counts[0], query_counts[1])
+    
+    def test_cursor_follows_answers(self):
+        """Курсор сдвигается по ответам и перескакивает вопросы, отвеченные не по порядку"""
+        from kingdom.answers import record_answer, record_answers, next_question
+        from kingdom.cache import get_test_definition
+        
+        attempt, questions = self.create_attempt(5)
+        definition = get_test_definition(self.kingdom.id)
+        
+        record_answer(attempt, questions[0], True)
+        self.assertEqual(attempt.question_cursor, 1)
+        record_answers(attempt, definition, {questions[2].id: True, questions[3].id: False})
+        self.assertEqual(attempt.question_cursor, 1)
+        record_answer(attempt, questions[1], True)
+        self.assertEqual(attempt.question_cursor, 4)
+        
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.question_cursor, 4)
+        # Вопрос под курсором проверяется одним запросом
+        with self.assertNumQueries(1):
+            progress = next_question(attempt, definition)
+        self.assertEqual(progress['question'].id, questions[4].id)
+        self.assertEqual((progress['answered'], progress['remaining'], progress['progress']), (4, 1, 80.0))
+        
+        record_answer(attempt, questions[4], True)
+        self.assertIsNone(next_question(attempt, definition)['question'])
+    
+    def test_cursor_after_questions_change(self):
+        """Вопрос, добавленный перед курсором, выдается, хотя под курсором отвеченный вопрос"""
+        from kingdom.answers import record_answer, next_question
+        from kingdom.cache import get_test_definition
+        
+        attempt, questions = self.create_attempt(3)
+        record_answer(attempt, questions[0], True)
+        record_answer(attempt, questions[1], True)
+        self.assertEqual(attempt.question_cursor, 2)
+        
+        inserted = Question.objects.create(test=self.test, text='Inserted?', correct_answer=True, order=0)
+        definition = get_test_definition(self.kingdom.id)
+        self.assertEqual(definition.questions[2].id, questions[1].id)
+        
+        progress = next_question(attempt, definition)
+        self.assertEqual(progress['question'].id, inserted.id)
+        self.assertEqual(progress['position'], [q.id for q in definition.questions].index(inserted.id))
+    
+    def test_cursor_kept_without_definition(self):
+        """Ответ без определения теста попытки не сбрасывает курсор"""
+        from types import SimpleNamespace
+        from kingdom.answers import record_answer
+        
+        attempt, questions = self.create_attempt(3)
+        record_answer(attempt, questions[0], True)
+        self.assertEqual(attempt.question_cursor, 1)
+        
+        foreign = SimpleNamespace(test_id=None, questions=())
+        record_answer(attempt, questions[1], True, definition=foreign)
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.question_cursor, 1)
+        self.assertEqual(attempt.answered_count, 2)
+    
+    def test_next_question_api(self):
+        """API следующего вопроса возвращает только один вопрос и прогресс"""
+        from kingdom.answers import record_answer
+        
+        attempt, questions = self.create_attempt(3)
+        record_answer(attempt, questions[0], True)
+        refresh = RefreshToken.for_user(self.user)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        url = f'/api/kingdom/test-attempts/{attempt.id}/next_question/'
+        client.get(url)
+        
+        # Запрос попытки и проверка вопроса под курсором: пользователь и тест берутся из кэша
+        with self.assertNumQueries(2):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['question']['id'], str(questions[1].id))
+        self.assertEqual(data['question']['text'], 'Question 1?')
+        self.assertEqual(
+            {key: data[key] for key in ('position', 'answered', 'total', 'remaining', 'completed')},
+            {'position': 1, 'answered': 1, 'total': 3, 'remaining': 2, 'completed': False}
+        )
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class RecordAnswerConcurrencyTest(TransactionTestCase):
+    """Тесты одновременной записи ответов в одну попытку"""
+    
+    def setUp(self):
+        user = User.objects.create_user(
+            username='citizenuser',
+            email='citizen@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='Citizen',
+            role='citizen'
+        )
+        kingdom = Kingdom.objects.create(name='Test Kingdom')
+        citizen = Citizen.objects.create(user=user, kingdom=kingdom, age=25, pigeon_email='citizen@example.com')
+        test = Test.objects.create(kingdom=kingdom, title='Test Title')
+        self.questions = [
+            Question.objects.create(test=test, text=f'Question {i}?', correct_answer=True, order=i)
+            for i in range(8)
+        ]
+        self.attempt = TestAttempt.objects.create(citizen=citizen, test=test, total_questions=len(self.questions))
+    
+    def test_parallel_answers_keep_counters_consistent(self):
+        """Параллельные ответы не теряют баллы, а попытка завершается ровно один раз"""
+        import threading
+        from django.db import connection
+        from kingdom.answers import record_answer
+        
+        barrier = threading.Barrier(len(self.questions))
+        results = []
+        
+        def answer(question):
+            try:
+                attempt = TestAttempt.objects.get(pk=self.attempt.pk)
+                barrier.wait()
+                results.append(record_answer(attempt, question, True))
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=answer, args=(q,)) for q in self.questions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.score, len(self.questions))
+        self.assertEqual(self.attempt.answered_count, len(self.questions))
+        self.assertEqual(self.attempt.status, 'completed')
+        self.assertEqual(sum(1 for _, completed_now in results if completed_now), 1)
+
+
+class BulkAnswerTest(TestCase):
+    """Тесты пакетной отправки ответов"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='citizenuser',
+            email='citizen@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='Citizen',
+            role='citizen'
+        )
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.citizen = Citizen.objects.create(
+            user=self.user,
+            kingdom=self.kingdom,
+            age=25,
+            pigeon_email='citizen@example.com'
+        )
+        self.test = Test.objects.create(kingdom=self.kingdom, title='Test Title')
+        refresh = RefreshToken.for_user(self.user)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+    
+    def create_attempt(self, questions_count):
+        """Создание теста с вопросами и попытки его прохождения"""
+        Question.objects.filter(test=self.test).delete()
+        questions = [
+            Question.objects.create(test=self.test, text=f'Question {i}?', correct_answer=i % 2 == 0, order=i)
+            for i in range(questions_count)
+        ]
+        attempt = TestAttempt.objects.create(
+            citizen=self.citizen,
+            test=self.test,
+            total_questions=questions_count
+        )
+        return attempt, questions
+    
+    def post_answers(self, attempt, answers):
+        """Отправка пакета ответов"""
+        return self.client.post(
+            f'/api/kingdom/test-attempts/{attempt.id}/answer_questions/',
+            {'answers': [{'question_id': str(q.id), 'answer': a} for q, a in answers]},
+            content_type='application/json'
+        )
+    
+    def test_whole_test_upload(self):
+        """Пакет со всеми ответами оценивает и завершает попытку"""
+        attempt, questions = self.create_attempt(4)
+        
+        response = self.post_answers(attempt, [(q, True) for q in questions])
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['completed'])
+        self.assertEqual(data['score'], 2)
+        self.assertEqual(data['answered'], 4)
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.status, 'completed')
+        self.assertEqual(attempt.score, 2)
+        self.assertEqual(Answer.objects.filter(attempt=attempt).count(), 4)
+        self.assertTrue(ActionLog.objects.filter(user=self.user, action='test_complete').exists())
+    
+    def test_partial_upload_overwrites_previous_answers(self):
+        """Повторная отправка перезаписывает ответы без двойного учета"""
+        attempt, questions = self.create_attempt(3)
+        
+        self.post_answers(attempt, [(questions[0], False), (questions[1], False)])
+        response = self.post_answers(attempt, [(questions[0], True)])
+        
+        self.assertEqual(response.status_code, 200)
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.status, 'in_progress')
+        self.assertEqual(attempt.answered_count, 2)
+        self.assertEqual(attempt.score, 2)
+    
+    def test_foreign_question_rejected(self):
+        """Вопросы чужого теста отклоняются целиком"""
+        attempt, questions = self.create_attempt(2)
+        other_kingdom = Kingdom.objects.create(name='Other Kingdom')
+        other_test = Test.objects.create(kingdom=other_kingdom, title='Other')
+        foreign = Question.objects.create(test=other_test, text='Foreign?', correct_answer=True, order=1)
+        
+        response = self.post_answers(attempt, [(questions[0], True), (foreign, True)])
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Answer.objects.filter(attempt=attempt).exists())
+    
+    def test_empty_batch_rejected(self):
+        """Пустой пакет ответов отклоняется"""
+        attempt, _ = self.create_attempt(1)
+        response = self.client.post(
+            f'/api/kingdom/test-attempts/{attempt.id}/answer_questions/',
+            {'answers': []},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    def test_benchmark_bulk_against_single_answers(self):
+        """Сравнение пакетной отправки с N отдельными ответами"""
+        import time
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        questions_count = 20
+        
+        attempt, questions = self.create_attempt(questions_count)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as single_ctx:
+            for question in questions:
+                response = self.client.post(
+                    f'/api/kingdom/test-attempts/{attempt.id}/answer_question/',
+                    {'question_id': str(question.id), 'answer': True},
+                    content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 200)
+        single_time = time.perf_counter() - started
+        
+        attempt, questions = self.create_attempt(questions_count)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as bulk_ctx:
+            response = self.post_answers(attempt, [(q, True) for q in questions])
+            self.assertEqual(response.status_code, 200)
+        bulk_time = time.perf_counter() - started
+        
+        report = (
+            f'{questions_count} ответов: отдельно {len(single_ctx.captured_queries)} запросов '
+            f'за {single_time * 1000:.1f} мс, пакетом {len(bulk_ctx.captured_queries)} запросов '
+            f'за {bulk_time * 1000:.1f} мс'
+        )
+        self.assertLess(len(bulk_ctx.captured_queries) * 5, len(single_ctx.captured_queries), report)
+        
+        # Стоимость пакета не зависит от количества вопросов
+        attempt, questions = self.create_attempt(questions_count * 2)
+        with CaptureQueriesContext(connection) as larger_ctx:
+            self.post_answers(attempt, [(q, True) for q in questions])
+        self.assertEqual(len(larger_ctx.captured_queries), len(bulk_ctx.captured_queries), report)
+
+
+class KingCitizensCounterTest(TestCase):
+    """Тесты хранимого счетчика подданных короля"""
+    
+    def setUp(self):
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        king_user = User.objects.create_user(
+            username='kinguser',
+            password='testpass123',
+            first_name='Test',
+            last_name='King',
+            role='king'
+        )
+        self.king = King.objects.create(user=king_user, kingdom=self.kingdom, max_citizens=2)
+        self.citizens = []
+        for i in range(3):
+            user = User.objects.create_user(
+                username=f'citizen{i}',
+                email=f'citizen{i}@example.com',
+                password='testpass123',
+                first_name='Citizen',
+                last_name=str(i),
+                role='citizen'
+            )
+            self.citizens.append(Citizen.objects.create(
+                user=user,
+                kingdom=self.kingdom,
+                age=20,
+                pigeon_email=f'citizen{i}@example.com'
+            ))
+    
+    def test_enroll_increments_counter(self):
+        """Зачисление увеличивает счетчик без запросов при чтении"""
+        self.citizens[0].enroll(self.king)
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.king.current_citizens_count, 1)
+            self.assertTrue(self.king.can_accept_more_citizens)
+    
+    def test_enroll_respects_limit(self):
+        """Зачисление сверх лимита отклоняется и не меняет счетчик"""
+        self.citizens[0].enroll(self.king)
+        self.citizens[1].enroll(self.king)
+        
+        with self.assertRaises(ValueError):
+            self.citizens[2].enroll(self.king)
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 2)
+        self.citizens[2].refresh_from_db()
+        self.assertFalse(self.citizens[2].is_enrolled)
+    
+    def test_double_enroll_does_not_take_place(self):
+        """Повторное зачисление того же подданного не занимает место"""
+        self.citizens[0].enroll(self.king)
+        
+        with self.assertRaises(ValueError):
+            Citizen.objects.get(pk=self.citizens[0].pk).enroll(self.king)
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 1)
+    
+    def test_delete_enrolled_citizen_releases_place(self):
+        """Удаление зачисленного подданного освобождает место"""
+        self.citizens[0].enroll(self.king)
+        self.citizens[0].delete()
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 0)
+    
+    def test_save_moves_place(self):
+        """Зачисление и отчисление через save() (админка, импорт) меняют счетчик"""
+        citizen = self.citizens[0]
+        citizen.is_enrolled = True
+        citizen.king = self.king
+        citizen.save()
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 1)
+        self.assertIsNotNone(citizen.enrolled_at)
+        
+        citizen.save()
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 1)
+        
+        citizen.is_enrolled = False
+        citizen.king = None
+        citizen.save()
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 0)
+        citizen.refresh_from_db()
+        self.assertIsNone(citizen.enrolled_at)
+    
+    def test_save_respects_limit(self):
+        """Зачисление через save() сверх лимита отклоняется и откатывается"""
+        self.citizens[0].enroll(self.king)
+        self.citizens[1].enroll(self.king)
+        citizen = self.citizens[2]
+        citizen.is_enrolled = True
+        citizen.king = self.king
+        
+        with self.assertRaises(ValueError):
+            citizen.save()
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 2)
+        citizen.refresh_from_db()
+        self.assertFalse(citizen.is_enrolled)
+        self.assertIsNone(citizen.king_id)
+    
+    def test_king_requires_enrollment(self):
+        """Король незачисленного подданного не сбрасывается молча, а отклоняется"""
+        from django.core.exceptions import ValidationError
+        
+        citizen = self.citizens[0]
+        citizen.king = self.king
+        
+        with self.assertRaises(ValidationError):
+            citizen.full_clean()
+        with self.assertRaises(ValueError):
+            citizen.save()
+        
+        citizen.is_enrolled = True
+        citizen.save()
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 1)
+    
+    def test_enroll_then_save_keeps_counter(self):
+        """Сохранение после Citizen.enroll не занимает второе место"""
+        self.citizens[0].enroll(self.king)
+        self.citizens[0].save()
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 1)
+    
+    def test_clean_respects_limit(self):
+        """Зачисление через админку сверх лимита отклоняется валидацией"""
+        from django.core.exceptions import ValidationError
+        
+        self.citizens[0].enroll(self.king)
+        self.citizens[1].enroll(self.king)
+        citizen = self.citizens[2]
+        citizen.is_enrolled = True
+        citizen.king = self.king
+        
+        with self.assertRaises(ValidationError):
+            citizen.full_clean()
+        self.citizens[0].full_clean()
+    
+    def test_rebuild_command_fixes_drift(self):
+        """Команда пересчета восстанавливает счетчик"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        Citizen.objects.filter(pk=self.citizens[0].pk).update(is_enrolled=True, king=self.king)
+        
+        out = StringIO()
+        call_command('rebuild_citizens_count', '--dry-run', stdout=out)
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 0)
+        
+        call_command('rebuild_citizens_count', stdout=out)
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class EnrollmentConcurrencyTest(TransactionTestCase):
+    """Тесты одновременного зачисления подданных"""
+    
+    def setUp(self):
+        kingdom = Kingdom.objects.create(name='Test Kingdom')
+        king_user = User.objects.create_user(
+            username='kinguser',
+            password='testpass123',
+            first_name='Test',
+            last_name='King',
+            role='king'
+        )
+        self.king = King.objects.create(user=king_user, kingdom=kingdom, max_citizens=3)
+        self.citizens = []
+        for i in range(8):
+            user = User.objects.create_user(
+                username=f'citizen{i}',
+                email=f'citizen{i}@example.com',
+                first_name='Citizen',
+                last_name=str(i),
+                role='citizen'
+            )
+            self.citizens.append(Citizen.objects.create(
+                user=user,
+                kingdom=kingdom,
+                age=20,
+                pigeon_email=f'citizen{i}@example.com'
+            ))
+    
+    def test_parallel_enrollment_never_exceeds_limit(self):
+        """Параллельные зачисления не превышают max_citizens"""
+        import threading
+        from django.db import connection
+        
+        barrier = threading.Barrier(len(self.citizens))
+        enrolled = []
+        
+        def enroll(citizen_id):
+            try:
+                citizen = Citizen.objects.get(pk=citizen_id)
+                king = King.objects.select_related('user').get(pk=self.king.pk)
+                barrier.wait()
+                try:
+                    citizen.enroll(king)
+                    enrolled.append(citizen_id)
+                except ValueError:
+                    pass
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=enroll, args=(c.pk,)) for c in self.citizens]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.king.refresh_from_db()
+        self.assertEqual(len(enrolled), 3)
+        self.assertEqual(self.king.citizens_count, 3)
+        self.assertEqual(Citizen.objects.filter(king=self.king, is_enrolled=True).count(), 3)
+
+
+class TestDefinitionCacheTest(TestCase):
+    """Тесты кэша определений тестовых испытаний"""
+    
+    def setUp(self):
+        from kingdom.cache import clear_local_cache
+        
+        clear_local_cache()
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.test = Test.objects.create(kingdom=self.kingdom, title='Test Title')
+        self.questions = [
+            Question.objects.create(test=self.test, text=f'Question {i}?', correct_answer=i % 2 == 0, order=i)
+            for i in range(3)
+        ]
+    
+    def test_definition_contents(self):
+        """Определение содержит вопросы по порядку и правильные ответы"""
+        from kingdom.cache import get_test_definition
+        
+        definition = get_test_definition(self.kingdom.id)
+        
+        self.assertEqual(definition.test_id, self.test.id)
+        self.assertEqual(definition.questions_count, 3)
+        self.assertEqual([q.id for q in definition.questions], [q.id for q in self.questions])
+        self.assertTrue(definition.question(str(self.questions[0].id)).correct_answer)
+        self.assertIsNone(definition.question('not-a-uuid'))
+    
+    def test_repeated_reads_hit_no_database(self):
+        """Повторное чтение не обращается к базе данных ни в одном из уровней"""
+        from kingdom.cache import get_test_definition, clear_local_cache
+        
+        get_test_definition(self.kingdom.id)
+        with self.assertNumQueries(0):
+            get_test_definition(self.kingdom.id)
+        
+        clear_local_cache()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_test_definition(self.kingdom.id).questions_count, 3)
+    
+    def test_cache_unavailable(self):
+        """При ошибке кэша Django определение читается из базы"""
+        from unittest.mock import Mock, patch
+        from kingdom.cache import get_test_definition, invalidate_test_definition
+        
+        error = ConnectionError('Redis недоступен')
+        broken = Mock(**{f'{method}.side_effect': error for method in ('get', 'set', 'add', 'incr')})
+        with patch('kingdom.cache._cache', return_value=broken), self.assertLogs('kingdom', 'WARNING'):
+            with self.assertNumQueries(2):
+                definition = get_test_definition(self.kingdom.id)
+            invalidate_test_definition(self.kingdom.id)
+        
+        self.assertEqual([q.id for q in definition.questions], [q.id for q in self.questions])
+    
+    def test_missing_test_is_cached(self):
+        """Отсутствие теста у королевства тоже кэшируется"""
+        from kingdom.cache import get_test_definition
+        
+        other = Kingdom.objects.create(name='Other Kingdom')
+        self.assertIsNone(get_test_definition(other.id))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_test_definition(other.id))
+        
+        Test.objects.create(kingdom=other, title='New Test')
+        self.assertEqual(get_test_definition(other.id).title, 'New Test')
+    
+    def test_question_changes_invalidate(self):
+        """Изменение, добавление и удаление вопросов сбрасывают кэш"""
+        from kingdom.cache import get_test_definition
+        
+        get_test_definition(self.kingdom.id)
+        
+        self.questions[0].correct_answer = False
+        self.questions[0].save()
+        self.assertFalse(get_test_definition(self.kingdom.id).question(self.questions[0].id).correct_answer)
+        
+        Question.objects.create(test=self.test, text='Extra?', correct_answer=True, order=10)
+        self.assertEqual(get_test_definition(self.kingdom.id).questions_count, 4)
+        
+        self.questions[1].delete()
+        self.assertIsNone(get_test_definition(self.kingdom.id).question(self.questions[1].id))
+    
+    def test_test_changes_invalidate(self):
+        """Изменение и удаление теста сбрасывают кэш"""
+        from kingdom.cache import get_test_definition
+        
+        get_test_definition(self.kingdom.id)
+        
+        self.test.title = 'Renamed'
+        self.test.save()
+        self.assertEqual(get_test_definition(self.kingdom.id).title, 'Renamed')
+        
+        self.test.delete()
+        self.assertIsNone(get_test_definition(self.kingdom.id))
+    
+    def test_grading_reads_no_question_data(self):
+        """Ответ на вопрос не читает вопросы из базы данных"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        user = User.objects.create_user(
+            username='citizenuser',
+            email='citizen@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='Citizen',
+            role='citizen'
+        )
+        citizen = Citizen.objects.create(user=user, kingdom=self.kingdom, age=25, pigeon_email='citizen@example.com')
+        attempt = TestAttempt.objects.create(citizen=citizen, test=self.test, total_questions=3)
+        client = Client()
+        client.force_login(user)
+        client.get(reverse('kingdom:test'))
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.post(
+                reverse('kingdom:answer_question', args=[self.questions[0].id]),
+                {'answer': 'true'}
+            )
+            client.get(reverse('kingdom:test'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_correct'])
+        question_reads = [q['sql'] for q in ctx.captured_queries if 'FROM "questions"' in q['sql']]
+        self.assertEqual(question_reads, [])
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.score, 1)
+
+
+class RequestProfileTest(APITestCase):
+    """Тесты для профиля пользователя в рамках запроса"""
+    
+    def setUp(self):
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.test = Test.objects.create(kingdom=self.kingdom, title='Test')
+        self.king_user = User.objects.create_user(
+            username='kinguser',
+            email='king@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='King',
+            role='king'
+        )
+        self.king = King.objects.create(user=self.king_user, kingdom=self.kingdom)
+        self.user = User.objects.create_user(
+            username='citizenuser',
+            email='citizen@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='Citizen',
+            role='citizen'
+        )
+        self.citizen = Citizen.objects.create(
+            user=self.user,
+            kingdom=self.kingdom,
+            age=25,
+            pigeon_email='citizen@example.com',
+            king=self.king,
+            is_enrolled=True
+        )
+    
+    def test_profile_loaded_in_one_query(self):
+        """Тест загрузки профиля, королевства и теста одним запросом"""
+        from kingdom.profiles import RequestProfile
+        
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            profile = RequestProfile(user)
+        with self.assertNumQueries(0):
+            self.assertEqual(profile.citizen, self.citizen)
+            self.assertEqual(user.citizen_profile.kingdom.test, self.test)
+            self.assertEqual(profile.kingdom, self.kingdom)
+            self.assertEqual(profile.test, self.test)
+            self.assertEqual(profile.citizen.king.user.email, 'king@example.com')
+    
+    def test_missing_profile(self):
+        """Тест пользователя без профиля роли"""
+        from kingdom.profiles import RequestProfile
+        
+        user = User.objects.create_user(
+            username='noprofile',
+            email='noprofile@example.com',
+            password='testpass123',
+            first_name='No',
+            last_name='Profile',
+            role='king'
+        )
+        profile = RequestProfile(user)
+        with self.assertNumQueries(0):
+            self.assertIsNone(profile.kingdom)
+            self.assertIsNone(profile.test)
+            with self.assertRaises(King.DoesNotExist):
+                profile.king
+    
+    def test_jwt_request_uses_profile(self):
+        """Тест профиля при аутентификации по JWT"""
+        refresh = RefreshToken.for_user(self.king_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        
+        response = self.client.get('/api/kingdom/citizens/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['user_name'] for c in response.data['results']], ['Test Citizen'])
+    
+    def test_session_dashboard(self):
+        """Тест панели подданного с профилем из запроса"""
+        client = Client()
+        client.force_login(self.user)
+        
+        response = client.get(reverse('kingdom:citizen_dashboard'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['citizen'], self.citizen)
+        self.assertEqual(response.context['king'], self.king)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SerializerQueryPlanTest(APITestCase):
+    """Тесты фиксированного числа запросов для списков API при разных размерах страницы"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.test = Test.objects.create(kingdom=self.kingdom, title='Test')
+        self.questions = [
+            Question.objects.create(test=self.test, text=f'Question {i}', correct_answer=True, order=i)
+            for i in range(3)
+        ]
+        self.king_user = User.objects.create_user(
+            username='kinguser',
+            email='king@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='King',
+            role='king'
+        )
+        self.king = King.objects.create(user=self.king_user, kingdom=self.kingdom, max_citizens=100)
+        self.citizens_created = 0
+        refresh = RefreshToken.for_user(self.king_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+    
+    def grow_to(self, size):
+        """Добавляет подданных с попытками и ответами до size"""
+        while self.citizens_created < size:
+            index = self.citizens_created
+            user = User.objects.create_user(
+                username=f'citizen{index}',
+                email=f'citizen{index}@example.com',
+                password='testpass123',
+                first_name='Citizen',
+                last_name=str(index),
+                role='citizen'
+            )
+            citizen = Citizen.objects.create(
+                user=user,
+                kingdom=self.kingdom,
+                age=20,
+                pigeon_email=f'citizen{index}@example.com',
+                king=self.king if index % 2 else None,
+                is_enrolled=bool(index % 2)
+            )
+            attempt = TestAttempt.objects.create(citizen=citizen, test=self.test, total_questions=3)
+            for question in self.questions:
+                Answer.objects.create(attempt=attempt, question=question, answer=True)
+            self.citizens_created += 1
+    
+    def assertListQueries(self, url, num, sizes=(1, 5, 20)):
+        # Прогрев кэша пользователя JWT и определения теста
+        self.client.get(url)
+        for size in sizes:
+            self.grow_to(size)
+            with self.subTest(size=size), self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], size)
+    
+    def test_citizens_list(self):
+        """Тест списка подданных: профиль, count и страница"""
+        self.assertListQueries('/api/kingdom/citizens/', 3)
+        
+        response = self.client.get('/api/kingdom/citizens/')
+        names = {citizen['user_name']: citizen.get('king_name') for citizen in response.data['results']}
+        self.assertEqual(names['Citizen 1'], 'Test King')
+        self.assertIsNone(names['Citizen 0'])
+    
+    def test_attempts_list(self):
+        """Тест списка попыток: профиль, count, страница и ответы с вопросами"""
+        self.assertListQueries('/api/kingdom/test-attempts/', 4)
+        
+        response = self.client.get('/api/kingdom/test-attempts/')
+        attempt = response.data['results'][0]
+        self.assertEqual(attempt['test_title'], 'Test')
+        self.assertEqual(
+            sorted(answer['question_text'] for answer in attempt['answers']),
+            ['Question 0', 'Question 1', 'Question 2']
+        )
+    
+    def test_kings_and_tests_lists(self):
+        """Тест списков королей (count и страница) и тестов (профиль, count и страница)"""
+        self.client.get('/api/kingdom/kings/')
+        self.client.get('/api/kingdom/tests/')
+        self.grow_to(5)
+        
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/kingdom/kings/')
+        self.king.refresh_from_db()
+        self.assertEqual(response.data['results'][0]['current_citizens_count'], self.king.citizens_count)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/kingdom/tests/')
+        self.assertEqual(response.data['results'][0]['questions_count'], 3)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class CandidateRankingTest(APITestCase):
+    """Тесты рейтинга кандидатов королевства"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.test = Test.objects.create(kingdom=self.kingdom, title='Test')
+        self.questions = [
+            Question.objects.create(test=self.test, text=f'Question {i}', correct_answer=True, order=i)
+            for i in range(4)
+        ]
+        self.king_user = User.objects.create_user(
+            username='kinguser',
+            email='king@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='King',
+            role='king'
+        )
+        self.king = King.objects.create(user=self.king_user, kingdom=self.kingdom, max_citizens=10)
+        self.citizens = []
+        for index in range(3):
+            user = User.objects.create_user(
+                username=f'citizen{index}',
+                email=f'citizen{index}@example.com',
+                password='testpass123',
+                first_name='Citizen',
+                last_name=str(index),
+                role='citizen'
+            )
+            self.citizens.append(Citizen.objects.create(
+                user=user,
+                kingdom=self.kingdom,
+                age=20,
+                pigeon_email=f'citizen{index}@example.com'
+            ))
+    
+    def complete_attempt(self, citizen, correct):
+        """Завершение попытки с заданным количеством правильных ответов"""
+        from kingdom.answers import record_answers
+        from kingdom.cache import get_test_definition
+        
+        attempt = TestAttempt.objects.create(citizen=citizen, test=self.test, total_questions=len(self.questions))
+        record_answers(attempt, get_test_definition(self.kingdom.id), {
+            question.id: index < correct for index, question in enumerate(self.questions)
+        })
+        return attempt
+    
+    def ranked(self, **kwargs):
+        from kingdom.rankings import top_candidates
+        return [ranking.citizen_id for ranking in top_candidates(self.kingdom, **kwargs)]
+    
+    def test_ranking_keeps_best_attempt(self):
+        """Рейтинг хранит лучшую попытку и упорядочен по проценту"""
+        best = self.complete_attempt(self.citizens[0], 3)
+        self.complete_attempt(self.citizens[0], 1)
+        self.complete_attempt(self.citizens[1], 4)
+        self.complete_attempt(self.citizens[2], 2)
+        
+        ranking = CandidateRanking.objects.get(citizen=self.citizens[0])
+        self.assertEqual((ranking.attempt_id, ranking.best_score, ranking.percentage), (best.id, 3, 75.0))
+        self.assertEqual(self.ranked(), [self.citizens[1].id, self.citizens[0].id, self.citizens[2].id])
+        self.assertEqual(self.ranked(limit=1), [self.citizens[1].id])
+    
+    def test_enrollment_and_deletion_update_ranking(self):
+        """Зачисление исключает подданного из кандидатов, удаление попытки пересчитывает рейтинг"""
+        self.complete_attempt(self.citizens[0], 4)
+        attempt = self.complete_attempt(self.citizens[1], 2)
+        
+        self.citizens[0].enroll(self.king)
+        self.assertEqual(self.ranked(), [self.citizens[1].id])
+        self.assertEqual(self.ranked(include_enrolled=True), [self.citizens[0].id, self.citizens[1].id])
+        
+        attempt.delete()
+        self.assertFalse(CandidateRanking.objects.filter(citizen=self.citizens[1]).exists())
+    
+    def test_rebuild_matches_incremental(self):
+        """Полный пересчет совпадает с инкрементальным обновлением"""
+        from kingdom.rankings import rebuild_rankings
+        
+        self.complete_attempt(self.citizens[0], 1)
+        self.complete_attempt(self.citizens[1], 3)
+        self.complete_attempt(self.citizens[1], 2)
+        expected = list(CandidateRanking.objects.values_list('citizen_id', 'attempt_id', 'best_score', 'percentage'))
+        
+        CandidateRanking.objects.all().delete()
+        self.assertEqual(rebuild_rankings(self.kingdom), 2)
+        self.assertEqual(
+            list(CandidateRanking.objects.values_list('citizen_id', 'attempt_id', 'best_score', 'percentage')),
+            expected
+        )
+    
+    def test_leaderboard_api(self):
+        """API рейтинга доступно королю и загружается фиксированным числом запросов"""
+        self.complete_attempt(self.citizens[0], 2)
+        self.complete_attempt(self.citizens[1], 4)
+        refresh = RefreshToken.for_user(self.king_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.client.get('/api/kingdom/leaderboard/')
+        
+        # Профиль короля и топ рейтинга
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/kingdom/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['rank'], row['citizen_name'], row['percentage']) for row in response.data['results']],
+            [(1, 'Citizen 1', 100.0), (2, 'Citizen 0', 50.0)]
+        )
+        
+        response = self.client.get('/api/kingdom/leaderboard/', {'limit': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        refresh = RefreshToken.for_user(self.citizens[0].user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        response = self.client.get('/api/kingdom/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(
+    REQUEST_SERVER_TIMING=True,
+    REQUEST_INSTRUMENTATION_SAMPLE_RATE=0,
+    REQUEST_SLOW_THRESHOLD_MS=60 * 1000,
+    REQUEST_NPLUSONE_THRESHOLD=5
+)
+class RequestInstrumentationTest(APITestCase):
+    """Тесты инструментирования запросов и заголовка Server-Timing"""
+    
+    def setUp(self):
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.user = User.objects.create_user(
+            username='kinguser',
+            email='king@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='King',
+            role='king'
+        )
+        King.objects.create(user=self.user, kingdom=self.kingdom)
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+    
+    def metrics(self, response):
+        return {
+            metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')
+        }
+    
+    def test_server_timing(self):
+        """Тест заголовка Server-Timing с количеством SQL и записью журнала"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/users/auth/logout/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = self.metrics(response)
+        self.assertIn('total', metrics)
+        self.assertIn(f'desc="{len(queries)} SQL"', metrics['db'])
+        self.assertIn('actionlog', metrics)
+    
+    @override_settings(REQUEST_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        """Тест отключения заголовка"""
+        response = self.client.get('/api/kingdom/citizens/')
+        self.assertNotIn('Server-Timing', response)
+    
+    def test_not_sampled(self):
+        """Тест обычного запроса без записи в лог при нулевой доле"""
+        with self.assertNoLogs('hart_citizens_project.instrumentation'):
+            self.client.get('/api/kingdom/citizens/')
+    
+    @override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_sampled(self):
+        """Тест структурированной записи выбранного запроса"""
+        with self.assertLogs('hart_citizens_project.instrumentation', 'INFO') as logs:
+            self.client.get('/api/kingdom/citizens/')
+        
+        record = logs.records[0].request_stats
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(record['path'], '/api/kingdom/citizens/')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['user_id'], str(self.user.pk))
+        self.assertEqual(record['duplicates'], 0)
+        self.assertNotIn('slowest', record)
+    
+    @override_settings(REQUEST_SERVER_TIMING=False, REQUEST_SLOW_THRESHOLD_MS=0)
+    def test_not_sampled_without_params(self):
+        """Тест запроса вне выборки: параметры SQL для подсчета повторов не учитываются"""
+        with self.assertLogs('hart_citizens_project.instrumentation', 'WARNING') as logs:
+            self.client.get('/api/kingdom/citizens/')
+        
+        record = logs.records[0].request_stats
+        self.assertGreater(record['queries'], 0)
+        self.assertNotIn('duplicates', record)
+    
+    @override_settings(REQUEST_SLOW_THRESHOLD_MS=0)
+    def test_slow_request_logged_with_sql(self):
+        """Тест лога медленного запроса с самыми долгими SQL"""
+        with self.assertLogs('hart_citizens_project.instrumentation', 'WARNING') as logs:
+            self.client.get('/api/kingdom/citizens/')
+        
+        record = logs.records[0].request_stats
+        self.assertTrue(record['slow'])
+        self.assertTrue(record['slowest'])
+        self.assertTrue(all('SELECT' in query['sql'] for query in record['slowest']))
+    
+    def test_duplicates_and_nplusone(self):
+        """Тест обнаружения повторов и шаблонов N+1"""
+        from hart_citizens_project.instrumentation import RequestStats
+        
+        stats = RequestStats()
+        for pk in range(6):
+            stats.add_query('SELECT * FROM "citizens" WHERE "id" = %s', (pk,), 1.0)
+        stats.add_query('SELECT 1', None, 0.5)
+        stats.add_query('SELECT 1', None, 0.5)
+        stats.finish()
+        
+        self.assertEqual(stats.queries, 8)
+        self.assertEqual(stats.duplicates, 1)
+        self.assertEqual(
+            stats.repeated(5),
+            [{'sql': 'SELECT * FROM "citizens" WHERE "id" = %s', 'count': 6, 'ms': 6.0}]
+        )
+        self.assertEqual(stats.repeated(10), [])
+        self.assertIn('dup;desc="1"', stats.server_timing(stats.repeated(5)))
+        self.assertIn('nplusone;desc="1"', stats.server_timing(stats.repeated(5)))
+        
+        stats = RequestStats(patterns=False, params=False)
+        for pk in range(6):
+            stats.add_query('SELECT * FROM "citizens" WHERE "id" = %s', (pk,), 1.0)
+        stats.finish()
+        self.assertEqual(stats.queries, 6)
+        self.assertIsNone(stats.duplicates)
+        self.assertEqual(stats.repeated(5), [])
+        self.assertEqual(stats.repeated(0), [])
+
+
+class BulkEnrollmentTest(APITestCase):
+    """Тесты пакетного зачисления подданных"""
+    
+    def setUp(self):
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.test = Test.objects.create(kingdom=self.kingdom, title='Test')
+        self.questions = [
+            Question.objects.create(test=self.test, text=f'Question {i}', correct_answer=True, order=i)
+            for i in range(4)
+        ]
+        self.king_user = User.objects.create_user(
+            username='kinguser',
+            email='king@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='King',
+            role='king'
+        )
+        self.king = King.objects.create(user=self.king_user, kingdom=self.kingdom, max_citizens=2)
+        self.citizens = [self.create_citizen(self.kingdom, index) for index in range(4)]
+        refresh = RefreshToken.for_user(self.king_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+    
+    def create_citizen(self, kingdom, index):
+        user = User.objects.create_user(
+            username=f'citizen{index}',
+            email=f'citizen{index}@example.com',
+            password='testpass123',
+            first_name='Citizen',
+            last_name=str(index),
+            role='citizen'
+        )
+        return Citizen.objects.create(
+            user=user,
+            kingdom=kingdom,
+            age=20,
+            pigeon_email=f'pigeon{index}@example.com'
+        )
+    
+    def complete_attempt(self, citizen, correct):
+        """Завершение попытки с заданным количеством правильных ответов"""
+        from kingdom.answers import record_answers
+        from kingdom.cache import get_test_definition
+        
+        attempt = TestAttempt.objects.create(citizen=citizen, test=self.test, total_questions=len(self.questions))
+        record_answers(attempt, get_test_definition(self.kingdom.id), {
+            question.id: index < correct for index, question in enumerate(self.questions)
+        })
+    
+    def enroll(self, citizens):
+        return self.client.post(
+            '/api/kingdom/citizens/enroll/',
+            {'citizen_ids': [str(citizen.pk) for citizen in citizens]},
+            format='json'
+        )
+    
+    def test_enrolls_best_within_capacity(self):
+        """Тест зачисления лучших по рейтингу в пределах свободных мест"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from kingdom.enrollment import NO_CAPACITY, NO_COMPLETED_TEST
+        
+        for citizen, correct in zip(self.citizens[:3], (1, 4, 3)):
+            self.complete_attempt(citizen, correct)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.enroll(self.citizens)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in response.data['enrolled']],
+            [str(self.citizens[1].pk), str(self.citizens[2].pk)]
+        )
+        self.assertEqual(
+            {item['citizen_id']: item['reason'] for item in response.data['rejected']},
+            {str(self.citizens[0].pk): NO_CAPACITY, str(self.citizens[3].pk): NO_COMPLETED_TEST}
+        )
+        self.assertEqual(response.data['citizens_count'], 2)
+        
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 2)
+        self.assertEqual(
+            set(Citizen.objects.filter(is_enrolled=True, king=self.king).values_list('id', flat=True)),
+            {self.citizens[1].pk, self.citizens[2].pk}
+        )
+        self.assertEqual(CandidateRanking.objects.filter(is_enrolled=True).count(), 2)
+        self.assertEqual(ActionLog.objects.filter(action='enrollment', kingdom=self.kingdom).count(), 2)
+        
+        # Логи записаны одним INSERT
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "action_logs"')]
+        self.assertEqual(len(inserts), 1)
+    
+    def test_query_count_independent_of_batch(self):
+        """Тест фиксированного числа запросов при росте пакета"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        King.objects.filter(pk=self.king.pk).update(max_citizens=10)
+        citizens = self.citizens + [self.create_citizen(self.kingdom, index) for index in range(4, 8)]
+        for citizen in citizens:
+            self.complete_attempt(citizen, 2)
+        # Прогрев кэша пользователя JWT-аутентификации
+        self.client.get('/api/kingdom/citizens/')
+        
+        with CaptureQueriesContext(connection) as small:
+            self.enroll(citizens[:2])
+        with CaptureQueriesContext(connection) as large:
+            response = self.enroll(citizens[2:])
+        
+        self.assertEqual(len(response.data['enrolled']), 6)
+        self.assertEqual(len(small), len(large))
+    
+    def test_rejections(self):
+        """Тест отказов: чужое королевство, уже зачислен, не найден"""
+        from uuid import uuid4
+        from kingdom.enrollment import ALREADY_ENROLLED, NOT_FOUND, WRONG_KINGDOM
+        
+        other = self.create_citizen(Kingdom.objects.create(name='Other Kingdom'), 10)
+        self.complete_attempt(self.citizens[0], 4)
+        self.citizens[0].enroll(self.king)
+        missing = uuid4()
+        
+        response = self.client.post(
+            '/api/kingdom/citizens/enroll/',
+            {'citizen_ids': [str(other.pk), str(self.citizens[0].pk), str(missing)]},
+            format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['enrolled'], [])
+        self.assertEqual(
+            {item['citizen_id']: item['reason'] for item in response.data['rejected']},
+            {str(other.pk): WRONG_KINGDOM, str(self.citizens[0].pk): ALREADY_ENROLLED, str(missing): NOT_FOUND}
+        )
+        self.king.refresh_from_db()
+        self.assertEqual(self.king.citizens_count, 1)
+    
+    def test_empty_test_attempt_is_eligible(self):
+        """Тест зачисления подданного с завершенной попыткой теста без вопросов, как и одиночным API"""
+        attempt = TestAttempt.objects.create(citizen=self.citizens[3], test=self.test, total_questions=0)
+        TestAttempt.objects.filter(pk=attempt.pk).update(status='completed', completed_at=timezone.now())
+        self.complete_attempt(self.citizens[0], 2)
+        
+        response = self.enroll([self.citizens[3], self.citizens[0]])
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in response.data['enrolled']],
+            [str(self.citizens[0].pk), str(self.citizens[3].pk)]
+        )
+        self.assertFalse(CandidateRanking.objects.filter(citizen=self.citizens[3]).exists())
+    
+    def test_king_profile_missing(self):
+        """Тест 404 для пользователя с ролью короля без профиля короля"""
+        self.king.delete()
+        
+        response = self.enroll(self.citizens[:1])
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Citizen.objects.filter(is_enrolled=True).exists())
+    
+    def test_notifications_enqueued(self):
+        """Тест постановки уведомлений в очередь в транзакции зачисления"""
+        from django.core import mail
+        from kingdom.models import OutboxMessage
+        from kingdom.notifications import drain_outbox
+        
+        for citizen in self.citizens[:2]:
+            self.complete_attempt(citizen, 4)
+        
+        self.enroll(self.citizens[:2])
+        
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(
+            sorted(OutboxMessage.objects.filter(kind='enrollment').values_list('recipient', flat=True)),
+            ['pigeon0@example.com', 'pigeon1@example.com']
+        )
+        self.assertEqual(drain_outbox()['sent'], 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['pigeon0@example.com', 'pigeon1@example.com'])
+    
+    def test_validation(self):
+        """Тест проверки прав и размера пакета"""
+        from kingdom.enrollment import MAX_BATCH_SIZE
+        
+        response = self.client.post('/api/kingdom/citizens/enroll/', {'citizen_ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.post(
+            '/api/kingdom/citizens/enroll/',
+            {'citizen_ids': [str(self.citizens[0].pk)] * (MAX_BATCH_SIZE + 1)},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        refresh = RefreshToken.for_user(self.citizens[0].user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        response = self.enroll(self.citizens)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class NotificationRenderingTest(TestCase):
+    """Тесты рендеринга уведомлений по шаблонам"""
+    
+    def test_render(self):
+        """Тест темы, текстовой и HTML версий письма"""
+        from kingdom import rendering
+        
+        rendered = rendering.render(
+            'test_completion', test_title='Test', score=3, total_questions=4, percentage=75.0
+        )
+        
+        self.assertEqual(rendered.subject, 'Результаты тестирования: Test')
+        self.assertIn('3 из 4 (75.0%)', rendered.body)
+        self.assertNotIn('<', rendered.body)
+        self.assertIn('<strong>"Test"</strong>', rendered.html_body)
+    
+    def test_escaping(self):
+        """Тест экранирования HTML версии и неизменности текстовой"""
+        from kingdom import rendering
+        
+        rendered = rendering.render('enrollment', king_name='<b>King</b>', kingdom_name='A & B')
+        
+        self.assertIn('&lt;b&gt;King&lt;/b&gt;', rendered.html_body)
+        self.assertIn('A &amp; B', rendered.html_body)
+        self.assertIn('король <b>King</b>', rendered.body)
+        self.assertEqual(rendered.subject, 'Поздравляем! Вы зачислены в королевство A & B')
+    
+    def test_missing_variable(self):
+        """Тест ошибки при отсутствующей переменной шаблона"""
+        from jinja2 import UndefinedError
+        from kingdom import rendering
+        
+        with self.assertRaises(UndefinedError):
+            rendering.render('enrollment', king_name='Test King')
+        with self.assertRaises(ValueError):
+            rendering.render('unknown')
+    
+    def test_templates_compiled_once(self):
+        """Тест однократной компиляции шаблонов"""
+        from kingdom import rendering
+        
+        template = rendering.get_notification_template('enrollment')
+        
+        self.assertIs(rendering.get_notification_template('enrollment'), template)
+        self.assertIs(rendering.get_environment(), rendering.get_environment())
+    
+    def test_render_batch(self):
+        """Тест однократного рендеринга одинаковых контекстов пачки"""
+        from unittest.mock import patch
+        from kingdom import rendering
+        
+        template = rendering.get_notification_template('enrollment')
+        contexts = [
+            {'king_name': 'King A', 'kingdom_name': 'Kingdom'},
+            {'king_name': 'King B', 'kingdom_name': 'Kingdom'},
+            {'kingdom_name': 'Kingdom', 'king_name': 'King A'},
+        ]
+        
+        with patch.object(template, 'render', wraps=template.render) as render:
+            rendered = rendering.render_batch('enrollment', contexts)
+        
+        self.assertEqual(render.call_count, 2)
+        self.assertIs(rendered[0], rendered[2])
+        self.assertIn('King B', rendered[1].body)
+    
+    def test_enrollment_messages(self):
+        """Тест уведомлений о зачислении для когорты"""
+        from kingdom.notifications import enrollment_message, enrollment_messages
+        
+        messages = enrollment_messages(
+            [('a@example.com', 'enrollment:a'), ('b@example.com', 'enrollment:b')], 'Test King', 'Test Kingdom'
+        )
+        single = enrollment_message('a@example.com', 'Test King', 'Test Kingdom', dedup_key='enrollment:a')
+        
+        self.assertEqual([message.recipient for message in messages], ['a@example.com', 'b@example.com'])
+        self.assertEqual([message.dedup_key for message in messages], ['enrollment:a', 'enrollment:b'])
+        self.assertEqual(messages[0].body, single.body)
+        self.assertEqual(messages[0].html_body, single.html_body)
+
+
+class NotificationOutboxTest(TestCase):
+    """Тесты очереди уведомлений"""
+    
+    enrolled_at = timezone.now()
+    
+    def enqueue(self, count, prefix='citizen'):
+        from kingdom.notifications import enqueue, enrollment_key, enrollment_message
+        return enqueue(
+            enrollment_message(
+                f'{prefix}{index}@example.com', 'Test King', 'Test Kingdom',
+                enrollment_key(f'{prefix}{index}', self.enrolled_at)
+            )
+            for index in range(count)
+        )
+    
+    def test_deduplication(self):
+        """Тест игнорирования повторной постановки уведомления о том же событии"""
+        from datetime import timedelta
+        from kingdom.models import OutboxMessage
+        from kingdom.tasks import send_enrollment_notification
+        
+        self.enqueue(3)
+        self.enqueue(3)
+        send_enrollment_notification(
+            'citizen0@example.com', 'Test King', 'Test Kingdom', 'citizen0', self.enrolled_at.isoformat()
+        )
+        self.assertEqual(OutboxMessage.objects.count(), 3)
+        
+        # Повторное зачисление с тем же текстом письма - новое событие
+        send_enrollment_notification(
+            'citizen0@example.com', 'Test King', 'Test Kingdom', 'citizen0',
+            (self.enrolled_at + timedelta(days=1)).isoformat()
+        )
+        self.assertEqual(OutboxMessage.objects.filter(recipient='citizen0@example.com').count(), 2)
+    
+    def test_test_completion_per_attempt(self):
+        """Тест уведомлений о повторном прохождении теста с тем же результатом"""
+        from uuid import uuid4
+        from kingdom.models import OutboxMessage
+        from kingdom.tasks import send_test_completion_notification
+        
+        first, second = uuid4(), uuid4()
+        for attempt_id in (first, first, second):
+            send_test_completion_notification('citizen@example.com', 'Test', 3, 4, str(attempt_id))
+        
+        self.assertEqual(
+            set(OutboxMessage.objects.values_list('dedup_key', flat=True)),
+            {f'test_completion:{first}', f'test_completion:{second}'}
+        )
+    
+    def test_test_completion_without_questions(self):
+        """Тест уведомления о результатах теста без вопросов"""
+        from kingdom.notifications import test_completion_message
+        
+        message = test_completion_message('citizen@example.com', 'Test', 0, 0, 'test_completion:empty')
+        
+        self.assertIn('0 из 0 (0%)', message.body)
+    
+    def test_dedup_key_required(self):
+        """Тест отказа в уведомлении без ключа события"""
+        from kingdom.notifications import enrollment_message
+        
+        with self.assertRaises(ValueError):
+            enrollment_message('citizen@example.com', 'Test King', 'Test Kingdom', '')
+    
+    def test_purge(self):
+        """Тест удаления отправленных писем и писем с ошибкой старше срока хранения"""
+        from datetime import timedelta
+        from kingdom.models import OutboxMessage
+        from kingdom.notifications import purge_outbox
+        from kingdom.tasks import purge_notification_outbox
+        
+        self.enqueue(5)
+        keys = list(OutboxMessage.objects.order_by('recipient').values_list('pk', flat=True))
+        old = timezone.now() - timedelta(days=31)
+        OutboxMessage.objects.filter(pk__in=keys[:2]).update(status='sent', created_at=old)
+        OutboxMessage.objects.filter(pk=keys[2]).update(status='failed', created_at=old)
+        OutboxMessage.objects.filter(pk=keys[3]).update(created_at=old)
+        OutboxMessage.objects.filter(pk=keys[4]).update(status='sent')
+        
+        self.assertEqual(purge_outbox(retention_days=30, batch_size=2), 3)
+        self.assertEqual(set(OutboxMessage.objects.values_list('pk', flat=True)), set(keys[3:]))
+        self.assertEqual(purge_notification_outbox(), 0)
+    
+    def test_batches_reuse_connection(self):
+        """Тест отправки пачками по одному соединению на пачку"""
+        from unittest.mock import patch
+        from django.core import mail
+        from django.core.mail import get_connection
+        from kingdom.models import OutboxMessage
+        from kingdom.notifications import drain_outbox
+        
+        self.enqueue(25)
+        
+        with patch('kingdom.notifications.get_connection', wraps=get_connection) as connections:
+            metrics = drain_outbox(batch_size=10)
+        
+        self.assertEqual(connections.call_count, 3)
+        self.assertEqual(metrics['batches'], 3)
+        self.assertEqual(metrics['claimed'], 25)
+        self.assertEqual(metrics['sent'], 25)
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertNotIn('<strong>', mail.outbox[0].body)
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+        
+        # Отправленные письма повторно не отправляются
+        self.assertEqual(drain_outbox()['claimed'], 0)
+    
+    def test_max_batches(self):
+        """Тест ограничения количества пачек за запуск"""
+        from kingdom.models import OutboxMessage
+        from kingdom.notifications import drain_outbox
+        
+        self.enqueue(5)
+        
+        self.assertEqual(drain_outbox(batch_size=2, max_batches=2)['sent'], 4)
+        self.assertEqual(OutboxMessage.objects.filter(status='pending').count(), 1)
+    
+    def test_retry_with_backoff(self):
+        """Тест отсрочки после ошибки и отказа после MAX_ATTEMPTS попыток"""
+        from datetime import timedelta
+        from django.core.mail.backends.locmem import EmailBackend
+        from kingdom.models import OutboxMessage
+        from kingdom import notifications
+        
+        class FailingBackend(EmailBackend):
+            def send_messages(self, messages):
+                if any(message.to[0].startswith('bad') for message in messages):
+                    raise ConnectionError('SMTP недоступен')
+                return super().send_messages(messages)
+        
+        self.enqueue(2)
+        self.enqueue(1, prefix='bad')
+        
+        metrics = notifications.drain_outbox(connection=FailingBackend())
+        self.assertEqual((metrics['sent'], metrics['retried'], metrics['failed']), (2, 1, 0))
+        
+        bad = OutboxMessage.objects.get(recipient='bad0@example.com')
+        self.assertEqual(bad.status, 'pending')
+        self.assertEqual(bad.attempts, 1)
+        self.assertEqual(bad.last_error, 'SMTP недоступен')
+        self.assertGreater(bad.next_attempt_at, timezone.now() + timedelta(seconds=notifications.RETRY_DELAY - 5))
+        # До истечения задержки письмо не отправляется
+        self.assertEqual(notifications.drain_outbox(connection=FailingBackend())['claimed'], 0)
+        
+        self.assertEqual(notifications.retry_delay(2), 2 * notifications.retry_delay(1))
+        self.assertEqual(notifications.retry_delay(100).total_seconds(), notifications.RETRY_MAX_DELAY)
+        
+        for attempt in range(2, notifications.MAX_ATTEMPTS + 1):
+            OutboxMessage.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+            metrics = notifications.drain_outbox(connection=FailingBackend())
+        
+        bad.refresh_from_db()
+        self.assertEqual(metrics['failed'], 1)
+        self.assertEqual(bad.status, 'failed')
+        self.assertEqual(bad.attempts, notifications.MAX_ATTEMPTS)
+    
+    def test_connection_error(self):
+        """Тест ошибки открытия соединения: откладывается вся пачка"""
+        from django.core.mail.backends.locmem import EmailBackend
+        from kingdom.models import OutboxMessage
+        from kingdom.notifications import drain_outbox
+        
+        class BrokenBackend(EmailBackend):
+            def open(self):
+                raise ConnectionRefusedError('Нет соединения')
+        
+        self.enqueue(3)
+        
+        metrics = drain_outbox(connection=BrokenBackend())
+        
+        self.assertEqual(metrics['retried'], 3)
+        self.assertEqual(OutboxMessage.objects.filter(attempts=1, last_error='Нет соединения').count(), 3)
+    
+    def test_drain_task(self):
+        """Тест периодической задачи отправки"""
+        from django.core import mail
+        from kingdom.tasks import drain_notification_outbox, send_test_completion_notification
+        
+        send_test_completion_notification('citizen@example.com', 'Test', 3, 4, 'attempt')
+        
+        self.assertEqual(drain_notification_outbox()['sent'], 1)
+        self.assertEqual(mail.outbox[0].subject, 'Результаты тестирования: Test')
+        self.assertIn('3 из 4 (75.0%)', mail.outbox[0].body)
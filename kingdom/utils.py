@@ -3,6 +3,7 @@ from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from action_logs.models import ActionLog
+from action_logs.writer import write_log
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -35,7 +36,7 @@ def log_user_action(user, action, description='', metadata=None, request=None):
             user_agent = request.META.get('HTTP_USER_AGENT', '')
         
         # Создаем запись в логе
-        ActionLog.objects.create(
+        write_log(
             user=user,
             action=action,
             description=description,
@@ -137,13 +138,7 @@ def get_user_activity_logs(user, limit=50):
 
 def get_kingdom_activity_logs(kingdom, limit=100):
     """Получение логов активности по королевству"""
-    return ActionLog.objects.filter(
-        user__citizen_profile__kingdom=kingdom
-    ).union(
-        ActionLog.objects.filter(
-            user__king_profile__kingdom=kingdom
-        )
-    ).order_by('-created_at')[:limit]
+    return ActionLog.objects.filter(kingdom=kingdom).order_by('-created_at', '-id')[:limit]
 
 
 def export_logs_to_excel(logs, filename=None):
@@ -155,57 +150,13 @@ def export_logs_to_excel(logs, filename=None):
         filename: Имя файла (опционально)
     
     Returns:
-        HttpResponse с Excel файлом
+        Ответ с Excel файлом или None при ошибке
     """
     try:
-        import pandas as pd
-        from django.http import HttpResponse
-        
-        # Преобразуем логи в DataFrame
-        data = []
-        for log in logs:
-            data.append({
-                'Дата': log.created_at.strftime('%d.%m.%Y %H:%M:%S'),
-                'Пользователь': log.user.get_full_name(),
-                'Email': log.user.email,
-                'Роль': log.user.get_role_display(),
-                'Действие': log.get_action_display(),
-                'Описание': log.description,
-                'IP адрес': log.ip_address or '',
-                'User Agent': log.user_agent or '',
-                'Метаданные': str(log.metadata) if log.metadata else ''
-            })
-        
-        df = pd.DataFrame(data)
-        
-        # Создаем Excel файл в памяти
-        output = pd.ExcelWriter(filename or 'logs.xlsx', engine='openpyxl')
-        df.to_excel(output, index=False, sheet_name='Логи действий')
-        
-        # Настраиваем ширину колонок
-        worksheet = output.sheets['Логи действий']
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        output.close()
-        
-        # Читаем файл и возвращаем как HttpResponse
-        with open(filename or 'logs.xlsx', 'rb') as f:
-            response = HttpResponse(f.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename="{filename or "logs.xlsx"}"'
-            return response
-            
+        from action_logs.export import xlsx_response
+        return xlsx_response(logs, filename or 'logs.xlsx')
     except ImportError:
-        logger.error('pandas не установлен. Установите: pip install pandas openpyxl')
+        logger.error('openpyxl не установлен. Установите: pip install openpyxl')
         return None
     except Exception as e:
         logger.error(f'Ошибка при экспорте логов: {str(e)}')
@@ -17,7 +17,11 @@ from .models import (
     Kingdom, King, Citizen, Test, Question, 
     TestAttempt, Answer
 )
-from action_logs.models import ActionLog
+from action_logs.writer import write_log
+from .answers import next_question, record_answer
+from .cache import get_test_definition, require_test_definition
+from .candidates import paginate_candidates
+from .rankings import top_candidates
 from .forms import CitizenProfileForm, TestAnswerForm, TestAttemptForm
 from users.models import User
 
@@ -31,26 +35,17 @@ class KingDashboardView(TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        
         try:
-            king = user.king_profile
+            king = self.request.profile.king
             context['king'] = king
             
             # Получаем подданных, прошедших тест, но не зачисленных
-            passed_citizens = Citizen.objects.filter(
-                kingdom=king.kingdom,
-                is_enrolled=False
-            ).select_related('user')
-            
-            # Фильтруем только тех, кто прошел тест
-            enrolled_citizens = []
-            for citizen in passed_citizens:
-                if citizen.test_attempts.filter(status='completed').exists():
-                    enrolled_citizens.append(citizen)
+            candidates_page = paginate_candidates(king.kingdom, self.request.GET.get('page'))
             
-            context['enrolled_citizens'] = enrolled_citizens
-            context['current_citizens'] = king.citizens.all()
+            context['candidates_page'] = candidates_page
+            context['enrolled_citizens'] = candidates_page.object_list
+            context['top_candidates'] = top_candidates(king.kingdom_id)
+            context['current_citizens'] = king.citizens.select_related('user')
             context['can_accept_more'] = king.can_accept_more_citizens
             
         except King.DoesNotExist:
@@ -66,10 +61,8 @@ class CitizenDashboardView(TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        
         try:
-            citizen = user.citizen_profile
+            citizen = self.request.profile.citizen
             context['citizen'] = citizen
             
             # Проверяем статус зачисления
@@ -79,11 +72,11 @@ class CitizenDashboardView(TemplateView):
             
             # Получаем тестовое испытание
             try:
-                test = citizen.kingdom.test
+                test = require_test_definition(citizen.kingdom_id)
                 context['test'] = test
                 
                 # Проверяем, проходил ли уже тест
-                last_attempt = citizen.test_attempts.filter(test=test).order_by('-started_at').first()
+                last_attempt = citizen.test_attempts.filter(test_id=test.test_id).order_by('-started_at').first()
                 if last_attempt:
                     context['last_attempt'] = last_attempt
                     context['has_passed_test'] = last_attempt.status == 'completed'
@@ -107,34 +100,29 @@ class TestView(TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        
         try:
-            citizen = user.citizen_profile
-            test = citizen.kingdom.test
+            citizen = self.request.profile.citizen
+            test = require_test_definition(citizen.kingdom_id)
             
             # Проверяем, есть ли активная попытка
             active_attempt = citizen.test_attempts.filter(
-                test=test,
+                test_id=test.test_id,
                 status='in_progress'
             ).first()
             
             if active_attempt:
                 context['attempt'] = active_attempt
-                # Получаем вопросы, на которые еще не отвечали
-                answered_questions = active_attempt.answers.values_list('question_id', flat=True)
-                remaining_questions = test.questions.exclude(id__in=answered_questions).order_by('order')
-                context['remaining_questions'] = remaining_questions
-                context['current_question'] = remaining_questions.first()
+                # Следующий вопрос определяется по курсору попытки
+                context['current_question'] = next_question(active_attempt, test)['question']
             else:
                 # Создаем новую попытку
                 attempt = TestAttempt.objects.create(
                     citizen=citizen,
-                    test=test,
-                    total_questions=test.questions.count()
+                    test_id=test.test_id,
+                    total_questions=test.questions_count
                 )
                 context['attempt'] = attempt
-                context['current_question'] = test.questions.order_by('order').first()
+                context['current_question'] = test.questions[0] if test.questions else None
             
         except (Citizen.DoesNotExist, Test.DoesNotExist) as e:
             messages.error(self.request, 'Тестовое испытание не найдено.')
@@ -147,12 +135,12 @@ class TestView(TemplateView):
 def start_test(request):
     """Начало тестирования"""
     try:
-        citizen = request.user.citizen_profile
-        test = citizen.kingdom.test
+        citizen = request.profile.citizen
+        test = require_test_definition(citizen.kingdom_id)
         
         # Проверяем, есть ли уже активная попытка
         active_attempt = citizen.test_attempts.filter(
-            test=test,
+            test_id=test.test_id,
             status='in_progress'
         ).first()
         
@@ -162,12 +150,12 @@ def start_test(request):
         # Создаем новую попытку
         attempt = TestAttempt.objects.create(
             citizen=citizen,
-            test=test,
-            total_questions=test.questions.count()
+            test_id=test.test_id,
+            total_questions=test.questions_count
         )
         
         # Логируем начало тестирования
-        ActionLog.objects.create(
+        write_log(
             user=request.user,
             action='test_start',
             description=f'Начало тестирования для {citizen.user.get_full_name()}',
@@ -191,16 +179,17 @@ def answer_question(request, question_id):
         return JsonResponse({'error': 'Метод не разрешен'}, status=405)
     
     try:
-        citizen = request.user.citizen_profile
-        question = get_object_or_404(Question, id=question_id)
+        citizen = request.profile.citizen
+        test = get_test_definition(citizen.kingdom_id)
+        question = test.question(question_id) if test else None
         
         # Проверяем, что вопрос принадлежит тесту королевства подданного
-        if question.test.kingdom != citizen.kingdom:
+        if question is None:
             return JsonResponse({'error': 'Вопрос не принадлежит вашему королевству'}, status=400)
         
         # Получаем активную попытку
         attempt = citizen.test_attempts.filter(
-            test=question.test,
+            test_id=test.test_id,
             status='in_progress'
         ).first()
         
@@ -214,35 +203,15 @@ def answer_question(request, question_id):
         
         answer_value = answer_value.lower() == 'true'
         
-        # Сохраняем ответ
-        answer, created = Answer.objects.get_or_create(
-            attempt=attempt,
-            question=question,
-            defaults={
-                'answer': answer_value,
-                'is_correct': answer_value == question.correct_answer,
-            }
-        )
-        
-        if not created:
-            answer.answer = answer_value
-            answer.is_correct = answer_value == question.correct_answer
-            answer.save()
-        
-        # Обновляем счетчик правильных ответов
-        correct_answers = attempt.answers.filter(is_correct=True).count()
-        attempt.score = correct_answers
-        attempt.save()
+        # Сохраняем ответ и обновляем результат попытки
+        try:
+            is_correct, completed_now = record_answer(attempt, question, answer_value, test)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         
-        # Проверяем, завершен ли тест
-        total_answered = attempt.answers.count()
-        if total_answered >= attempt.total_questions:
-            attempt.status = 'completed'
-            attempt.completed_at = timezone.now()
-            attempt.save()
-            
+        if completed_now:
             # Логируем завершение тестирования
-            ActionLog.objects.create(
+            write_log(
                 user=request.user,
                 action='test_complete',
                 description=f'Завершение тестирования для {citizen.user.get_full_name()}. Результат: {attempt.score}/{attempt.total_questions}',
@@ -255,7 +224,7 @@ def answer_question(request, question_id):
         
         return JsonResponse({
             'success': True,
-            'is_correct': answer.is_correct,
+            'is_correct': is_correct,
             'completed': attempt.status == 'completed',
             'score': attempt.score,
             'total': attempt.total_questions
@@ -274,7 +243,7 @@ def enroll_citizen(request, citizen_id):
         return redirect('kingdom:king_dashboard')
     
     try:
-        king = request.user.king_profile
+        king = request.profile.king
         citizen = get_object_or_404(Citizen, id=citizen_id)
         
         # Проверяем, что подданный принадлежит королевству короля
@@ -292,11 +261,15 @@ def enroll_citizen(request, citizen_id):
             messages.error(request, f'Вы не можете принять больше {king.max_citizens} подданных.')
             return redirect('kingdom:king_dashboard')
         
-        # Зачисляем подданного
-        citizen.enroll(king)
+        # Зачисляем подданного (лимит повторно проверяется атомарно)
+        try:
+            citizen.enroll(king)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('kingdom:king_dashboard')
         
         # Логируем зачисление
-        ActionLog.objects.create(
+        write_log(
             user=request.user,
             action='enrollment',
             description=f'Зачисление подданного {citizen.user.get_full_name()} королем {king.user.get_full_name()}',
@@ -342,7 +315,7 @@ class KingCitizenDetailsView(DetailView):
     def get_queryset(self):
         """Фильтруем подданных только из королевства короля"""
         if self.request.user.is_king:
-            return Citizen.objects.filter(kingdom=self.request.user.king_profile.kingdom)
+            return Citizen.objects.filter(kingdom=self.request.profile.king.kingdom)
         return Citizen.objects.none()
     
     def get_context_data(self, **kwargs):
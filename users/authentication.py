@@ -0,0 +1,207 @@
+"""
+JWT-аутентификация без запроса к таблице пользователей
+
+Токены, выдаваемые API входа и регистрации, содержат claims роли: role,
+kingdom_id, king_id, citizen_id. CachedJWTAuthentication не читает
+пользователя из базы на каждом запросе: поля пользователя и его claims
+хранятся в кэше Django с коротким TTL (JWT_USER_CACHE_TIMEOUT), а объект
+пользователя собирается из них без обращения к таблице users.
+
+Сигналы изменения User, King и Citizen сбрасывают запись кэша. Сброс должен
+доходить до всех процессов, поэтому с кэшем в памяти процесса (LocMemCache)
+пользователь не кэшируется и читается из базы на каждом запросе; при ошибке
+кэша (Redis недоступен) пользователь тоже читается из базы. Если claims
+токена расходятся с актуальными (роль или профиль сменились после выдачи
+токена), токен отклоняется, и клиент получает новый через refresh.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger('users')
+
+USER_CACHE_TIMEOUT = getattr(settings, 'JWT_USER_CACHE_TIMEOUT', 5 * 60)
+USER_CACHE_KEY = 'users:jwt_user:{user_id}'
+
+# Поля пользователя, которые хранятся в кэше (пароль остается отложенным полем)
+USER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'role',
+    'is_active', 'is_staff', 'is_superuser', 'date_joined', 'last_login',
+)
+PROFILE_CLAIMS = ('role', 'kingdom_id', 'king_id', 'citizen_id')
+
+
+def profile_claims(user):
+    """
+    Claims роли пользователя для токена
+
+    Returns:
+        Словарь role, kingdom_id, king_id, citizen_id (идентификаторы - строки или None)
+    """
+    from kingdom.models import King, Citizen
+
+    claims = {'role': user.role, 'kingdom_id': None, 'king_id': None, 'citizen_id': None}
+    if user.is_king:
+        profile = King.objects.filter(user_id=user.pk).values('id', 'kingdom_id').first()
+        claim = 'king_id'
+    elif user.is_citizen:
+        profile = Citizen.objects.filter(user_id=user.pk).values('id', 'kingdom_id').first()
+        claim = 'citizen_id'
+    else:
+        return claims
+    if profile is not None:
+        claims[claim] = str(profile['id'])
+        claims['kingdom_id'] = str(profile['kingdom_id'])
+    return claims
+
+
+def tokens_for_user(user):
+    """Пара JWT токенов с claims роли пользователя"""
+    refresh = RefreshToken.for_user(user)
+    for claim, value in get_user_snapshot(user.pk)['claims'].items():
+        refresh[claim] = value
+    return refresh
+
+
+def _cache_key(user_id):
+    return USER_CACHE_KEY.format(user_id=user_id)
+
+
+def snapshot_cache_enabled():
+    """Общий ли для процессов кэш, в котором можно хранить пользователей"""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def get_user_snapshot(user_id):
+    """
+    Поля пользователя и его claims из кэша (при промахе - из базы)
+
+    Returns:
+        Словарь полей USER_FIELDS с ключом claims или None, если пользователя нет
+    """
+    key = _cache_key(user_id)
+    cached = snapshot_cache_enabled()
+    snapshot = None
+    if cached:
+        try:
+            snapshot = cache.get(key)
+        except Exception as e:
+            logger.warning(f'Кэш пользователей недоступен: {e}')
+            cached = False
+    if snapshot is not None:
+        return snapshot
+
+    User = get_user_model()
+    try:
+        user = User.objects.only(*USER_FIELDS).get(pk=user_id)
+    except (User.DoesNotExist, ValueError):
+        return None
+    snapshot = {field: getattr(user, field) for field in USER_FIELDS}
+    snapshot['claims'] = profile_claims(user)
+    if cached:
+        try:
+            cache.set(key, snapshot, USER_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f'Кэш пользователей недоступен: {e}')
+    return snapshot
+
+
+def _delete_snapshot(key):
+    try:
+        cache.delete(key)
+    except Exception as e:
+        logger.error(f'Не удалось сбросить кэш пользователя {key}: {e}')
+
+
+def invalidate_user(user_id):
+    """
+    Сброс кэша пользователя после изменения его данных, роли или профиля
+
+    Кэш сбрасывается сразу и повторно после фиксации транзакции, чтобы
+    параллельный запрос не закэшировал данные до фиксации. Если кэш
+    недоступен, запись устареет не позже чем через USER_CACHE_TIMEOUT.
+    """
+    key = _cache_key(user_id)
+    _delete_snapshot(key)
+    transaction.on_commit(lambda: _delete_snapshot(key))
+
+
+def build_user(snapshot):
+    """
+    Пользователь из кэша без запроса к базе
+
+    Незагруженные поля (пароль) отложены: они читаются из базы только при
+    обращении, а save() обновляет лишь загруженные поля.
+    """
+    User = get_user_model()
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in snapshot]
+    return User.from_db('default', fields, [snapshot[field] for field in fields])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT-аутентификация с пользователем из кэша вместо запроса к таблице users"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатор пользователя')
+
+        snapshot = get_user_snapshot(user_id)
+        if snapshot is None:
+            raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+        if not snapshot['is_active']:
+            raise AuthenticationFailed('Пользователь неактивен', code='user_inactive')
+
+        # Токены, выданные до смены роли или профиля, отклоняются
+        for claim in PROFILE_CLAIMS:
+            if claim in validated_token and validated_token[claim] != snapshot['claims'][claim]:
+                raise AuthenticationFailed(
+                    'Роль или профиль пользователя изменились, обновите токен',
+                    code='token_outdated'
+                )
+
+        return build_user(snapshot)
+
+
+class ProfileTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдача токенов (api/token/) с claims роли"""
+
+    @classmethod
+    def get_token(cls, user):
+        return tokens_for_user(user)
+
+
+class ProfileTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновление токенов (api/token/refresh/) с актуальными claims роли"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        snapshot = get_user_snapshot(refresh.payload.get(api_settings.USER_ID_CLAIM))
+        if snapshot is None or not snapshot['is_active']:
+            raise AuthenticationFailed('Пользователь не найден или неактивен', code='user_inactive')
+
+        for claim, value in snapshot['claims'].items():
+            refresh[claim] = value
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # Приложение token_blacklist не установлено
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Триграммные индексы для поиска по подстроке (icontains) в action_logs.search.
+# Выражение совпадает с тем, что строит Django для icontains: UPPER(col::text)
+INDEXES = (
+    ('users_first_name_trgm_idx', 'first_name'),
+    ('users_last_name_trgm_idx', 'last_name'),
+    ('users_email_trgm_idx', 'email'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Индексы создаются только в PostgreSQL с доступным расширением pg_trgm"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, column in INDEXES:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON users USING gin (UPPER({column}::text) gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, column in INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_username_alter_user_email'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
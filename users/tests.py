@@ -1,4 +1,7 @@
-from django.test import TestCase, Client
+import os
+import tempfile
+
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase
@@ -9,6 +12,15 @@ from kingdom.models import Kingdom, King, Citizen
 
 User = get_user_model()
 
+# Общий для процессов кэш для тестов с точным количеством запросов:
+# снимки пользователей JWT хранятся только в таком кэше (не LocMemCache)
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'hart_citizens_test_cache'),
+    }
+}
+
 
 class UserModelTest(TestCase):
     """Тесты для модели User"""
@@ -323,4 +335,137 @@ class UserAPITest(APITestCase):
         # Ожидаем 200 или 400 (если blacklist не настроен)
         self.assertIn(response.status_code, [status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST])
         if response.status_code == status.HTTP_200_OK:
-            self.assertIn('message', response.data)
\ No newline at end of file
+            self.assertIn('message', response.data)
+
+@override_settings(CACHES=SHARED_CACHES)
+class CachedJWTAuthenticationTest(APITestCase):
+    """Тесты для JWT-аутентификации с пользователем из кэша"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.kingdom = Kingdom.objects.create(name='Test Kingdom')
+        self.other_kingdom = Kingdom.objects.create(name='Other Kingdom')
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='User',
+            role='citizen'
+        )
+        self.citizen = Citizen.objects.create(
+            user=self.user,
+            kingdom=self.kingdom,
+            age=25,
+            pigeon_email='test@example.com'
+        )
+    
+    def _login(self):
+        response = self.client.post('/api/users/auth/login/', {
+            'username': 'testuser',
+            'password': 'testpass123'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['tokens']
+    
+    def _authorize(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    
+    def test_token_contains_profile_claims(self):
+        """Тест claims роли в токене"""
+        from rest_framework_simplejwt.tokens import AccessToken
+        
+        token = AccessToken(self._login()['access'])
+        
+        self.assertEqual(token['role'], 'citizen')
+        self.assertEqual(token['kingdom_id'], str(self.kingdom.id))
+        self.assertEqual(token['citizen_id'], str(self.citizen.id))
+        self.assertIsNone(token['king_id'])
+    
+    def test_no_users_query_when_cached(self):
+        """Тест аутентификации без запроса к таблице пользователей"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        self._authorize(self._login()['access'])
+        self.client.get('/api/kingdom/kingdoms/')
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/users/profile/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], 'test@example.com')
+        self.assertEqual([q['sql'] for q in ctx.captured_queries if 'FROM "users"' in q['sql']], [])
+    
+    def test_profile_update_keeps_password(self):
+        """Тест сохранения пользователя из кэша без потери пароля"""
+        self._authorize(self._login()['access'])
+        
+        response = self.client.patch('/api/users/profile/update/', {'first_name': 'Updated'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Updated')
+        self.assertTrue(self.user.check_password('testpass123'))
+        self.assertEqual(self.client.get('/api/users/profile/').data['first_name'], 'Updated')
+    
+    def test_profile_change_outdates_token(self):
+        """Тест отклонения токена после смены профиля и его обновления"""
+        tokens = self._login()
+        self._authorize(tokens['access'])
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, status.HTTP_200_OK)
+        
+        self.citizen.kingdom = self.other_kingdom
+        self.citizen.save()
+        
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        self.client.credentials()
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self._authorize(response.data['access'])
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, status.HTTP_200_OK)
+    
+    def test_inactive_user_rejected(self):
+        """Тест отклонения токена деактивированного пользователя"""
+        self._authorize(self._login()['access'])
+        
+        self.user.is_active = False
+        self.user.save()
+        
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_cache_unavailable(self):
+        """Тест аутентификации с чтением пользователя из базы при ошибке кэша"""
+        from unittest.mock import Mock, patch
+        
+        self._authorize(self._login()['access'])
+        
+        error = ConnectionError('Redis недоступен')
+        broken = Mock(**{f'{method}.side_effect': error for method in ('get', 'set', 'delete')})
+        with patch('users.authentication.cache', broken), self.assertLogs('users', 'WARNING'):
+            response = self.client.get('/api/users/profile/')
+            self.user.save()
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_process_local_cache_not_used(self):
+        """Тест чтения пользователя из базы при кэше в памяти процесса"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        self._authorize(self._login()['access'])
+        
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.client.get('/api/users/profile/')
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/api/users/profile/')
+            
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue([q['sql'] for q in ctx.captured_queries if 'FROM "users"' in q['sql']])
+            
+            # Деактивация без сигнала сброса кэша действует сразу
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            self.assertEqual(self.client.get('/api/users/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
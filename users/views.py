@@ -14,7 +14,7 @@ import logging
 
 from .forms import UserRegistrationForm, UserLoginForm, UserProfileForm
 from .models import User
-from action_logs.models import ActionLog
+from action_logs.writer import write_log
 from kingdom.models import Kingdom, Citizen, King
 
 logger = logging.getLogger('users')
@@ -65,7 +65,7 @@ class UserRegistrationView(CreateView):
             )
         
         # Логируем регистрацию
-        ActionLog.objects.create(
+        write_log(
             user=user,
             action='register',
             description=f'Регистрация пользователя {user.get_full_name()}',
@@ -99,7 +99,7 @@ class UserLoginView(LoginView):
         user = self.request.user
         
         # Логируем вход
-        ActionLog.objects.create(
+        write_log(
             user=user,
             action='login',
             description=f'Вход пользователя {user.get_full_name()}',
@@ -142,12 +142,12 @@ class UserProfileView(TemplateView):
         # Добавляем дополнительную информацию в зависимости от роли
         if user.is_king:
             try:
-                context['king_profile'] = user.king_profile
+                context['king_profile'] = self.request.profile.king
             except King.DoesNotExist:
                 pass
         elif user.is_citizen:
             try:
-                context['citizen_profile'] = user.citizen_profile
+                context['citizen_profile'] = self.request.profile.citizen
             except Citizen.DoesNotExist:
                 pass
         
@@ -174,7 +174,7 @@ def user_logout(request):
     user = request.user
     
     # Логируем выход
-    ActionLog.objects.create(
+    write_log(
         user=user,
         action='logout',
         description=f'Выход пользователя {user.get_full_name()}',
@@ -218,7 +218,7 @@ def api_login(request):
                 login(request, user)
                 
                 # Логируем вход
-                ActionLog.objects.create(
+                write_log(
                     user=user,
                     action='login',
                     description=f'API вход пользователя {user.get_full_name()}',